@@ -0,0 +1,219 @@
+"""
+Generador de datos sintéticos de la plataforma de streaming con el mismo esquema
+de 17 tablas y las mismas relaciones (PK/FK) que plugins/helpers/metadata.py.
+
+El tamaño se define por la cantidad de reproducciones (plays); el resto de las
+tablas escalan en proporción. Las tablas grandes se generan por bloques para
+que la memoria pico dependa del tamaño del bloque y no del total.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+FILAS_POR_BLOQUE = 1_000_000
+
+PAISES = ["AR", "BR", "CL", "CO", "ES", "MX", "US", "UY"]
+DISPOSITIVOS = ["tv", "mobile", "tablet", "desktop", "console"]
+CALIDADES = ["SD", "HD", "FHD", "4K"]
+PLANES = [
+    ("basic", 4.99, 1, "SD"),
+    ("standard", 9.99, 2, "HD"),
+    ("premium", 14.99, 4, "4K"),
+]
+
+
+def tamanos(plays):
+    """
+    Cantidad de filas de cada tabla para una escala dada.
+
+    Args:
+        plays (int): Cantidad de reproducciones (tabla más grande)
+
+    Returns:
+        dict[str, int]: Filas por tabla
+    """
+    users = max(plays // 100, 100)
+    content = max(users // 5, 50)
+    series = max(content // 4, 10)
+    seasons = series * 3
+    return {
+        "users": users,
+        "profiles": users * 2,
+        "subscription_plans": len(PLANES),
+        "subscriptions": users,
+        "content": content,
+        "genres": 20,
+        "content_genres": content * 2,
+        "people": content * 3,
+        "content_people": content * 4,
+        "series": series,
+        "seasons": seasons,
+        "episodes": seasons * 10,
+        "plays": plays,
+        "user_lists": users,
+        "user_list_content": users * 5,
+        "ratings": max(plays // 10, 100),
+        "devices": users * 2,
+    }
+
+
+def _fechas(rng, n, inicio, dias):
+    segundos = rng.integers(0, dias * 86400, n)
+    return pd.Timestamp(inicio) + pd.to_timedelta(segundos, unit="s")
+
+
+def _tabla(nombre, n, t, rng, desde=0):
+    """
+    Genera las filas [desde, desde + n) de una tabla. Las FKs apuntan siempre a
+    ids existentes de la tabla referenciada; fechas y textos viajan como texto
+    ISO, igual que en los CSV de la capa bronze.
+    """
+    ids = np.arange(desde, desde + n)
+
+    if nombre == "users":
+        return pd.DataFrame({
+            "user_id": ids,
+            "name": [f"usuario_{i}" for i in ids],
+            "email": [f"usuario_{i}@example.com" for i in ids],
+            "country": rng.choice(PAISES, n),
+            "registration_date": _fechas(rng, n, "2022-01-01", 900).strftime("%Y-%m-%d"),
+            "last_login": _fechas(rng, n, "2025-01-01", 240).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+    if nombre == "profiles":
+        return pd.DataFrame({
+            "profile_id": ids,
+            "user_id": ids % t["users"],
+            "name": rng.choice(["principal", "chicos", "invitado"], n),
+            "is_kids": rng.random(n) < 0.2,
+        })
+    if nombre == "subscription_plans":
+        return pd.DataFrame({
+            "plan_id": ids,
+            "name": [p[0] for p in PLANES],
+            "price_monthly": [p[1] for p in PLANES],
+            "max_simultaneous_screens": [p[2] for p in PLANES],
+            "video_quality": [p[3] for p in PLANES],
+        })
+    if nombre == "subscriptions":
+        inicio = _fechas(rng, n, "2023-01-01", 700)
+        return pd.DataFrame({
+            "subscription_id": ids,
+            "user_id": ids % t["users"],
+            "plan_id": rng.integers(0, t["subscription_plans"], n),
+            "status": rng.choice(["active", "cancelled", "paused"], n, p=[0.7, 0.2, 0.1]),
+            "payment_method": rng.choice(["card", "paypal", "transfer"], n),
+            "start_date": inicio.strftime("%Y-%m-%d"),
+            # Suscripciones activas sin fecha de fin (nulos en el CSV)
+            "end_date": pd.Series((inicio + pd.Timedelta(days=365)).strftime("%Y-%m-%d")).where(rng.random(n) < 0.4),
+        })
+    if nombre == "content":
+        return pd.DataFrame({
+            "content_id": ids,
+            "title": [f"titulo_{i}" for i in ids],
+            "content_type": np.where(ids < t["series"], "series", "movie"),
+            "release_year": rng.integers(1970, 2026, n),
+            "duration_minutes": rng.integers(20, 180, n),
+        })
+    if nombre == "genres":
+        return pd.DataFrame({"genre_id": ids, "name": [f"genero_{i}" for i in ids]})
+    if nombre == "content_genres":
+        return pd.DataFrame({
+            "content_id": ids % t["content"],
+            "genre_id": (ids // t["content"] + ids) % t["genres"],
+        })
+    if nombre == "people":
+        return pd.DataFrame({
+            "person_id": ids,
+            "name": [f"persona_{i}" for i in ids],
+            "birth_date": _fechas(rng, n, "1940-01-01", 20000).strftime("%Y-%m-%d"),
+        })
+    if nombre == "content_people":
+        return pd.DataFrame({
+            "content_id": ids % t["content"],
+            "person_id": ids % t["people"],
+            "role": np.where(ids // t["content"] == 0, "director", "actor"),
+        })
+    if nombre == "series":
+        # Las primeras filas de content son las series
+        return pd.DataFrame({"series_id": ids, "content_id": ids, "total_seasons": 3})
+    if nombre == "seasons":
+        return pd.DataFrame({
+            "season_id": ids,
+            "series_id": ids // 3,
+            "season_number": ids % 3 + 1,
+        })
+    if nombre == "episodes":
+        return pd.DataFrame({
+            "episode_id": ids,
+            "season_id": ids // 10,
+            "episode_number": ids % 10 + 1,
+            "duration_minutes": rng.integers(20, 60, n),
+        })
+    if nombre == "plays":
+        inicio = _fechas(rng, n, "2025-06-01", 90)
+        duracion = pd.to_timedelta(rng.integers(60, 3 * 3600, n), unit="s")
+        user_id = rng.integers(0, t["users"], n)
+        return pd.DataFrame({
+            "play_id": ids,
+            "user_id": user_id,
+            # Cada usuario tiene dos perfiles: user_id y user_id + users
+            "profile_id": user_id + t["users"] * rng.integers(0, 2, n),
+            "content_id": rng.integers(0, t["content"], n),
+            "device_type": rng.choice(DISPOSITIVOS, n),
+            "video_quality": rng.choice(CALIDADES, n),
+            "start_time": inicio.strftime("%Y-%m-%d %H:%M:%S"),
+            "end_time": (inicio + duracion).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+    if nombre == "user_lists":
+        return pd.DataFrame({
+            "list_id": ids,
+            "user_id": ids % t["users"],
+            "name": "Mi lista",
+        })
+    if nombre == "user_list_content":
+        return pd.DataFrame({
+            "list_id": ids % t["user_lists"],
+            "content_id": (ids // t["user_lists"] * 7 + ids) % t["content"],
+            "added_at": _fechas(rng, n, "2024-01-01", 500).strftime("%Y-%m-%d"),
+        })
+    if nombre == "ratings":
+        return pd.DataFrame({
+            "rating_id": ids,
+            "user_id": rng.integers(0, t["users"], n),
+            "content_id": rng.integers(0, t["content"], n),
+            "score": rng.integers(1, 6, n),
+            "rated_at": _fechas(rng, n, "2024-01-01", 600).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+    if nombre == "devices":
+        return pd.DataFrame({
+            "device_id": ids,
+            "user_id": ids % t["users"],
+            "device_type": rng.choice(DISPOSITIVOS, n),
+        })
+    raise ValueError(f"Tabla desconocida: {nombre}")
+
+
+def generar_csv(plays, semilla=0):
+    """
+    Genera la capa bronze completa como archivos CSV en memoria.
+
+    Args:
+        plays (int): Escala (cantidad de reproducciones)
+        semilla (int): Semilla del generador, para resultados reproducibles
+
+    Returns:
+        dict[str, bytes]: {nombre de archivo: contenido CSV}
+    """
+    rng = np.random.default_rng(semilla)
+    t = tamanos(plays)
+    archivos = {}
+
+    for nombre, total in t.items():
+        buffer = io.StringIO()
+        for desde in range(0, total, FILAS_POR_BLOQUE):
+            n = min(FILAS_POR_BLOQUE, total - desde)
+            _tabla(nombre, n, t, rng, desde).to_csv(buffer, index=False, header=desde == 0)
+        archivos[f"{nombre}.csv"] = buffer.getvalue().encode("utf-8")
+
+    return archivos
@@ -0,0 +1,247 @@
+"""
+Benchmark reproducible del pipeline ETL sobre datos sintéticos.
+
+Corre sin conexión: S3 se reemplaza por moto y la base de datos es un
+PostgreSQL local (variables DB_*). Para cada escala genera la capa bronze,
+mide las etapas del pipeline y escribe un JSON comparable entre ejecuciones.
+
+Uso:
+    python benchmarks/ejecutar.py --escala 1000000 --repeticiones 3
+    python benchmarks/ejecutar.py --escala 1000000 --comparar benchmarks/resultados/base.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "plugins"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Los helpers leen su configuración del entorno al importarse
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_S3_BUCKET", "benchmark-etl")
+os.environ.setdefault("AWS_S3_BRONZE_FOLDER", "bronze")
+os.environ.setdefault("AWS_S3_SILVER_FOLDER", "silver")
+os.environ.setdefault("ETL_STAGING_DIR", tempfile.mkdtemp(prefix="etl_benchmark_"))
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import text
+
+try:
+    from moto import mock_aws
+except ImportError:
+    sys.exit("El benchmark necesita moto (pip install 'moto[s3]') para simular S3 sin conexión")
+
+from helpers.metadata import dataframe_metadata
+from helpers.metricas import resumir, tomar_registros
+from helpers.my_utilities import (
+    AWS_S3_BUCKET,
+    AWS_S3_BRONZE_FOLDER,
+    ETL_LECTOR,
+    cargar_datos_desde_memoria,
+    cargar_datos_s3,
+    convertir_dataframes_a_parquet_s3,
+    create_tables_with_constraints,
+    get_db_engine,
+    get_s3_client,
+    limpiar_diccionario,
+)
+from datos_sinteticos import generar_csv, tamanos
+
+DIRECTORIO_RESULTADOS = os.path.join(RAIZ, "benchmarks", "resultados")
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _entorno():
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "pyarrow": pa.__version__,
+    }
+
+
+def _eliminar_tablas(engine):
+    """
+    Deja la base sin las tablas del pipeline, para que cada repetición haga la
+    misma carga completa (las tablas 'merge' existentes harían un upsert).
+    """
+    with engine.begin() as conn:
+        for original_name in dataframe_metadata:
+            conn.execute(text(f'DROP TABLE IF EXISTS {original_name.replace("df_", "")} CASCADE;'))
+
+
+def _medir(resultados, nombre, funcion, filas):
+    inicio = time.perf_counter()
+    valor = funcion()
+    duracion = time.perf_counter() - inicio
+    resultados.setdefault(nombre, {"segundos": [], "filas": filas})["segundos"].append(duracion)
+    print(f"  {nombre}: {duracion:.2f}s")
+    return valor
+
+
+def ejecutar_escala(plays, repeticiones, semilla, con_db, cache_esquemas, optimizar_tipos):
+    """
+    Genera los datos de una escala y mide cada etapa 'repeticiones' veces.
+
+    Returns:
+        dict: Resultado de la escala (tiempos por función y resumen de métricas)
+    """
+    print(f"Generando datos sintéticos ({plays:,} plays)...")
+    archivos = generar_csv(plays, semilla)
+    filas_totales = sum(tamanos(plays).values())
+    resultados = {}
+
+    with mock_aws():
+        s3_client = get_s3_client()
+        s3_client.create_bucket(Bucket=AWS_S3_BUCKET)
+        for nombre_archivo, contenido in archivos.items():
+            s3_client.put_object(Bucket=AWS_S3_BUCKET, Key=f"{AWS_S3_BRONZE_FOLDER}/{nombre_archivo}", Body=contenido)
+
+        engine = get_db_engine() if con_db else None
+        tomar_registros()
+
+        for repeticion in range(1, repeticiones + 1):
+            print(f"Repetición {repeticion}/{repeticiones}")
+
+            _medir(resultados, "cargar_datos_desde_memoria", lambda: {
+                nombre: cargar_datos_desde_memoria(contenido, nombre) for nombre, contenido in archivos.items()
+            }, filas_totales)
+
+            dataframes = _medir(resultados, "cargar_datos_s3", cargar_datos_s3, filas_totales)
+
+            limpios = _medir(
+                resultados, "limpiar_diccionario",
+                lambda: limpiar_diccionario(
+                    dataframes, usar_cache_esquemas=cache_esquemas,
+                    optimizar_tipos_datos=optimizar_tipos, metadata_dict=dataframe_metadata,
+                ),
+                filas_totales,
+            )
+            del dataframes
+
+            _medir(
+                resultados, "convertir_dataframes_a_parquet_s3",
+                lambda: convertir_dataframes_a_parquet_s3(limpios, dataframe_metadata),
+                filas_totales,
+            )
+
+            if engine is not None:
+                _eliminar_tablas(engine)
+                _medir(
+                    resultados, "create_tables_with_constraints",
+                    lambda: create_tables_with_constraints(limpios, dataframe_metadata, engine),
+                    filas_totales,
+                )
+            del limpios
+
+        if engine is not None:
+            engine.dispose()
+
+    for medicion in resultados.values():
+        segundos = medicion["segundos"]
+        medicion["mediana"] = statistics.median(segundos)
+        medicion["minimo"] = min(segundos)
+        medicion["maximo"] = max(segundos)
+        medicion["filas_por_segundo"] = medicion["filas"] / medicion["mediana"] if medicion["mediana"] else None
+
+    return {
+        "plays": plays,
+        "filas_por_tabla": tamanos(plays),
+        "bytes_bronze": sum(len(contenido) for contenido in archivos.values()),
+        "funciones": resultados,
+        # Desglose por etapa y tabla de helpers.metricas (suma de todas las repeticiones)
+        "etapas": resumir(tomar_registros()),
+    }
+
+
+def comparar(actual, base):
+    """
+    Imprime la relación de la mediana actual contra una ejecución base por escala y función.
+    """
+    escalas_base = {escala["plays"]: escala for escala in base["escalas"]}
+    print(f"\nComparación contra {base.get('commit')} ({base.get('fecha')}):")
+    for escala in actual["escalas"]:
+        referencia = escalas_base.get(escala["plays"])
+        if referencia is None:
+            continue
+        for funcion, medicion in escala["funciones"].items():
+            previa = referencia["funciones"].get(funcion)
+            if previa:
+                relacion = medicion["mediana"] / previa["mediana"]
+                print(f"  {escala['plays']:>12,} {funcion:<36} {previa['mediana']:8.2f}s -> "
+                      f"{medicion['mediana']:8.2f}s ({relacion:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline ETL con datos sintéticos")
+    parser.add_argument("--escala", type=int, nargs="+", default=[1_000_000],
+                        help="Cantidad de plays por escala (ej: 1000000 10000000 100000000)")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--sin-db", action="store_true", help="No mide la carga en PostgreSQL")
+    parser.add_argument("--cache-esquemas", action="store_true",
+                        help="Usa el cache de esquemas inferidos (por defecto se infiere en cada repetición)")
+    parser.add_argument("--optimizar-tipos", action="store_true",
+                        help="Reduce los tipos en la transformación (category, Int16/Int32, float32)")
+    parser.add_argument("--salida", help="Archivo JSON de resultados. Por defecto benchmarks/resultados/<fecha>-<commit>.json")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior contra la que comparar")
+    args = parser.parse_args()
+
+    commit = _commit_actual()
+    resultado = {
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "entorno": _entorno(),
+        "parametros": {
+            "repeticiones": args.repeticiones,
+            "semilla": args.semilla,
+            "con_db": not args.sin_db,
+            "cache_esquemas": args.cache_esquemas,
+            "optimizar_tipos": args.optimizar_tipos,
+            "lector": ETL_LECTOR,
+        },
+        "escalas": [
+            ejecutar_escala(
+                plays, args.repeticiones, args.semilla, not args.sin_db, args.cache_esquemas, args.optimizar_tipos
+            )
+            for plays in args.escala
+        ],
+    }
+
+    salida = args.salida or os.path.join(
+        DIRECTORIO_RESULTADOS, f"{time.strftime('%Y%m%dT%H%M%S')}-{commit or 'sin_commit'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, default=str)
+    print(f"\nResultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(resultado, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,236 @@
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
+from functools import wraps
+from airflow.exceptions import AirflowSkipException
 from airflow.operators.python import PythonOperator
+from airflow.utils.task_group import TaskGroup
 from airflow import DAG
 from helpers.my_utilities import (
+    agregar_constraints,
     cargar_datos_s3,
     create_tables_with_constraints,
+    especificacion_lectura,
     get_db_engine,
+    guardar_manifiesto_bronze,
+    leer_manifiesto_bronze,
     limpiar_diccionario,
-    convertir_dataframes_a_parquet_s3
+    convertir_dataframes_a_parquet_s3,
+    ETL_INCREMENTAL,
+    ETL_OPTIMIZAR_TIPOS,
+    ETL_TRANSFORM_PARALELISMO,
 )
+from helpers.checkpoints import guardar_checkpoint, huellas_checkpoint, leer_checkpoint
 from helpers.metadata import dataframe_metadata
+from helpers.metricas import consolidar_reportes, guardar_reporte, medir
+from helpers.staging import cargar_staging, eliminar_staging, guardar_staging
+from helpers.validacion import validar_integridad
+
+# Pools de Airflow que limitan cuántas tablas usan S3 y la base de datos a la vez
+ETL_S3_POOL = os.getenv("ETL_S3_POOL", "default_pool")
+ETL_DB_POOL = os.getenv("ETL_DB_POOL", "default_pool")
+ETL_TASK_RETRIES = int(os.getenv("ETL_TASK_RETRIES", 2))
+
+
+def _con_metricas(funcion):
+    """
+    Mide la tarea completa y, al terminar, guarda el reporte de métricas del
+    proceso en {ETL_METRICS_DIR}/{run_id}/{task_id}.json.
+    """
+    @wraps(funcion)
+    def tarea(*args, **context):
+        try:
+            with medir(f"tarea.{funcion.__name__}", context.get("tabla")):
+                return funcion(*args, **context)
+        finally:
+            guardar_reporte(context["run_id"], context["ti"].task_id)
+    return tarea
+
 
 # Funciones ETL
-def extract(**context):
-    dataframes = cargar_datos_s3()
-    context["ti"].xcom_push(key="raw_data", value=dataframes)
+# Cada tabla de dataframe_metadata tiene sus propias tareas (grupo con el nombre
+# de la tabla), así una tabla lenta o con errores no bloquea al resto y los
+# reintentos solo reprocesan esa tabla.
+# Por XCom solo viaja el manifiesto del staging (rutas, filas y huella de esquema);
+# los DataFrames se escriben una vez como Arrow IPC y se leen con memory-map.
+# Cada etapa registra un checkpoint por tabla con el hash de su salida: si la
+# ejecución se reintenta o se relanza (mismo run_id), las etapas completas cuya
+# entrada no cambió se saltean y solo se rehace el trabajo pendiente.
+def extract(tabla, **context):
+    run_id = context["run_id"]
+    checkpoint = leer_checkpoint(run_id, tabla, "extraccion")
+    if checkpoint is not None:
+        manifiesto = checkpoint["resultado"]["manifiesto"]
+        entradas = checkpoint["resultado"]["bronze"]
+    else:
+        # En modo incremental solo se descargan los objetos nuevos o modificados
+        manifiesto_bronze = leer_manifiesto_bronze() if ETL_INCREMENTAL else None
+        dataframes = cargar_datos_s3(
+            manifiesto=manifiesto_bronze, tablas=[tabla], lectura=especificacion_lectura(dataframe_metadata)
+        )
+        if tabla not in dataframes:
+            # cargar_datos_s3 falla si un archivo de la tabla no se pudo cargar: acá solo
+            # se llega sin archivos listados o con todos sin cambios según el manifiesto
+            if not any(info.get("tabla") == tabla for info in (manifiesto_bronze or {}).values()):
+                raise ValueError(f"No hay archivos bronze para '{tabla}'")
+            raise AirflowSkipException(f"Sin datos nuevos para '{tabla}'")
+
+        manifiesto = guardar_staging(dataframes, run_id, "raw")
+        entradas = None
+        if manifiesto_bronze is not None:
+            # Solo las entradas de esta tabla; commit_manifest las une al final
+            entradas = {key: info for key, info in manifiesto_bronze.items() if info.get("tabla") == tabla}
+        guardar_checkpoint(
+            run_id, tabla, "extraccion", {"manifiesto": manifiesto, "bronze": entradas}, manifiesto=manifiesto
+        )
+
+    context["ti"].xcom_push(key="raw_data", value=manifiesto)
+    if entradas is not None:
+        context["ti"].xcom_push(key="bronze_manifest", value=entradas)
+
+
+def _tablas_padre(tabla):
+    return {
+        fk_info["table"] for fk_info in (dataframe_metadata[tabla].get("foreign_keys") or {}).values()
+        if fk_info["table"] in dataframe_metadata and fk_info["table"] != tabla
+    }
+
 
+def transform(tabla, **context):
+    # Corre aunque las tablas padre no hayan cambiado (trigger_rule none_failed),
+    # por lo que se omite acá si esta tabla no tiene datos nuevos
+    ti = context["ti"]
+    manifiesto = ti.xcom_pull(key="raw_data", task_ids=f"{tabla}.extract")
+    if not manifiesto:
+        raise AirflowSkipException(f"Sin datos nuevos para '{tabla}'")
 
-def transform(**context):
-    dataframes = context["ti"].xcom_pull(key="raw_data", task_ids="extract_task")
-    dataframe_str = limpiar_diccionario(dataframes)
-    context["ti"].xcom_push(key="clean_data", value=dataframe_str)
+    # Staging ya validado de las tablas padre transformadas en esta ejecución; las
+    # que no cambiaron se validan contra la base
+    padres = {}
+    for padre in _tablas_padre(tabla):
+        padres.update(ti.xcom_pull(key="clean_data", task_ids=f"{padre}.transform") or {})
 
+    run_id = context["run_id"]
+    entrada = dict(huellas_checkpoint(run_id, tabla, "extraccion") or {})
+    for padre in padres:
+        # La validación depende de las claves de las tablas padre
+        entrada.update(huellas_checkpoint(run_id, padre, "transformacion") or {})
+    entrada = entrada or None
+    checkpoint = leer_checkpoint(run_id, tabla, "transformacion", entrada)
+    if checkpoint is not None:
+        manifiesto_limpio = checkpoint["resultado"]["manifiesto"]
+        reporte = checkpoint["resultado"].get("validacion")
+    else:
+        dataframe_str = limpiar_diccionario(
+            cargar_staging(manifiesto),
+            paralelismo=ETL_TRANSFORM_PARALELISMO,
+            optimizar_tipos_datos=ETL_OPTIMIZAR_TIPOS,
+            metadata_dict=dataframe_metadata,
+        )
 
-def load_parquet(**context):
-    dataframe_str = context["ti"].xcom_pull(key="clean_data", task_ids="transform_task")
-    convertir_dataframes_a_parquet_s3(dataframe_str)
+        # Las filas que violan PK/FK van a cuarentena antes de escribir el staging
+        # 'clean', del que leen las dos cargas: silver y la base reciben las mismas filas
+        dataframe_str, reporte = validar_integridad(
+            dataframe_str, dataframe_metadata, get_db_engine(), run_id=run_id,
+            padres=cargar_staging(padres, como_arrow=True),
+        )
+        manifiesto_limpio = guardar_staging(dataframe_str, run_id, "clean")
+        guardar_checkpoint(
+            run_id, tabla, "transformacion", {"manifiesto": manifiesto_limpio, "validacion": reporte},
+            entrada, manifiesto_limpio,
+        )
+    ti.xcom_push(key="clean_data", value=manifiesto_limpio)
+    ti.xcom_push(key="validacion", value=reporte)
 
 
-def load_db(**context):
-    dataframe_str = context["ti"].xcom_pull(key="clean_data", task_ids="transform_task")
+# Ambas cargas leen las mismas tablas Arrow del staging (memory-map, sin pasar por
+# pandas), ya validadas en transform, y corren en paralelo.
+def load_parquet(tabla, **context):
+    run_id = context["run_id"]
+    entrada = huellas_checkpoint(run_id, tabla, "transformacion")
+    if leer_checkpoint(run_id, tabla, "silver", entrada) is not None:
+        return True
+
+    manifiesto = context["ti"].xcom_pull(key="clean_data", task_ids=f"{tabla}.transform")
+    resultado = convertir_dataframes_a_parquet_s3(cargar_staging(manifiesto, como_arrow=True), dataframe_metadata)
+    if not resultado:
+        # Se falla la tarea para que Airflow la reintente
+        raise RuntimeError(f"Error al escribir la capa silver de '{tabla}'")
+    guardar_checkpoint(run_id, tabla, "silver", resultado, entrada)
+    return resultado
+
+
+def load_db(tabla, **context):
+    # Corre aunque las tablas padre no hayan cambiado (trigger_rule none_failed),
+    # por lo que se omite acá si esta tabla no tiene datos nuevos
+    manifiesto = context["ti"].xcom_pull(key="clean_data", task_ids=f"{tabla}.transform")
+    if not manifiesto:
+        raise AirflowSkipException(f"Sin datos nuevos para '{tabla}'")
+
+    run_id = context["run_id"]
+    entrada = huellas_checkpoint(run_id, tabla, "transformacion")
+    if leer_checkpoint(run_id, tabla, "constraints", entrada) is not None:
+        return True
+
     engine = get_db_engine()
 
-    # Metadatos de tablas (archivo aparte)
-    create_tables_with_constraints(dataframe_str, dataframe_metadata, engine)
+    if leer_checkpoint(run_id, tabla, "carga", entrada) is not None:
+        # Las filas ya están en la base (el intento anterior falló después de la
+        # carga): solo faltan las constraints
+        agregar_constraints([tabla], dataframe_metadata, engine)
+    else:
+        # Metadatos de tablas (archivo aparte)
+        create_tables_with_constraints(
+            cargar_staging(manifiesto, como_arrow=True), dataframe_metadata, engine,
+            al_cargar=lambda nombre: guardar_checkpoint(run_id, nombre, "carga", entrada=entrada),
+        )
+
+    guardar_checkpoint(run_id, tabla, "constraints", entrada=entrada)
+    return True
+
+
+def verificar_fallos(**context):
+    # commit_manifest corre siempre (all_done) y es la hoja del DAG: sin esta tarea una
+    # tabla fallida dejaría la ejecución en verde
+    raise ValueError("Hubo tareas fallidas en la ejecución, ver las tablas con errores")
+
+
+def limpiar_staging(**context):
+    # Solo corre si ninguna carga ni commit_manifest falló (trigger_rule none_failed):
+    # las ejecuciones fallidas conservan el staging y sus checkpoints para reanudarse
+    eliminar_staging(context["run_id"])
+
+
+def commit_manifest(**context):
+    # Reporte de métricas de toda la ejecución (une los reportes de cada tarea)
+    consolidar_reportes(context["run_id"])
+
+    # Se confirman los objetos bronze de las tablas cuyas dos cargas terminaron bien;
+    # las tablas con errores se vuelven a procesar en la próxima ejecución
+    if not ETL_INCREMENTAL:
+        return
+
+    ti = context["ti"]
+    confirmadas = {}
+    fallidas = []
+
+    for tabla in dataframe_metadata:
+        entradas = ti.xcom_pull(key="bronze_manifest", task_ids=f"{tabla}.extract")
+        if not entradas:
+            continue
+        silver_ok = ti.xcom_pull(task_ids=f"{tabla}.load_parquet")
+        db_ok = ti.xcom_pull(task_ids=f"{tabla}.load_db")
+        if silver_ok and db_ok:
+            confirmadas.update(entradas)
+        else:
+            fallidas.append(tabla)
+
+    if confirmadas:
+        manifiesto_bronze = leer_manifiesto_bronze()
+        manifiesto_bronze.update(confirmadas)
+        guardar_manifiesto_bronze(manifiesto_bronze)
+
+    if fallidas:
+        raise ValueError(f"Tablas con errores en la carga, no se actualiza su manifiesto bronze: {fallidas}")
 
 
 # Definición del DAG
@@ -41,16 +239,79 @@ with DAG(
     start_date=datetime(2025, 8, 1),
     schedule=None,
     catchup=False,
+    default_args={"retries": ETL_TASK_RETRIES, "retry_delay": timedelta(minutes=1)},
     tags=["etl", "postgres", "airflow"],
 ) as dag:
 
-    extract_task = PythonOperator(task_id="extract_task", python_callable=extract)
+    transform_tasks = {}
+    load_tasks_db = {}
+    load_tasks = []
+
+    for tabla in dataframe_metadata:
+        with TaskGroup(group_id=tabla):
+            extract_task = PythonOperator(
+                task_id="extract",
+                python_callable=_con_metricas(extract),
+                op_kwargs={"tabla": tabla},
+                pool=ETL_S3_POOL,
+            )
+
+            transform_task = PythonOperator(
+                task_id="transform",
+                python_callable=_con_metricas(transform),
+                op_kwargs={"tabla": tabla},
+                trigger_rule="none_failed",
+            )
+
+            load_task_parquet = PythonOperator(
+                task_id="load_parquet",
+                python_callable=_con_metricas(load_parquet),
+                op_kwargs={"tabla": tabla},
+                pool=ETL_S3_POOL,
+            )
+
+            load_task_db = PythonOperator(
+                task_id="load_db",
+                python_callable=_con_metricas(load_db),
+                op_kwargs={"tabla": tabla},
+                pool=ETL_DB_POOL,
+                trigger_rule="none_failed",
+            )
+
+            extract_task >> transform_task >> [load_task_parquet, load_task_db]
+
+        transform_tasks[tabla] = transform_task
+        load_tasks_db[tabla] = load_task_db
+        load_tasks += [load_task_parquet, load_task_db]
+
+    # Las FKs de los metadatos se traducen en dependencias entre las transformaciones
+    # (la validación usa las claves de las tablas padre) y entre las cargas a la base
+    for tabla in dataframe_metadata:
+        for padre in _tablas_padre(tabla):
+            transform_tasks[padre] >> transform_tasks[tabla]
+            load_tasks_db[padre] >> load_tasks_db[tabla]
+
+    commit_task = PythonOperator(
+        task_id="commit_manifest_task",
+        python_callable=_con_metricas(commit_manifest),
+        trigger_rule="all_done",
+    )
 
-    transform_task = PythonOperator(task_id="transform_task", python_callable=transform)
+    watcher_task = PythonOperator(
+        task_id="verificar_fallos",
+        python_callable=verificar_fallos,
+        trigger_rule="one_failed",
+    )
 
-    load_task_parquet = PythonOperator(task_id="load_task_parquet", python_callable=load_parquet)
-    
-    load_task_db = PythonOperator(task_id="load_task_db", python_callable=load_db)
+    cleanup_task = PythonOperator(
+        task_id="limpiar_staging",
+        python_callable=limpiar_staging,
+        trigger_rule="none_failed",
+    )
 
     # Dependencias
-    extract_task >> transform_task >> load_task_parquet >> load_task_db
+    load_tasks >> commit_task >> cleanup_task
+    # commit_manifest no revisa las cargas fuera del modo incremental: la limpieza
+    # también depende de ellas para no borrar el staging de una tabla fallida
+    load_tasks >> cleanup_task
+    load_tasks >> watcher_task
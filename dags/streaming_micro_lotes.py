@@ -0,0 +1,31 @@
+import os
+from datetime import datetime, timedelta
+from airflow.operators.python import PythonOperator
+from airflow import DAG
+from helpers.micro_lotes import ejecutar_micro_lotes
+
+# Cada ejecución procesa micro-lotes durante esta ventana y termina; el schedule
+# @continuous lanza la siguiente apenas termina la anterior
+ETL_MICROLOTE_VENTANA = float(os.getenv("ETL_MICROLOTE_VENTANA", 900))
+ETL_TASK_RETRIES = int(os.getenv("ETL_TASK_RETRIES", 2))
+
+
+def micro_lotes(**context):
+    return ejecutar_micro_lotes(duracion_max=ETL_MICROLOTE_VENTANA, run_id=context["run_id"])
+
+
+# Definición del DAG
+with DAG(
+    dag_id="etl_micro_lotes",
+    start_date=datetime(2025, 8, 1),
+    schedule="@continuous",
+    max_active_runs=1,
+    catchup=False,
+    default_args={"retries": ETL_TASK_RETRIES, "retry_delay": timedelta(seconds=30)},
+    tags=["etl", "postgres", "airflow", "micro-lotes"],
+) as dag:
+
+    PythonOperator(
+        task_id="micro_lotes",
+        python_callable=micro_lotes,
+    )
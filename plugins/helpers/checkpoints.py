@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timezone
+
+from .staging import ETL_STAGING_DIR, _normalizar_run_id
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Checkpoints por tabla y etapa ({ETL_STAGING_DIR}/{run_id}/checkpoints/{tabla}.{etapa}.json)
+ETL_CHECKPOINTS = os.getenv("ETL_CHECKPOINTS", "true").lower() == "true"
+
+ETAPAS = ("extraccion", "transformacion", "silver", "carga", "constraints")
+
+
+def _ruta_checkpoint(run_id, tabla, etapa):
+    return os.path.join(
+        ETL_STAGING_DIR, _normalizar_run_id(run_id), "checkpoints", f"{_normalizar_run_id(tabla)}.{etapa}.json"
+    )
+
+
+def _leer(run_id, tabla, etapa):
+    try:
+        with open(_ruta_checkpoint(run_id, tabla, etapa), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def huella_archivo(ruta, tamano_bloque=8 * 1024 * 1024):
+    """
+    Calcula el SHA-256 del contenido de un archivo, leyéndolo por bloques.
+    """
+    digest = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b""):
+            digest.update(bloque)
+    return digest.hexdigest()
+
+
+def huella_manifiesto(manifiesto):
+    """
+    Calcula el hash de contenido de cada archivo de un manifiesto de staging.
+
+    Returns:
+        dict: {tabla: sha256 del archivo Arrow}
+    """
+    return {nombre: huella_archivo(entrada["uri"]) for nombre, entrada in (manifiesto or {}).items()}
+
+
+def guardar_checkpoint(run_id, tabla, etapa, resultado=None, entrada=None, manifiesto=None):
+    """
+    Registra que una etapa de una tabla terminó con éxito (escritura atómica).
+
+    Args:
+        run_id (str): Identificador de la ejecución del DAG
+        tabla (str): Nombre de la tabla
+        etapa (str): Una de ETAPAS
+        resultado (optional): Valor serializable a JSON que la etapa devuelve al reanudarse
+        entrada (optional): Huella de los datos de entrada; si cambia, el checkpoint deja de valer
+        manifiesto (dict, optional): Manifiesto de staging producido por la etapa; se
+            guarda el hash de contenido de cada archivo para verificarlo al reanudar
+
+    Returns:
+        dict | None: El checkpoint guardado, o None si ETL_CHECKPOINTS está desactivado
+    """
+    if not ETL_CHECKPOINTS:
+        return None
+    if etapa not in ETAPAS:
+        raise ValueError(f"Etapa '{etapa}' no soportada. Use {', '.join(ETAPAS)}.")
+
+    checkpoint = {
+        "tabla": tabla,
+        "etapa": etapa,
+        "completado": datetime.now(timezone.utc).isoformat(),
+        "entrada": entrada,
+        "resultado": resultado,
+        "hashes": huella_manifiesto(manifiesto) if manifiesto else None,
+    }
+
+    ruta = _ruta_checkpoint(run_id, tabla, etapa)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2, default=str)
+    os.replace(ruta + ".tmp", ruta)
+    logger.info(f"Checkpoint '{tabla}.{etapa}' guardado en {ruta}")
+    return checkpoint
+
+
+def leer_checkpoint(run_id, tabla, etapa, entrada=None):
+    """
+    Devuelve el checkpoint de una etapa si sigue siendo válido para reanudar:
+    existe, fue hecho con la misma entrada y, si la etapa produjo archivos de
+    staging, estos siguen existiendo con el mismo contenido.
+
+    Args:
+        run_id (str): Identificador de la ejecución del DAG
+        tabla (str): Nombre de la tabla
+        etapa (str): Una de ETAPAS
+        entrada (optional): Huella de la entrada actual (ver guardar_checkpoint)
+
+    Returns:
+        dict | None: El checkpoint, o None si la etapa debe ejecutarse
+    """
+    if not ETL_CHECKPOINTS:
+        return None
+
+    checkpoint = _leer(run_id, tabla, etapa)
+    if checkpoint is None:
+        return None
+
+    if entrada is not None and checkpoint.get("entrada") != entrada:
+        logger.info(f"Checkpoint '{tabla}.{etapa}' descartado: la entrada cambió")
+        return None
+
+    if checkpoint.get("hashes"):
+        manifiesto = (checkpoint.get("resultado") or {}).get("manifiesto") or {}
+        for nombre, hash_esperado in checkpoint["hashes"].items():
+            uri = manifiesto.get(nombre, {}).get("uri")
+            if not uri or not os.path.exists(uri) or huella_archivo(uri) != hash_esperado:
+                logger.warning(f"Checkpoint '{tabla}.{etapa}' descartado: el staging de '{nombre}' cambió o no existe")
+                return None
+
+    logger.info(f"Etapa '{etapa}' de '{tabla}' ya completada ({checkpoint['completado']}), se reanuda desde el checkpoint")
+    return checkpoint
+
+
+def huellas_checkpoint(run_id, tabla, etapa):
+    """
+    Devuelve los hashes de contenido registrados por una etapa, para usarlos como
+    entrada de la siguiente (ej: la transformación depende del staging 'raw').
+
+    Returns:
+        dict | None: {tabla: sha256}, o None si no hay checkpoint
+    """
+    checkpoint = _leer(run_id, tabla, etapa) if ETL_CHECKPOINTS else None
+    return checkpoint.get("hashes") if checkpoint else None
@@ -0,0 +1,199 @@
+import os
+import re
+import shutil
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .staging import ETL_STAGING_DIR
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Directorio de los conjuntos de hashes persistentes ({ETL_DEDUP_DIR}/{tabla}/parte-PPPP-SSSSSS.npy)
+ETL_DEDUP_DIR = os.getenv("ETL_DEDUP_DIR", os.path.join(ETL_STAGING_DIR, "dedup"))
+ETL_DEDUP_PARTICIONES = int(os.getenv("ETL_DEDUP_PARTICIONES", 64))
+# Segmentos por partición a partir de los cuales se compactan en uno solo
+ETL_DEDUP_SEGMENTOS = int(os.getenv("ETL_DEDUP_SEGMENTOS", 8))
+
+PATRON_SEGMENTO = re.compile(r"^parte-(\d{4})-(\d{6})\.npy$")
+
+
+def hash_filas(df, columnas=None):
+    """
+    Calcula un hash de 64 bits por fila sobre todas las columnas o solo sobre
+    las indicadas (ej: las primary_keys de los metadatos).
+
+    Args:
+        df (pd.DataFrame): Filas a hashear
+        columnas (list, optional): Columnas que identifican la fila. Por defecto todas.
+
+    Returns:
+        np.ndarray: Arreglo uint64 con un hash por fila
+    """
+    datos = df if columnas is None else df[list(columnas)]
+    return pd.util.hash_pandas_object(datos, index=False).to_numpy(dtype=np.uint64)
+
+
+def _contiene(ordenado, valores):
+    """
+    Indica qué valores están en un arreglo ordenado (búsqueda binaria vectorizada).
+    """
+    if len(ordenado) == 0:
+        return np.zeros(len(valores), dtype=bool)
+    posiciones = np.searchsorted(ordenado, valores)
+    posiciones[posiciones == len(ordenado)] = 0
+    return np.asarray(ordenado[posiciones]) == valores
+
+
+class ConjuntoHashes:
+    """
+    Conjunto persistente de hashes de filas ya vistas de una tabla, para
+    deduplicar entre partes (chunks) y entre ejecuciones.
+
+    Los hashes se reparten en particiones (hash % particiones). Cada confirmación
+    agrega a cada partición un segmento .npy ordenado (sin reescribir el historial)
+    y, al superar ETL_DEDUP_SEGMENTOS, los segmentos de la partición se compactan
+    en uno. Las consultas usan memory-map y búsqueda binaria, por lo que la memoria
+    depende del lote y no del historial acumulado.
+
+    Los hashes nuevos quedan pendientes hasta confirmar(), que debe llamarse recién
+    cuando el lote se cargó con éxito: si la carga falla, las filas se vuelven a
+    aceptar en el próximo intento (exactly-once). Cada conjunto admite un único
+    escritor a la vez.
+    """
+
+    def __init__(self, nombre, directorio=None, particiones=None):
+        self.nombre = nombre
+        self.directorio = os.path.join(directorio or ETL_DEDUP_DIR, nombre)
+        self.particiones = particiones or ETL_DEDUP_PARTICIONES
+        self.pendientes = {}
+
+    def _segmentos(self):
+        """
+        Devuelve {partición: [secuencias de sus segmentos, en orden]}.
+        """
+        segmentos = {}
+        try:
+            archivos = os.listdir(self.directorio)
+        except FileNotFoundError:
+            return segmentos
+        for archivo in archivos:
+            coincidencia = PATRON_SEGMENTO.match(archivo)
+            if coincidencia:
+                segmentos.setdefault(int(coincidencia.group(1)), []).append(int(coincidencia.group(2)))
+        return {particion: sorted(secuencias) for particion, secuencias in segmentos.items()}
+
+    def _ruta(self, particion, secuencia):
+        return os.path.join(self.directorio, f"parte-{particion:04d}-{secuencia:06d}.npy")
+
+    def _escribir(self, particion, secuencia, valores):
+        ruta = self._ruta(particion, secuencia)
+        with open(ruta + ".tmp", "wb") as f:
+            np.save(f, valores)
+        os.replace(ruta + ".tmp", ruta)
+
+    def filtrar(self, hashes):
+        """
+        Devuelve la máscara de filas nuevas: primera aparición dentro del lote y
+        no vistas en lotes anteriores (confirmados o pendientes).
+
+        Args:
+            hashes (np.ndarray): Hashes uint64 del lote (ver hash_filas)
+
+        Returns:
+            np.ndarray: Máscara booleana, True para las filas a conservar
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        nuevas = ~pd.Series(hashes).duplicated().to_numpy()
+
+        candidatas = np.flatnonzero(nuevas)
+        if len(candidatas) == 0:
+            return nuevas
+
+        # Agrupar las filas por partición para leer cada archivo una sola vez
+        particion_fila = (hashes[candidatas] % self.particiones).astype(np.int64)
+        orden = np.argsort(particion_fila, kind="stable")
+        candidatas, particion_fila = candidatas[orden], particion_fila[orden]
+        limites = np.flatnonzero(np.diff(particion_fila)) + 1
+        grupos = zip(particion_fila[np.r_[0, limites]].tolist(), np.split(candidatas, limites))
+        segmentos = self._segmentos()
+
+        for particion, indices in grupos:
+            valores = hashes[indices]
+            vistas = np.zeros(len(valores), dtype=bool)
+            for secuencia in segmentos.get(particion, []):
+                vistas |= _contiene(np.load(self._ruta(particion, secuencia), mmap_mode="r"), valores)
+            if particion in self.pendientes:
+                vistas |= _contiene(self.pendientes[particion], valores)
+
+            nuevas[indices[vistas]] = False
+            aceptadas = valores[~vistas]
+            if len(aceptadas):
+                self.pendientes[particion] = np.union1d(self.pendientes.get(particion, aceptadas[:0]), aceptadas)
+
+        descartadas = len(hashes) - int(nuevas.sum())
+        if descartadas:
+            logger.info(f"Dedup '{self.nombre}': {descartadas} de {len(hashes)} filas ya vistas, se omiten")
+        return nuevas
+
+    def confirmar(self):
+        """
+        Persiste los hashes pendientes como un segmento nuevo por partición
+        (escritura atómica) y compacta las particiones con demasiados segmentos.
+        """
+        if not self.pendientes:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        segmentos = self._segmentos()
+
+        for particion, pendientes in self.pendientes.items():
+            previas = segmentos.get(particion, [])
+            secuencia = previas[-1] + 1 if previas else 0
+            self._escribir(particion, secuencia, pendientes)
+
+            if len(previas) + 1 > ETL_DEDUP_SEGMENTOS:
+                # El segmento compactado se escribe antes de borrar los anteriores:
+                # un lector concurrente puede ver hashes repetidos, nunca faltantes
+                todas = [np.load(self._ruta(particion, previa)) for previa in previas] + [pendientes]
+                self._escribir(particion, secuencia + 1, np.unique(np.concatenate(todas)))
+                for anterior in previas + [secuencia]:
+                    os.remove(self._ruta(particion, anterior))
+
+        total = sum(len(pendientes) for pendientes in self.pendientes.values())
+        self.pendientes = {}
+        logger.info(f"Dedup '{self.nombre}': {total} hashes nuevos confirmados en {self.directorio}")
+
+    def retirar(self, hashes):
+        """
+        Quita de los pendientes los hashes de filas que filtrar() aceptó pero que
+        no se cargaron (ej: las que la validación mandó a cuarentena), para que
+        vuelvan a aceptarse cuando lleguen de nuevo.
+
+        Args:
+            hashes (np.ndarray): Hashes uint64 de las filas no cargadas
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        for particion in np.unique(hashes % self.particiones).tolist():
+            if particion not in self.pendientes:
+                continue
+            restantes = np.setdiff1d(self.pendientes[particion], hashes, assume_unique=True)
+            if len(restantes):
+                self.pendientes[particion] = restantes
+            else:
+                del self.pendientes[particion]
+
+    def descartar(self):
+        """
+        Olvida los hashes pendientes (ej: si la carga del lote falló).
+        """
+        self.pendientes = {}
+
+    def eliminar(self):
+        """
+        Borra el conjunto completo del disco.
+        """
+        self.pendientes = {}
+        shutil.rmtree(self.directorio, ignore_errors=True)
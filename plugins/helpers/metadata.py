@@ -77,7 +77,8 @@ dataframe_metadata = {
                 "content_id": {"table": "content", "column": "content_id"},
                 "profile_id": {"table": "profiles", "column": "profile_id"},
             },
-            "if_exists": "replace",
+            "if_exists": "merge",
+            "partition_by": {"column": "start_time", "freq": "D"},
         },
         "user_lists": {
             "primary_keys": ["list_id"],
@@ -98,7 +99,7 @@ dataframe_metadata = {
                 "user_id": {"table": "users", "column": "user_id"},
                 "content_id": {"table": "content", "column": "content_id"},
             },
-            "if_exists": "replace",
+            "if_exists": "merge",
         },
         "devices": {
             "primary_keys": ["device_id"],
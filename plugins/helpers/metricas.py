@@ -0,0 +1,369 @@
+import os
+import re
+import sys
+import json
+import glob
+import time
+import socket
+import logging
+import threading
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from .staging import ETL_STAGING_DIR, _normalizar_run_id
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Destino de los reportes por ejecución ({ETL_METRICS_DIR}/{run_id}/*.json|*.prom)
+ETL_METRICS_DIR = os.getenv("ETL_METRICS_DIR", os.path.join(ETL_STAGING_DIR, "metricas"))
+# StatsD (UDP) solo se usa si STATSD_HOST está definido
+STATSD_HOST = os.getenv("STATSD_HOST")
+STATSD_PORT = int(os.getenv("STATSD_PORT", 8125))
+STATSD_PREFIX = os.getenv("STATSD_PREFIX", "etl")
+# Profiler opcional por etapa: "cprofile" o "pyinstrument"
+ETL_PROFILE = (os.getenv("ETL_PROFILE") or "").lower() or None
+
+# Campos numéricos de cada registro que se suman al resumir por etapa y tabla
+CAMPOS_SUMABLES = ("segundos", "cpu_segundos", "filas", "bytes_entrada", "bytes_salida")
+
+_registros = []
+_lock = threading.Lock()
+_local = threading.local()
+_socket_statsd = None
+# Un solo perfil a la vez por proceso: cProfile (sys.monitoring desde Python 3.12)
+# no admite dos profilers activos aunque estén en hilos distintos
+_lock_perfil = threading.Lock()
+_perfil_en_curso = None
+
+
+def _reiniciar_en_hijo():
+    """
+    Tras un fork (ej: workers de un ProcessPoolExecutor) el hijo hereda los registros
+    del padre, que el padre ya reporta, y los locks en el estado en que estaban: se
+    descartan y se recrean para que el hijo solo devuelva sus propias mediciones.
+    """
+    global _lock, _local, _socket_statsd, _lock_perfil, _perfil_en_curso
+    _registros.clear()
+    _lock = threading.Lock()
+    _local = threading.local()
+    _socket_statsd = None
+    if isinstance(_perfil_en_curso, cProfile.Profile):
+        # Perfil del padre que quedó activo en el hilo que hizo el fork
+        _perfil_en_curso.disable()
+    _perfil_en_curso = None
+    _lock_perfil = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):  # No existe en Windows
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+
+
+def _rss_pico_mb():
+    """
+    Devuelve el pico de memoria residente del proceso en MB (None si no está disponible).
+    """
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB y macOS bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(pico / divisor, 1)
+
+
+def _iniciar_perfil():
+    """
+    Inicia el profiler configurado en ETL_PROFILE. Solo se perfila la medición
+    más externa de un único hilo por proceso, porque los profilers no admiten
+    anidarse ni correr en paralelo: las mediciones de los demás hilos no se perfilan.
+    """
+    global _perfil_en_curso
+    if not ETL_PROFILE or getattr(_local, "profundidad", 0) > 1:
+        return None
+    if not _lock_perfil.acquire(blocking=False):
+        return None
+
+    try:
+        if ETL_PROFILE == "cprofile":
+            perfil = cProfile.Profile()
+            perfil.enable()
+        elif ETL_PROFILE == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("ETL_PROFILE=pyinstrument pero pyinstrument no está instalado, se omite el perfilado")
+                perfil = None
+            else:
+                perfil = Profiler()
+                perfil.start()
+        else:
+            logger.warning(f"ETL_PROFILE '{ETL_PROFILE}' no soportado. Use 'cprofile' o 'pyinstrument'.")
+            perfil = None
+    except BaseException:
+        _lock_perfil.release()
+        raise
+
+    if perfil is None:
+        _lock_perfil.release()
+    _perfil_en_curso = perfil
+    return perfil
+
+
+def _detener_perfil(perfil, etapa, tabla):
+    """
+    Detiene el profiler, libera el perfilado del proceso y guarda su salida en
+    {ETL_METRICS_DIR}/perfiles/.
+    """
+    global _perfil_en_curso
+    try:
+        if isinstance(perfil, cProfile.Profile):
+            perfil.disable()
+        else:
+            perfil.stop()
+    finally:
+        _perfil_en_curso = None
+        _lock_perfil.release()
+
+    directorio = os.path.join(ETL_METRICS_DIR, "perfiles")
+    os.makedirs(directorio, exist_ok=True)
+    base = os.path.join(
+        directorio,
+        _normalizar_run_id(f"{etapa}-{tabla or 'todas'}-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}"),
+    )
+
+    if isinstance(perfil, cProfile.Profile):
+        perfil.dump_stats(base + ".prof")
+        logger.info(f"Perfil de '{etapa}' guardado en {base}.prof")
+    else:
+        with open(base + ".html", "w", encoding="utf-8") as f:
+            f.write(perfil.output_html())
+        logger.info(f"Perfil de '{etapa}' guardado en {base}.html")
+
+
+def _nombre_statsd(*partes):
+    return ".".join(re.sub(r"[^A-Za-z0-9_.]", "_", str(parte)) for parte in partes if parte)
+
+
+def _emitir_statsd(registro):
+    """
+    Envía el registro como métricas StatsD en un único datagrama UDP. Los errores
+    de red se ignoran: las métricas nunca deben hacer fallar el pipeline.
+    """
+    global _socket_statsd
+    if not STATSD_HOST:
+        return
+
+    base = _nombre_statsd(STATSD_PREFIX, registro["etapa"], registro.get("tabla"))
+    lineas = [
+        f"{base}.duracion:{registro['segundos'] * 1000:.1f}|ms",
+        f"{base}.cpu:{registro['cpu_segundos'] * 1000:.1f}|ms",
+    ]
+    for campo in ("filas", "bytes_entrada", "bytes_salida"):
+        if registro.get(campo) is not None:
+            lineas.append(f"{base}.{campo}:{int(registro[campo])}|c")
+    if registro.get("rss_pico_mb") is not None:
+        lineas.append(f"{base}.rss_pico_mb:{registro['rss_pico_mb']}|g")
+
+    try:
+        if _socket_statsd is None:
+            _socket_statsd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _socket_statsd.sendto("\n".join(lineas).encode("utf-8"), (STATSD_HOST, STATSD_PORT))
+    except OSError as e:
+        logger.debug(f"No se pudieron enviar métricas a StatsD: {e}")
+
+
+@contextmanager
+def medir(etapa, tabla=None, **valores):
+    """
+    Mide una etapa del pipeline: tiempo real, tiempo de CPU del proceso y pico de
+    memoria residente. El registro se entrega al bloque para que complete filas y
+    bytes a medida que los conoce:
+
+        with medir("transformacion", nombre, filas_entrada=len(df)) as m:
+            ...
+            m["filas"] = len(df)
+
+    Con ETL_PROFILE definido, además perfila el bloque (ver _iniciar_perfil). Un
+    error del profiler se registra como advertencia y no interrumpe la etapa.
+
+    Args:
+        etapa (str): Nombre de la etapa (ej: 'extraccion.descarga', 'db.carga')
+        tabla (str, optional): Tabla a la que corresponde la medición
+        **valores: Campos iniciales del registro (ej: filas, bytes_entrada)
+
+    Yields:
+        dict: Registro de la medición
+    """
+    registro = {
+        "etapa": etapa,
+        "tabla": tabla,
+        "inicio": datetime.now(timezone.utc).isoformat(),
+        **valores,
+    }
+
+    perfil = None
+    inicio = time.perf_counter()
+    inicio_cpu = time.process_time()
+
+    _local.profundidad = getattr(_local, "profundidad", 0) + 1
+    try:
+        try:
+            perfil = _iniciar_perfil()
+        except Exception as e:
+            logger.warning(f"No se pudo iniciar el perfil de '{etapa}': {e}")
+        yield registro
+    except Exception as e:
+        registro["error"] = type(e).__name__
+        raise
+    finally:
+        # process_time incluye a los demás hilos del proceso que corren en paralelo
+        registro["segundos"] = time.perf_counter() - inicio
+        registro["cpu_segundos"] = time.process_time() - inicio_cpu
+        registro["rss_pico_mb"] = _rss_pico_mb()
+        _local.profundidad -= 1
+
+        if perfil is not None:
+            try:
+                _detener_perfil(perfil, etapa, tabla)
+            except Exception as e:
+                logger.warning(f"No se pudo guardar el perfil de '{etapa}': {e}")
+
+        with _lock:
+            _registros.append(registro)
+        _emitir_statsd(registro)
+
+
+def registrar(registros):
+    """
+    Agrega registros medidos en otro proceso (ej: workers de un ProcessPoolExecutor).
+    """
+    with _lock:
+        _registros.extend(registros)
+
+
+def tomar_registros():
+    """
+    Devuelve los registros acumulados en este proceso y los descarta.
+
+    Returns:
+        list[dict]: Registros en orden de finalización
+    """
+    with _lock:
+        registros = list(_registros)
+        _registros.clear()
+    return registros
+
+
+def resumir(registros):
+    """
+    Agrupa los registros por (etapa, tabla): suma tiempos, filas y bytes y conserva
+    el mayor pico de memoria.
+
+    Returns:
+        list[dict]: Un resumen por etapa y tabla, con la cantidad de mediciones
+    """
+    resumen = {}
+    for registro in registros:
+        clave = (registro["etapa"], registro.get("tabla"))
+        total = resumen.setdefault(clave, {"etapa": clave[0], "tabla": clave[1], "mediciones": 0, "errores": 0})
+        total["mediciones"] += 1
+        total["errores"] += 1 if registro.get("error") else 0
+        for campo in CAMPOS_SUMABLES:
+            if registro.get(campo) is not None:
+                total[campo] = total.get(campo, 0) + registro[campo]
+        if registro.get("rss_pico_mb") is not None:
+            total["rss_pico_mb"] = max(total.get("rss_pico_mb", 0), registro["rss_pico_mb"])
+    return list(resumen.values())
+
+
+def _a_openmetrics(resumen):
+    """
+    Serializa el resumen en formato de texto OpenMetrics (apto para el textfile
+    collector de node_exporter o un Pushgateway).
+    """
+    familias = {campo: [] for campo in (*CAMPOS_SUMABLES, "rss_pico_mb")}
+    for total in resumen:
+        etiquetas = f'etapa="{total["etapa"]}",tabla="{total["tabla"] or ""}"'
+        for campo, lineas in familias.items():
+            if total.get(campo) is not None:
+                lineas.append(f"{STATSD_PREFIX}_{campo}{{{etiquetas}}} {total[campo]}")
+
+    salida = []
+    for campo, lineas in familias.items():
+        if lineas:
+            salida.append(f"# TYPE {STATSD_PREFIX}_{campo} gauge")
+            salida.extend(lineas)
+    salida.append("# EOF")
+    return "\n".join(salida) + "\n"
+
+
+def _escribir_reporte(directorio, nombre, run_id, registros):
+    resumen = resumir(registros)
+    reporte = {
+        "run_id": run_id,
+        "generado": datetime.now(timezone.utc).isoformat(),
+        "resumen": resumen,
+        "registros": registros,
+    }
+
+    ruta = os.path.join(directorio, f"{nombre}.json")
+    for destino, contenido in ((ruta, json.dumps(reporte, indent=2, default=str)),
+                               (os.path.join(directorio, f"{nombre}.prom"), _a_openmetrics(resumen))):
+        with open(destino + ".tmp", "w", encoding="utf-8") as f:
+            f.write(contenido)
+        os.replace(destino + ".tmp", destino)
+    return ruta
+
+
+def guardar_reporte(run_id, nombre="reporte"):
+    """
+    Escribe los registros acumulados en este proceso como reporte JSON y archivo
+    OpenMetrics en {ETL_METRICS_DIR}/{run_id}/{nombre}.json|.prom y los descarta,
+    para que un proceso que ejecuta varias tareas no los repita.
+
+    Args:
+        run_id (str): Identificador de la ejecución del DAG
+        nombre (str): Nombre del reporte (ej: el task_id)
+
+    Returns:
+        str | None: Ruta del reporte JSON, o None si no había registros
+    """
+    registros = tomar_registros()
+    if not registros:
+        return None
+
+    directorio = os.path.join(ETL_METRICS_DIR, _normalizar_run_id(run_id))
+    os.makedirs(directorio, exist_ok=True)
+    ruta = _escribir_reporte(directorio, _normalizar_run_id(nombre), run_id, registros)
+    logger.info(f"Reporte de métricas guardado en {ruta} ({len(registros)} registros)")
+    return ruta
+
+
+def consolidar_reportes(run_id, nombre="reporte"):
+    """
+    Une los reportes de todas las tareas de una ejecución en un único reporte.
+
+    Returns:
+        str | None: Ruta del reporte consolidado, o None si no hay reportes
+    """
+    directorio = os.path.join(ETL_METRICS_DIR, _normalizar_run_id(run_id))
+    registros = []
+    for ruta in sorted(glob.glob(os.path.join(directorio, "*.json"))):
+        if os.path.basename(ruta) == f"{nombre}.json":
+            continue
+        with open(ruta, encoding="utf-8") as f:
+            registros.extend(json.load(f)["registros"])
+
+    if not registros:
+        return None
+
+    ruta = _escribir_reporte(directorio, nombre, run_id, registros)
+    logger.info(f"Reporte consolidado de la ejecución guardado en {ruta}")
+    return ruta
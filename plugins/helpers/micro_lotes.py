@@ -0,0 +1,495 @@
+"""
+Modo continuo por micro-lotes para las tablas de eventos (ej: plays y ratings).
+
+Un hilo sondea la fuente (un prefijo de S3 o un directorio local que hace de
+cola) y deja cada archivo nuevo, ya parseado, en una cola acotada. El hilo
+principal arma un micro-lote con lo que haya en la cola y lo procesa con las
+mismas funciones que el DAG batch: dedup persistente (ConjuntoHashes),
+limpiar_diccionario, validar_integridad contra las FKs de los metadatos y
+cargar_silver_y_db en modo "append" (las tablas 'merge' hacen upsert por PK).
+Si la carga va más lenta que la llegada de archivos, la cola se llena y el
+sondeo se detiene hasta que haya lugar (backpressure).
+
+Uso (desde plugins/):
+    python -m helpers.micro_lotes --tablas plays ratings
+    python -m helpers.micro_lotes --cola /datos/cola --duracion 600
+"""
+import os
+import json
+import hashlib
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+
+import pandas as pd
+
+from .dedup import ConjuntoHashes, hash_filas
+from .metadata import dataframe_metadata
+from .metricas import guardar_reporte, medir
+from .my_utilities import (
+    AWS_S3_BUCKET,
+    AWS_S3_BRONZE_FOLDER,
+    AWS_S3_SILVER_FOLDER,
+    ETL_OPTIMIZAR_TIPOS,
+    cargar_datos_desde_memoria,
+    cargar_silver_y_db,
+    especificacion_lectura,
+    get_db_engine,
+    get_s3_client,
+    limpiar_diccionario,
+)
+from .validacion import validar_integridad
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tablas de eventos que se procesan en modo continuo (deben ser 'merge' o 'append')
+ETL_MICROLOTE_TABLAS = os.getenv("ETL_MICROLOTE_TABLAS", "plays,ratings")
+# Directorio local que reemplaza a S3 como fuente ({cola}/{tabla}/*.csv|json|parquet)
+ETL_MICROLOTE_COLA_DIR = os.getenv("ETL_MICROLOTE_COLA_DIR") or None
+# Segundos entre sondeos cuando no hay archivos nuevos
+ETL_MICROLOTE_INTERVALO = float(os.getenv("ETL_MICROLOTE_INTERVALO", 2))
+# Archivos leídos que pueden esperar en memoria a ser cargados (backpressure)
+ETL_MICROLOTE_COLA_MAX = int(os.getenv("ETL_MICROLOTE_COLA_MAX", 16))
+# Filas a partir de las cuales un micro-lote deja de tomar archivos de la cola
+ETL_MICROLOTE_MAX_FILAS = int(os.getenv("ETL_MICROLOTE_MAX_FILAS", 200_000))
+ETL_MICROLOTE_REINTENTOS = int(os.getenv("ETL_MICROLOTE_REINTENTOS", 3))
+# Segundos que se reutilizan las claves de las tablas padre leídas de la base
+ETL_MICROLOTE_CLAVES_TTL = float(os.getenv("ETL_MICROLOTE_CLAVES_TTL", 60))
+# Segundos entre reportes de métricas
+ETL_MICROLOTE_REPORTE = float(os.getenv("ETL_MICROLOTE_REPORTE", 60))
+# Último objeto confirmado de cada tabla en S3
+ETL_MICROLOTE_ESTADO_KEY = os.getenv(
+    "ETL_MICROLOTE_ESTADO_KEY",
+    os.path.join(AWS_S3_SILVER_FOLDER, "_micro_lotes.json").replace('\\', '/'),
+)
+
+EXTENSIONES = (".csv", ".json", ".parquet")
+
+
+class FuenteS3:
+    """
+    Archivos nuevos de {AWS_S3_BRONZE_FOLDER}/{tabla}/. Los productores deben escribir
+    keys crecientes (ej: con la fecha y hora como prefijo): cada sondeo lista desde el
+    último key visto (StartAfter) y el estado persistido en ETL_MICROLOTE_ESTADO_KEY
+    guarda el último key confirmado de cada tabla, desde donde se retoma al reiniciar.
+
+    Los objetos que no se pudieron leer o parsear no frenan el avance del cursor, pero
+    quedan registrados en el estado ("errores") y se vuelven a intentar en el primer
+    sondeo de la próxima ejecución, hasta que se carguen.
+    """
+
+    def __init__(self, tablas, s3_client=None):
+        self.tablas = list(tablas)
+        self.s3_client = s3_client or get_s3_client()
+        self.confirmados, self.errores = self._leer_estado()
+        # Solo lo usa el hilo de sondeo: avanza al encolar, antes de confirmar
+        self.listados = dict(self.confirmados)
+        self.reintentos = {tabla: dict(self.errores.get(tabla, {})) for tabla in self.tablas}
+
+    def _leer_estado(self):
+        """
+        Returns:
+            tuple: ({tabla: último key confirmado}, {tabla: {key con error: creado}})
+        """
+        try:
+            response_obj = self.s3_client.get_object(Bucket=AWS_S3_BUCKET, Key=ETL_MICROLOTE_ESTADO_KEY)
+        except self.s3_client.exceptions.NoSuchKey:
+            return {}, {}
+        estado = json.loads(response_obj['Body'].read())
+        if "confirmados" not in estado:
+            # Formato anterior: solo {tabla: último key confirmado}
+            return estado, {}
+        return estado["confirmados"], estado.get("errores", {})
+
+    def sondear(self):
+        """
+        Returns:
+            list[dict]: Archivos nuevos, en orden de key ({"tabla", "id", "nombre", "creado"})
+        """
+        nuevos = []
+        for tabla, errores in self.reintentos.items():
+            for key, creado in sorted(errores.items()):
+                nuevos.append({"tabla": tabla, "id": key, "nombre": os.path.basename(key), "creado": creado})
+            errores.clear()
+
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for tabla in self.tablas:
+            prefijo = os.path.join(AWS_S3_BRONZE_FOLDER, tabla, "").replace('\\', '/')
+            desde = {"StartAfter": self.listados[tabla]} if self.listados.get(tabla) else {}
+            for pagina in paginator.paginate(Bucket=AWS_S3_BUCKET, Prefix=prefijo, **desde):
+                for obj in pagina.get('Contents', []):
+                    nombre = os.path.basename(obj['Key'])
+                    self.listados[tabla] = obj['Key']
+                    if os.path.splitext(nombre)[1].lower() in EXTENSIONES:
+                        nuevos.append({
+                            "tabla": tabla,
+                            "id": obj['Key'],
+                            "nombre": nombre,
+                            "creado": obj['LastModified'].timestamp(),
+                        })
+        return nuevos
+
+    def leer(self, archivo):
+        return self.s3_client.get_object(Bucket=AWS_S3_BUCKET, Key=archivo["id"])['Body'].read()
+
+    def confirmar(self, archivos):
+        """
+        Registra como procesados los archivos de un micro-lote ya cargado. Los que no
+        se pudieron leer (df None) se guardan como errores para reintentarlos.
+        """
+        for archivo in archivos:
+            tabla = archivo["tabla"]
+            self.confirmados[tabla] = max(archivo["id"], self.confirmados.get(tabla, ""))
+            errores = self.errores.setdefault(tabla, {})
+            if archivo.get("df") is None:
+                errores[archivo["id"]] = archivo["creado"]
+                logger.error(f"'{archivo['id']}' queda registrado con error, se reintenta en la próxima ejecución")
+            else:
+                errores.pop(archivo["id"], None)
+        self.errores = {tabla: errores for tabla, errores in self.errores.items() if errores}
+
+        estado = {"confirmados": self.confirmados, "errores": self.errores}
+        self.s3_client.put_object(
+            Bucket=AWS_S3_BUCKET,
+            Key=ETL_MICROLOTE_ESTADO_KEY,
+            Body=json.dumps(estado, indent=2).encode("utf-8"),
+            ContentType='application/json'
+        )
+
+
+class FuenteDirectorio:
+    """
+    Cola local de archivos en {directorio}/{tabla}/. Los productores deben escribir
+    cada archivo con otro nombre (ej: .tmp) y renombrarlo al terminar. Los archivos
+    confirmados se mueven a {directorio}/{tabla}/procesados/ y los que no se pudieron
+    leer, a {directorio}/{tabla}/errores/.
+    """
+
+    def __init__(self, directorio, tablas):
+        self.directorio = directorio
+        self.tablas = list(tablas)
+        self.en_vuelo = set()
+        self._lock = threading.Lock()
+
+    def sondear(self):
+        nuevos = []
+        for tabla in self.tablas:
+            try:
+                entradas = sorted(os.scandir(os.path.join(self.directorio, tabla)), key=lambda e: e.name)
+            except FileNotFoundError:
+                continue
+            for entrada in entradas:
+                if not entrada.is_file() or os.path.splitext(entrada.name)[1].lower() not in EXTENSIONES:
+                    continue
+                with self._lock:
+                    if entrada.path in self.en_vuelo:
+                        continue
+                    self.en_vuelo.add(entrada.path)
+                nuevos.append({
+                    "tabla": tabla,
+                    "id": entrada.path,
+                    "nombre": entrada.name,
+                    "creado": entrada.stat().st_mtime,
+                })
+        return nuevos
+
+    def leer(self, archivo):
+        with open(archivo["id"], "rb") as f:
+            return f.read()
+
+    def confirmar(self, archivos):
+        for archivo in archivos:
+            destino = os.path.join(
+                self.directorio, archivo["tabla"], "errores" if archivo.get("df") is None else "procesados"
+            )
+            os.makedirs(destino, exist_ok=True)
+            os.replace(archivo["id"], os.path.join(destino, archivo["nombre"]))
+            with self._lock:
+                self.en_vuelo.discard(archivo["id"])
+
+
+def _columnas_requeridas(tabla, metadata_dict):
+    """
+    PK y FKs de una tabla: un archivo sin ellas no se puede validar ni cargar.
+    """
+    table_metadata = metadata_dict.get(tabla, {})
+    return set(table_metadata.get("primary_keys") or []) | set(table_metadata.get("foreign_keys") or {})
+
+
+def _sondear(fuente, lectura, metadata_dict, cola, detener):
+    """
+    Hilo productor: lista los archivos nuevos, los descarga y parsea, y los encola.
+    El put bloquea mientras la cola está llena, por lo que no se lee más de lo que
+    la carga puede absorber.
+    """
+    while not detener.is_set():
+        try:
+            nuevos = fuente.sondear()
+        except Exception as e:
+            logger.error(f"Error al sondear la fuente de micro-lotes: {e}")
+            nuevos = []
+
+        for archivo in nuevos:
+            especificacion = lectura.get(archivo["tabla"]) or {}
+            archivo["df"] = None
+            for intento in range(1, ETL_MICROLOTE_REINTENTOS + 1):
+                try:
+                    with medir("micro_lote.lectura", archivo["tabla"]) as m:
+                        contenido = fuente.leer(archivo)
+                        m["bytes_entrada"] = len(contenido)
+                    break
+                except Exception as e:
+                    # Tras los reintentos el archivo sigue con df None: se informa y no
+                    # frena a los siguientes (ver _procesar_lote)
+                    logger.warning(f"Error al leer '{archivo['id']}' (intento {intento}): {e}")
+                    contenido = None
+                    detener.wait(intento)
+            if contenido is not None:
+                with medir("micro_lote.parseo", archivo["tabla"], bytes_entrada=len(contenido)) as m:
+                    archivo["df"] = cargar_datos_desde_memoria(
+                        contenido, archivo["nombre"],
+                        columnas=especificacion.get("columns"), filtros=especificacion.get("filters"),
+                        tipos=especificacion.get("dtype"),
+                    )
+                    m["filas"] = 0 if archivo["df"] is None else len(archivo["df"])
+
+            faltantes = (
+                _columnas_requeridas(archivo["tabla"], metadata_dict) - set(archivo["df"].columns)
+                if archivo["df"] is not None else set()
+            )
+            if faltantes:
+                # Un archivo mal formado no debe frenar la carga de los demás
+                logger.error(f"'{archivo['id']}' no tiene las columnas {sorted(faltantes)}")
+                archivo["df"] = None
+
+            while not detener.is_set():
+                try:
+                    cola.put(archivo, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+            if detener.is_set():
+                return
+
+        if not nuevos:
+            detener.wait(ETL_MICROLOTE_INTERVALO)
+
+
+def _armar_lote(cola, espera):
+    """
+    Espera el primer archivo y suma los que ya estén en la cola, hasta
+    ETL_MICROLOTE_MAX_FILAS: con poca carga los lotes son chicos (menor latencia)
+    y con atraso crecen solos (mayor throughput).
+    """
+    try:
+        lote = [cola.get(timeout=espera)]
+    except queue.Empty:
+        return []
+
+    filas = len(lote[0]["df"]) if lote[0]["df"] is not None else 0
+    while filas < ETL_MICROLOTE_MAX_FILAS:
+        try:
+            archivo = cola.get_nowait()
+        except queue.Empty:
+            break
+        lote.append(archivo)
+        filas += len(archivo["df"]) if archivo["df"] is not None else 0
+    return lote
+
+
+def _token_lote(lote):
+    """
+    Identificador determinístico de un micro-lote, a partir de los archivos de origen.
+    Nombra sus archivos silver: un reintento del mismo lote los sobrescribe en lugar
+    de agregar otros con las mismas filas.
+    """
+    origenes = sorted(f"{archivo['tabla']}/{archivo['id']}" for archivo in lote)
+    return hashlib.sha256("\n".join(origenes).encode("utf-8")).hexdigest()[:16]
+
+
+def _procesar_lote(lote, metadata_dict, engine, conjuntos, claves_db, run_id):
+    """
+    Deduplica, limpia, valida y carga (silver y base) un micro-lote.
+
+    Returns:
+        dict: {tabla: filas cargadas}
+    """
+    por_tabla = {}
+    for archivo in lote:
+        if archivo["df"] is None:
+            logger.error(f"No se pudo leer '{archivo['id']}', se omite en este lote")
+            continue
+        por_tabla.setdefault(archivo["tabla"], []).append(archivo["df"])
+
+    dataframes = {}
+    hashes = {}
+    for tabla, dfs in por_tabla.items():
+        df = pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0].reset_index(drop=True)
+        # Se hashean las filas tal como llegaron, igual que limpiar_chunks
+        conjunto = conjuntos.setdefault(tabla, ConjuntoHashes(tabla))
+        hashes_tabla = hash_filas(df)
+        mascara = conjunto.filtrar(hashes_tabla)
+        if not mascara.all():
+            df = df[mascara]
+        if len(df):
+            dataframes[tabla] = df
+            hashes[tabla] = pd.Series(hashes_tabla[mascara], index=df.index)
+
+    if not dataframes:
+        return {}
+
+    # Limpieza secuencial: la limpieza y la validación conservan el índice de cada
+    # fila, con el que se ubica su hash original
+    limpios = limpiar_diccionario(
+        dataframes, optimizar_tipos_datos=ETL_OPTIMIZAR_TIPOS, metadata_dict=metadata_dict
+    )
+    validas, _ = validar_integridad(limpios, metadata_dict, engine, run_id=run_id, claves_db=claves_db)
+
+    # Las filas en cuarentena no cuentan como vistas: si su tabla padre llega después,
+    # tienen que poder cargarse (las que limpiar_dataframe descartó por duplicadas sí)
+    for tabla, df in validas.items():
+        apartadas = limpios[tabla].index.difference(df.index)
+        if len(apartadas):
+            conjuntos[tabla].retirar(hashes[tabla].loc[apartadas].to_numpy())
+    validas = {tabla: df for tabla, df in validas.items() if len(df)}
+
+    if validas and not cargar_silver_y_db(validas, metadata_dict, engine, modo="append", token=_token_lote(lote)):
+        raise RuntimeError(f"Falló la escritura silver del micro-lote ({sorted(validas)})")
+    return {tabla: len(df) for tabla, df in validas.items()}
+
+
+def ejecutar_micro_lotes(tablas=None, fuente=None, metadata_dict=None, engine=None,
+                         duracion_max=None, detener=None, run_id=None):
+    """
+    Procesa las tablas de eventos en micro-lotes hasta que se pida detener o se
+    cumpla duracion_max. Cada micro-lote se confirma (dedup y fuente) recién
+    después de cargarse en silver y en la base: ante una caída se vuelve a leer,
+    y el dedup persistente y el merge por PK evitan duplicar filas en la base.
+    En silver, los archivos de cada lote se nombran a partir de sus archivos de
+    origen (ver _token_lote), por lo que un reintento los sobrescribe.
+
+    Args:
+        tablas (list, optional): Tablas de eventos. Por defecto ETL_MICROLOTE_TABLAS.
+        fuente (optional): FuenteS3 o FuenteDirectorio. Por defecto ETL_MICROLOTE_COLA_DIR o S3.
+        metadata_dict (dict, optional): Metadatos de las tablas. Por defecto dataframe_metadata.
+        engine (sqlalchemy.engine.Engine, optional): Por defecto get_db_engine().
+        duracion_max (float, optional): Segundos tras los cuales se termina (ej: para un DAG continuo)
+        detener (threading.Event, optional): Evento para terminar desde otro hilo o una señal
+        run_id (str, optional): Carpeta de métricas y cuarentena. Por defecto micro_lotes_<fecha>.
+
+    Returns:
+        dict: {tabla: filas cargadas en total}
+
+    Raises:
+        ValueError: Si alguna tabla tiene if_exists 'replace' (cada lote reemplazaría al anterior)
+        Exception: El error del micro-lote, si falla ETL_MICROLOTE_REINTENTOS veces
+    """
+    metadata_dict = metadata_dict or dataframe_metadata
+    tablas = tablas or [tabla.strip() for tabla in ETL_MICROLOTE_TABLAS.split(",") if tabla.strip()]
+    reemplazadas = [tabla for tabla in tablas if metadata_dict.get(tabla, {}).get("if_exists", "replace") == "replace"]
+    if reemplazadas:
+        raise ValueError(f"El modo micro-lotes solo admite tablas 'merge' o 'append': {reemplazadas}")
+
+    if fuente is None:
+        fuente = FuenteDirectorio(ETL_MICROLOTE_COLA_DIR, tablas) if ETL_MICROLOTE_COLA_DIR else FuenteS3(tablas)
+    engine = engine or get_db_engine()
+    detener = detener or threading.Event()
+    run_id = run_id or f"micro_lotes_{time.strftime('%Y%m%dT%H%M%S')}"
+
+    cola = queue.Queue(maxsize=ETL_MICROLOTE_COLA_MAX)
+    productor = threading.Thread(
+        target=_sondear, args=(fuente, especificacion_lectura(metadata_dict), metadata_dict, cola, detener),
+        name="micro_lotes_sondeo", daemon=True,
+    )
+    productor.start()
+    logger.info(f"Micro-lotes iniciados para {tablas} desde {type(fuente).__name__} (run_id: {run_id})")
+
+    conjuntos = {}
+    claves_db = {}
+    claves_desde = time.monotonic()
+    ultimo_reporte = time.monotonic()
+    fin = time.monotonic() + duracion_max if duracion_max else None
+    totales = {}
+    numero = 0
+
+    try:
+        while not detener.is_set():
+            if fin is not None and time.monotonic() >= fin:
+                break
+
+            # Las tablas padre cambian con el DAG batch: sus claves se releen cada tanto
+            if time.monotonic() - claves_desde > ETL_MICROLOTE_CLAVES_TTL:
+                claves_db.clear()
+                claves_desde = time.monotonic()
+
+            lote = _armar_lote(cola, ETL_MICROLOTE_INTERVALO)
+            if lote:
+                numero += 1
+                for intento in range(1, ETL_MICROLOTE_REINTENTOS + 1):
+                    try:
+                        with medir("micro_lote", archivos=len(lote)) as m:
+                            cargadas = _procesar_lote(
+                                lote, metadata_dict, engine, conjuntos, claves_db, f"{run_id}.{numero:06d}"
+                            )
+                            m["filas"] = sum(cargadas.values())
+                        break
+                    except Exception as e:
+                        for conjunto in conjuntos.values():
+                            conjunto.descartar()
+                        if intento == ETL_MICROLOTE_REINTENTOS:
+                            raise
+                        logger.warning(f"Micro-lote {numero} falló (intento {intento}), se reintenta: {e}")
+                        detener.wait(2 ** intento)
+
+                for conjunto in conjuntos.values():
+                    conjunto.confirmar()
+                fuente.confirmar(lote)
+
+                # Las claves propias de las tablas recién cargadas quedaron viejas
+                for clave in [clave for clave in claves_db if clave[0] in cargadas]:
+                    del claves_db[clave]
+
+                for tabla, filas in cargadas.items():
+                    totales[tabla] = totales.get(tabla, 0) + filas
+                frescura = time.time() - min(archivo["creado"] for archivo in lote)
+                logger.info(
+                    f"Micro-lote {numero}: {len(lote)} archivos, filas cargadas {cargadas}, "
+                    f"{m['segundos']:.2f}s, frescura máxima {frescura:.1f}s, en cola {cola.qsize()}"
+                )
+
+            if time.monotonic() - ultimo_reporte > ETL_MICROLOTE_REPORTE:
+                guardar_reporte(run_id, f"micro_lotes_{time.strftime('%Y%m%dT%H%M%S')}")
+                ultimo_reporte = time.monotonic()
+    finally:
+        # Los archivos que quedan en la cola no se confirmaron: se releen al reiniciar
+        detener.set()
+        productor.join(timeout=ETL_MICROLOTE_INTERVALO + 5)
+        guardar_reporte(run_id, f"micro_lotes_{time.strftime('%Y%m%dT%H%M%S')}")
+
+    logger.info(f"Micro-lotes finalizados: {numero} lotes, filas cargadas {totales}")
+    return totales
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modo continuo por micro-lotes para las tablas de eventos")
+    parser.add_argument("--tablas", nargs="+", help="Tablas de eventos. Por defecto ETL_MICROLOTE_TABLAS")
+    parser.add_argument("--cola", help="Directorio local que reemplaza a S3 como fuente ({cola}/{tabla}/)")
+    parser.add_argument("--duracion", type=float, help="Segundos tras los cuales se termina")
+    args = parser.parse_args()
+
+    detener = threading.Event()
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(senal, lambda *_: detener.set())
+
+    tablas = args.tablas or [tabla.strip() for tabla in ETL_MICROLOTE_TABLAS.split(",") if tabla.strip()]
+    fuente = FuenteDirectorio(args.cola, tablas) if args.cola else None
+    ejecutar_micro_lotes(tablas, fuente, duracion_max=args.duracion, detener=detener)
+
+
+if __name__ == "__main__":
+    main()
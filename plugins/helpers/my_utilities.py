@@ -1,9 +1,29 @@
 import os
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 import logging
+import io
+import re
+import uuid
+import csv
+import json
+import time
+import hashlib
+import shutil
+import tempfile
+import threading
 import boto3
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+from .staging import ETL_STAGING_DIR, StagingDict, leer_tabla_arrow
+from .metricas import medir, registrar, tomar_registros
+from .dedup import ETL_DEDUP_DIR, ConjuntoHashes, hash_filas
+from botocore.config import Config
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from io import BytesIO
 from pathlib import Path
 
@@ -20,11 +40,55 @@ AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
 AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET")
 AWS_S3_BRONZE_FOLDER = os.getenv('AWS_S3_BRONZE_FOLDER', '')
 AWS_S3_SILVER_FOLDER = os.getenv('AWS_S3_SILVER_FOLDER', '')
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", 8))
+ETL_MANIFEST_KEY = os.getenv(
+    "ETL_MANIFEST_KEY",
+    os.path.join(AWS_S3_SILVER_FOLDER, "_manifiesto_bronze.json").replace('\\', '/'),
+)
+ETL_INCREMENTAL = os.getenv("ETL_INCREMENTAL", "true").lower() == "true"
+ETL_SCHEMA_CACHE_DIR = os.getenv("ETL_SCHEMA_CACHE_DIR", os.path.join(ETL_STAGING_DIR, "esquemas"))
+ETL_TRANSFORM_PARALELISMO = os.getenv("ETL_TRANSFORM_PARALELISMO") or None
+ETL_TRANSFORM_WORKERS = int(os.getenv("ETL_TRANSFORM_WORKERS", os.cpu_count() or 1))
+ETL_PARQUET_ROW_GROUP_SIZE = int(os.getenv("ETL_PARQUET_ROW_GROUP_SIZE", 128 * 1024))
+ETL_PARQUET_COMPRESSION = os.getenv("ETL_PARQUET_COMPRESSION", "snappy")
+ETL_S3_PART_SIZE = int(os.getenv("ETL_S3_PART_SIZE", 8 * 1024 * 1024))
+# Lector de CSV, JSON Lines y Parquet: "pyarrow" (multihilo, texto como string[pyarrow]) o "pandas"
+ETL_LECTOR = os.getenv("ETL_LECTOR", "pyarrow").lower()
+ETL_CHUNKSIZE = int(os.getenv("ETL_CHUNKSIZE", 100_000))
+ETL_SPOOL_MAX_BYTES = int(os.getenv("ETL_SPOOL_MAX_BYTES", 64 * 1024 * 1024))
+ETL_DB_WORKERS = int(os.getenv("ETL_DB_WORKERS", 4))
+ETL_DB_BATCH_SIZE = int(os.getenv("ETL_DB_BATCH_SIZE", 50_000))
+ETL_OPTIMIZAR_TIPOS = os.getenv("ETL_OPTIMIZAR_TIPOS", "false").lower() == "true"
+# Proporción máxima de valores distintos para pasar texto a category: con valores
+# altos (ej: 0.5) los códigos y el diccionario ocupan casi lo mismo que el texto
+ETL_UMBRAL_CATEGORIA = float(os.getenv("ETL_UMBRAL_CATEGORIA", 0.05))
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT", 5432)
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
+# Pool de conexiones del engine compartido por proceso (por defecto uno por hilo de carga)
+ETL_DB_POOL_SIZE = int(os.getenv("ETL_DB_POOL_SIZE", ETL_DB_WORKERS))
+ETL_DB_MAX_OVERFLOW = int(os.getenv("ETL_DB_MAX_OVERFLOW", 2))
+ETL_DB_POOL_RECYCLE = int(os.getenv("ETL_DB_POOL_RECYCLE", 1800))
+# Reintentos con backoff de los clientes de AWS (modo "standard" o "adaptive")
+ETL_AWS_MAX_ATTEMPTS = int(os.getenv("ETL_AWS_MAX_ATTEMPTS", 5))
+ETL_AWS_RETRY_MODE = os.getenv("ETL_AWS_RETRY_MODE", "adaptive")
+
+# Engines y clientes reutilizados dentro de cada proceso (ver _recursos_del_proceso)
+_recursos = {}
+_recursos_pid = None
+_recursos_lock = threading.Lock()
+
+# Marcador de nulos en COPY (distingue NULL de string vacío)
+NULO_COPY = "\\N"
+
+# Nombres de los archivos silver según el modo de escritura (ver _eliminar_archivos_previos)
+PREFIJO_OVERWRITE = "part"
+PREFIJO_APPEND = "lote"
+
+# Fechas ISO: 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM:SS' y 'YYYY-MM-DD HH:MM:SS.ffffff'
+PATRON_FECHA = re.compile(r"^\d{4}-\d{1,2}-\d{1,2}(?:[ T]\d{1,2}:\d{2}:\d{2}(?:\.\d+)?)?$")
 
 def create_aws_session(access_key=None, secret_key=None, region=None):
     """
@@ -59,12 +123,245 @@ def create_aws_session(access_key=None, secret_key=None, region=None):
     
     return session
 
-def cargar_datos_desde_memoria(file_content, nombre_archivo, **kwargs):
+
+def _recursos_del_proceso():
+    """
+    Devuelve el cache de engines y clientes del proceso actual. Tras un fork (ej:
+    workers de Airflow o de un ProcessPoolExecutor) el cache heredado se descarta:
+    las conexiones abiertas por el padre no deben usarse desde el hijo.
+    """
+    global _recursos, _recursos_pid
+    if _recursos_pid != os.getpid():
+        for recurso in _recursos.values():
+            if hasattr(recurso, "dispose"):
+                # close=False: no cerrar los sockets que siguen siendo del padre
+                recurso.dispose(close=False)
+        _recursos = {}
+        _recursos_pid = os.getpid()
+    return _recursos
+
+
+def get_s3_client(max_pool_connections=None):
+    """
+    Devuelve un cliente de S3 compartido por todos los hilos del proceso (los
+    clientes de boto3 son thread-safe), con reintentos con backoff y keep-alive.
+    Reutilizarlo evita repetir la creación de la sesión y el handshake TLS en
+    cada llamada.
+
+    Args:
+        max_pool_connections (int, optional): Conexiones HTTP simultáneas. Por defecto
+            acompaña a S3_MAX_CONCURRENCY.
+
+    Returns:
+        botocore.client.S3: Cliente de S3
+    """
+    max_pool_connections = max(max_pool_connections or S3_MAX_CONCURRENCY, 10)
+    clave = ("s3", max_pool_connections)
+
+    with _recursos_lock:
+        recursos = _recursos_del_proceso()
+        if clave not in recursos:
+            # Las sesiones de boto3 no son thread-safe: el cliente se crea bajo el lock
+            recursos[clave] = create_aws_session().client(
+                's3',
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    retries={"max_attempts": ETL_AWS_MAX_ATTEMPTS, "mode": ETL_AWS_RETRY_MODE},
+                    tcp_keepalive=True,
+                ),
+            )
+        return recursos[clave]
+
+def especificacion_lectura(metadata_dict):
+    """
+    Arma la especificación de lectura por tabla a partir de las claves opcionales
+    de los metadatos:
+
+    - "columns": columnas a leer (proyección). Se agregan siempre las PK, FK y la
+      columna de partición, que el resto del pipeline necesita.
+    - "filters": filtro de filas en formato DNF de pyarrow, ej:
+      [("start_time", ">=", "2025-01-01")] o [[(...), (...)], [(...)]] (OR de ANDs).
+    - "dtype": tipos de columnas para CSV/JSON (evita la inferencia).
+
+    Args:
+        metadata_dict (dict): Metadatos de las tablas
+
+    Returns:
+        dict: {tabla: {"columns", "filters", "dtype"}} solo para las tablas con alguna clave
+    """
+    lectura = {}
+    for original_name, table_metadata in (metadata_dict or {}).items():
+        spec = {clave: table_metadata[clave] for clave in ("columns", "filters", "dtype") if table_metadata.get(clave)}
+        if not spec:
+            continue
+
+        if spec.get("columns"):
+            requeridas = list(table_metadata.get("primary_keys") or [])
+            requeridas += list((table_metadata.get("foreign_keys") or {}).keys())
+            if table_metadata.get("partition_by"):
+                requeridas.append(table_metadata["partition_by"]["column"])
+            spec["columns"] = list(dict.fromkeys([*spec["columns"], *requeridas]))
+
+        lectura[original_name] = spec
+    return lectura
+
+
+def _columnas_filtros(filtros):
+    """
+    Devuelve las columnas referenciadas por un filtro DNF.
+    """
+    if not filtros:
+        return []
+    grupos = filtros if isinstance(filtros[0], list) else [filtros]
+    return list(dict.fromkeys(columna for grupo in grupos for columna, _, _ in grupo))
+
+
+def _mascara_filtros(df, filtros):
+    """
+    Evalúa un filtro DNF de pyarrow sobre un DataFrame (para formatos que no lo
+    soportan en la lectura, como CSV y JSON).
+    """
+    operaciones = {
+        "=": lambda serie, valor: serie == valor,
+        "==": lambda serie, valor: serie == valor,
+        "!=": lambda serie, valor: serie != valor,
+        "<": lambda serie, valor: serie < valor,
+        "<=": lambda serie, valor: serie <= valor,
+        ">": lambda serie, valor: serie > valor,
+        ">=": lambda serie, valor: serie >= valor,
+        "in": lambda serie, valor: serie.isin(valor),
+        "not in": lambda serie, valor: ~serie.isin(valor),
+    }
+    grupos = filtros if isinstance(filtros[0], list) else [filtros]
+
+    mascara = pd.Series(False, index=df.index)
+    for grupo in grupos:
+        mascara_grupo = pd.Series(True, index=df.index)
+        for columna, operador, valor in grupo:
+            if operador not in operaciones:
+                raise ValueError(f"Operador de filtro '{operador}' no soportado")
+            mascara_grupo &= operaciones[operador](df[columna], valor).fillna(False).astype(bool)
+        mascara |= mascara_grupo
+    return mascara
+
+
+def _tipo_arrow(tipo):
+    """
+    Traduce un tipo de la especificación "dtype" (ej: "int64", "string") a un tipo
+    de Arrow. Devuelve None si no tiene equivalente directo (se infiere al leer).
+    """
+    if isinstance(tipo, pa.DataType):
+        return tipo
+    if str(tipo) in ("str", "string", "object"):
+        return pa.string()
+    try:
+        return pa.from_numpy_dtype(np.dtype(tipo))
+    except TypeError:
+        return None
+
+
+def _tipo_pandas(tipo):
+    """
+    types_mapper de to_pandas: el texto queda como string[pyarrow] (sin objetos
+    Python por valor); el resto de los tipos se convierten como siempre.
+    """
+    if pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def _tabla_a_pandas(tabla: pa.Table) -> pd.DataFrame:
+    """
+    Convierte una tabla leída con pyarrow a DataFrame. Las fechas y timestamps ya
+    inferidos por el lector quedan como datetime64[ns], igual que los que convierte
+    limpiar_dataframe. Las columnas diccionario de texto quedan como category con
+    categorías string[pyarrow], igual que las que arma optimizar_tipos.
+    """
+    df = tabla.to_pandas(types_mapper=_tipo_pandas, date_as_object=False, coerce_temporal_nanoseconds=True)
+    for campo in tabla.schema:
+        if pa.types.is_dictionary(campo.type) and (
+            pa.types.is_string(campo.type.value_type) or pa.types.is_large_string(campo.type.value_type)
+        ):
+            categorias = df[campo.name].cat.categories.astype(pd.StringDtype("pyarrow"))
+            df[campo.name] = df[campo.name].cat.rename_categories(categorias)
+    return df
+
+
+def _leer_con_pyarrow(file_content, extension, columnas=None, tipos=None):
+    """
+    Lee un CSV o JSON Lines con los lectores multihilo de pyarrow.
+
+    Raises:
+        pa.ArrowException: Si pyarrow no puede leer el archivo (ej: JSON que no es JSON Lines)
+    """
+    tipos_arrow = {columna: _tipo_arrow(tipo) for columna, tipo in (tipos or {}).items()}
+    tipos_arrow = {columna: tipo for columna, tipo in tipos_arrow.items() if tipo is not None}
+
+    if extension == ".csv":
+        tabla = pa_csv.read_csv(
+            pa.BufferReader(file_content),
+            convert_options=pa_csv.ConvertOptions(include_columns=columnas or [], column_types=tipos_arrow),
+        )
+    else:
+        tabla = pa_json.read_json(
+            pa.BufferReader(file_content),
+            parse_options=pa_json.ParseOptions(explicit_schema=pa.schema(tipos_arrow) if tipos_arrow else None),
+        )
+    return _tabla_a_pandas(tabla)
+
+
+def _leer_parquet(origen, columnas=None, filtros=None, **kwargs):
+    """
+    Lee un Parquet aplicando la proyección y el filtro en pyarrow: solo se leen
+    las column chunks pedidas y se descartan los row groups cuyas estadísticas
+    no cumplen el filtro.
+    """
+    if ETL_LECTOR == "pyarrow" and not kwargs:
+        return _tabla_a_pandas(pq.read_table(origen, columns=columnas, filters=filtros))
+    if columnas:
+        kwargs.setdefault("columns", columnas)
+    if filtros:
+        kwargs.setdefault("filters", filtros)
+    return pd.read_parquet(origen, **kwargs)
+
+
+def cargar_datos_desde_memoria(file_content, nombre_archivo, columnas=None, filtros=None, tipos=None, **kwargs):
     """
     Carga datos desde contenido en memoria a DataFrame según la extensión.
+
+    Args:
+        file_content (bytes): Contenido del archivo
+        nombre_archivo (str): Nombre del archivo (para detectar la extensión)
+        columnas (list, optional): Columnas a conservar (en Parquet y CSV no se parsean las demás)
+        filtros (list, optional): Filtro de filas en formato DNF de pyarrow (ver especificacion_lectura)
+        tipos (dict, optional): Tipos de columnas para CSV y JSON
+        **kwargs: Argumentos adicionales para las funciones de Pandas. Con argumentos
+            adicionales se usa siempre el lector de pandas.
+
+    Returns:
+        pd.DataFrame | None: Datos del archivo, o None si no se pudo cargar
     """
     # Obtener la extensión del archivo
     extension = os.path.splitext(nombre_archivo)[1].lower()
+
+    # Columnas a parsear: las pedidas más las que usa el filtro (se descartan después)
+    columnas_lectura = list(dict.fromkeys([*columnas, *_columnas_filtros(filtros)])) if columnas else None
+
+    df = None
+    if ETL_LECTOR == "pyarrow" and extension in (".csv", ".json") and not kwargs:
+        try:
+            df = _leer_con_pyarrow(file_content, extension, columnas_lectura, tipos)
+        except pa.ArrowException as e:
+            # Ej: JSON con un único arreglo (no JSON Lines) o CSV con filas irregulares
+            logger.info(f"pyarrow no pudo leer {nombre_archivo}, se usa el lector de pandas: {e}")
+
+    if extension == ".csv":
+        if columnas_lectura:
+            kwargs.setdefault("usecols", columnas_lectura)
+        if tipos:
+            kwargs.setdefault("dtype", tipos)
+    elif extension == ".json" and tipos:
+        kwargs.setdefault("dtype", tipos)
     
     # Mapeo de extensiones a funciones de Pandas
     cargadores = {
@@ -72,7 +369,7 @@ def cargar_datos_desde_memoria(file_content, nombre_archivo, **kwargs):
         ".xlsx": lambda content, **kw: pd.read_excel(BytesIO(content), **kw),
         ".xls": lambda content, **kw: pd.read_excel(BytesIO(content), **kw),
         ".json": lambda content, **kw: pd.read_json(BytesIO(content), **kw),
-        ".parquet": lambda content, **kw: pd.read_parquet(BytesIO(content), **kw),
+        ".parquet": lambda content, **kw: _leer_parquet(BytesIO(content), columnas, filtros, **kw),
         ".feather": lambda content, **kw: pd.read_feather(BytesIO(content), **kw),
         ".h5": lambda content, **kw: pd.read_hdf(BytesIO(content), **kw),
         ".hdf5": lambda content, **kw: pd.read_hdf(BytesIO(content), **kw),
@@ -87,329 +384,1829 @@ def cargar_datos_desde_memoria(file_content, nombre_archivo, **kwargs):
     
     try:
         # Cargar el archivo desde memoria
-        df = cargadores[extension](file_content, **kwargs)
+        if df is None:
+            df = cargadores[extension](file_content, **kwargs)
+
+        # Parquet ya aplicó la proyección y el filtro al leer
+        if extension != ".parquet":
+            if filtros:
+                df = df[_mascara_filtros(df, filtros)].reset_index(drop=True)
+            if columnas:
+                # Mismo orden que la especificación, como en Parquet
+                df = df[[columna for columna in columnas if columna in df.columns]]
         return df
         
     except Exception as e:
         logger.error(f"Error al cargar {nombre_archivo}: {str(e)}")
         return None
     
-def cargar_datos_s3(extensiones=None, **kwargs):
+def _huella_objeto(obj):
     """
-    Carga datos desde archivos en un bucket de S3 a DataFrames de Pandas.
+    Extrae de un objeto listado en S3 los campos que identifican su versión.
+    """
+    return {
+        "etag": obj['ETag'].strip('"'),
+        "size": obj['Size'],
+        "last_modified": obj['LastModified'].isoformat(),
+    }
 
-    Parámetros:
-    -----------
-    extensiones : list, optional
-        Lista de extensiones a incluir (ej: ['.csv', '.xlsx']). Si es None, incluye todas.
-    **kwargs : dict
-        Argumentos adicionales para las funciones de Pandas
-    
-    Retorna:
-    --------
-    dict
-        Diccionario con nombres de archivo como keys y DataFrames como values
+
+def leer_manifiesto_bronze(s3_client=None):
     """
+    Lee desde S3 el manifiesto de objetos bronze ya procesados.
 
-    session = create_aws_session()
-    
-    s3_client = session.client('s3')
+    Returns:
+        dict: {key de S3: {"etag", "size", "last_modified", "tabla"}}. Vacío si no existe.
+    """
+    s3_client = s3_client or get_s3_client()
+    try:
+        response_obj = s3_client.get_object(Bucket=AWS_S3_BUCKET, Key=ETL_MANIFEST_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        logger.info("No existe manifiesto bronze previo, se procesan todos los archivos")
+        return {}
+    return json.loads(response_obj['Body'].read())
+
+
+def guardar_manifiesto_bronze(manifiesto, s3_client=None):
+    """
+    Persiste en S3 el manifiesto de objetos bronze procesados. Debe llamarse
+    recién cuando las salidas (silver y base de datos) se escribieron con éxito.
+    """
+    s3_client = s3_client or get_s3_client()
+    s3_client.put_object(
+        Bucket=AWS_S3_BUCKET,
+        Key=ETL_MANIFEST_KEY,
+        Body=json.dumps(manifiesto, indent=2).encode("utf-8"),
+        ContentType='application/json'
+    )
+    logger.info(f"Manifiesto bronze guardado en '{ETL_MANIFEST_KEY}' ({len(manifiesto)} objetos)")
+
+
+def _listar_objetos_bronze(s3_client, extensiones=None, tablas=None):
+    """
+    Lista (paginando) los archivos de la carpeta bronze, filtrando por extensión
+    y, opcionalmente, por nombre de tabla (nombre del archivo sin extensión).
+
+    Returns:
+        list[tuple]: Lista de (key de S3, nombre de archivo, huella del objeto)
+    """
     folder_s3 = AWS_S3_BRONZE_FOLDER
 
     if not folder_s3.endswith('/'):
         folder_s3 += '/'
-    
-    dataframes = {}
-    
-    try:
-        response = s3_client.list_objects_v2(
-            Bucket=AWS_S3_BUCKET,
-            Prefix=folder_s3
-        )
-        
-        if 'Contents' not in response:
-            return dataframes
-        
-        for obj in response['Contents']:
-            archivo_key = obj['Key']
-            
-            if archivo_key.endswith('/'):
-                continue
-            
-            nombre_archivo = os.path.basename(archivo_key)
-            extension = os.path.splitext(nombre_archivo)[1].lower()
-            
-            # Filtrar por extensiones si se especificó
-            if extensiones and extension not in extensiones:
-                continue
-            
-            try:
-                response_obj = s3_client.get_object(Bucket=AWS_S3_BUCKET, Key=archivo_key)
-                file_content = response_obj['Body'].read()
-                
-                df = cargar_datos_desde_memoria(file_content, nombre_archivo, **kwargs)
-                
-                if df is not None:
-                    nombre_sin_extension = Path(nombre_archivo).stem
-                    dataframes[nombre_sin_extension] = df
-
-            except Exception as e:
-                logger.error(f"Error con {archivo_key}: {e}")
-                continue
-        
-        return dataframes
-    
-    except Exception as e:
-        logger.error(f"Error general: {e}")
-        return {}    
 
-def limpiar_diccionario(dfs: dict, threshold_fecha: float = 0.1):
+    # Con tablas se lista solo el prefijo de cada una en lugar de toda la carpeta
+    prefijos = [folder_s3 + tabla for tabla in tablas] if tablas else [folder_s3]
+
+    paginator = s3_client.get_paginator('list_objects_v2')
+    archivos = []
+
+    for prefijo in prefijos:
+        for pagina in paginator.paginate(Bucket=AWS_S3_BUCKET, Prefix=prefijo):
+            for obj in pagina.get('Contents', []):
+                archivo_key = obj['Key']
+
+                if archivo_key.endswith('/'):
+                    continue
+
+                nombre_archivo = os.path.basename(archivo_key)
+                extension = os.path.splitext(nombre_archivo)[1].lower()
+
+                # Filtrar por extensiones si se especificó
+                if extensiones and extension not in extensiones:
+                    continue
+
+                # El prefijo 'plays' también incluye, por ejemplo, 'plays_archive.csv'
+                if tablas and Path(nombre_archivo).stem not in tablas:
+                    continue
+
+                archivos.append((archivo_key, nombre_archivo, _huella_objeto(obj)))
+
+    return archivos
+
+
+def cargar_datos_desde_stream(body, nombre_archivo, chunksize=None, **kwargs):
     """
-    Aplica transformaciones típicas de limpieza a un diccionario de DataFrames.
+    Parsea un archivo directamente desde un stream (ej: StreamingBody de S3)
+    y devuelve DataFrames por partes, sin materializar el archivo completo.
+
+    - CSV: pd.read_csv con chunksize
+    - JSON: JSON Lines con chunksize
+    - Parquet: se vuelca a un archivo temporal (en disco si supera
+      ETL_SPOOL_MAX_BYTES) y se lee por lotes de row groups
 
     Args:
-        dfs (dict[str, pd.DataFrame]): Diccionario con DataFrames de pandas.
-        threshold_fecha (float): Proporción mínima para considerar que una columna es fecha.
+        body: Objeto tipo archivo con método read()
+        nombre_archivo (str): Nombre del archivo (para detectar la extensión)
+        chunksize (int, optional): Filas por parte. Por defecto ETL_CHUNKSIZE.
+        **kwargs: Argumentos adicionales para las funciones de Pandas
 
-    Returns:
-        dict[str, pd.DataFrame]: Nuevo diccionario con DataFrames transformados.
+    Yields:
+        pd.DataFrame: Partes del archivo de a lo sumo chunksize filas
     """
-    def es_fecha(serie: pd.Series) -> bool:
-      # Primero intentar con el formato más específico (con microsegundos)
-      fechas = pd.to_datetime(serie, format='%Y-%m-%d %H:%M:%S.%f', errors='coerce')
-    
-      # Para los que fallaron, intentar con formato de hora sin microsegundos
-      mask = fechas.isna()
-      fechas_con_hora = pd.to_datetime(serie[mask], format='%Y-%m-%d %H:%M:%S', errors='coerce')
-      fechas.update(fechas_con_hora)
-    
-      # Para los que aún fallan, intentar con solo fecha
-      mask = fechas.isna()
-      fechas_solo_fecha = pd.to_datetime(serie[mask], format='%Y-%m-%d', errors='coerce')
-      fechas.update(fechas_solo_fecha)
-    
-      return fechas.notna().mean() >= threshold_fecha
-
-    dfs_limpios = {}
+    chunksize = chunksize or ETL_CHUNKSIZE
+    extension = os.path.splitext(nombre_archivo)[1].lower()
 
-    for nombre, df in dfs.items():
-        df = df.copy()
+    if extension == ".csv":
+        with pd.read_csv(body, chunksize=chunksize, **kwargs) as lector:
+            yield from lector
 
-        # 🔹 1. Eliminar duplicados
-        df = df.drop_duplicates()
+    elif extension == ".json":
+        # El lector por partes de JSON Lines une líneas como str: no acepta streams binarios
+        texto = body if isinstance(body, io.TextIOBase) else io.TextIOWrapper(body, encoding="utf-8")
+        with pd.read_json(texto, lines=True, chunksize=chunksize, **kwargs) as lector:
+            yield from lector
 
-        # 🔹 2. Detectar y convertir tipos de datos
-        for col in df.columns:
-            serie = df[col]
-
-            # Si es fecha
-            if serie.dtype == "object" and es_fecha(serie):
-                df[col] = pd.to_datetime(serie, errors='coerce')
-
-        # 🔹 3. Manejo de nulos
-        for col in df.columns:
-            if df[col].dtype in ["float64", "int64"]:
-                df[col] = df[col].fillna(0)  # default para numéricos
-            elif pd.api.types.is_datetime64_any_dtype(df[col]):
-                df[col] = df[col].fillna(pd.NaT)  # mantener NaT
-            else:
-                df[col] = df[col].fillna("")  # default para strings
+    elif extension == ".parquet":
+        # Parquet necesita acceso aleatorio al footer, el stream no es seekable
+        with tempfile.SpooledTemporaryFile(max_size=ETL_SPOOL_MAX_BYTES) as spool:
+            shutil.copyfileobj(body, spool, length=8 * 1024 * 1024)
+            spool.seek(0)
+            archivo_parquet = pq.ParquetFile(spool)
+            for lote in archivo_parquet.iter_batches(batch_size=chunksize, columns=kwargs.get("columns")):
+                yield lote.to_pandas()
 
-        dfs_limpios[nombre] = df
+    else:
+        # Formatos sin lectura incremental: se cargan completos como una única parte
+        logger.warning(f"Extensión '{extension}' sin modo streaming, se carga completa: {nombre_archivo}")
+        df = cargar_datos_desde_memoria(body.read(), nombre_archivo, **kwargs)
+        if df is not None:
+            yield df
 
-    return dfs_limpios
 
-def convertir_dataframes_a_parquet_s3(diccionario_dataframes):
+def iterar_datos_s3(extensiones=None, chunksize=None, **kwargs):
     """
-    Convierte DataFrames de un diccionario a archivos Parquet y los guarda en S3
-    
+    Versión streaming de cargar_datos_s3: recorre los archivos de la carpeta bronze
+    y devuelve sus datos por partes. La memoria pico depende de chunksize y no del
+    tamaño de los archivos.
+
     Args:
-        diccionario_dataframes (dict): Diccionario con nombres de archivo como keys
-                                      y DataFrames de pandas como values
-    
-    Returns:
-        bool: True si todos los archivos se procesaron exitosamente, False si hubo errores
+        extensiones (list, optional): Lista de extensiones a incluir. Si es None, incluye todas.
+        chunksize (int, optional): Filas por parte. Por defecto ETL_CHUNKSIZE.
+        **kwargs: Argumentos adicionales para las funciones de Pandas
+
+    Yields:
+        tuple: (nombre de la tabla, pd.DataFrame con una parte de sus filas)
+
+    Raises:
+        Exception: Si un archivo falla después de haber entregado alguna de sus partes.
+            Los archivos que fallan antes de entregar datos se registran y se omiten.
     """
-    
-    try:
-        # Configurar sesión de AWS
-        session = create_aws_session()
-        
-        s3_client = session.client('s3')
-        
-        # Validar que el bucket existe
-        if not AWS_S3_BUCKET:
-            logger.error("El nombre del bucket S3 no está configurado en las variables de entorno")
-            return False
-        
-        logger.info(f"Iniciando proceso de conversión para {len(diccionario_dataframes)} DataFrames")
-        logger.info(f"Bucket destino: {AWS_S3_BUCKET}")
-        logger.info(f"Folder destino: {AWS_S3_SILVER_FOLDER}")
-        
-        contador_exitosos = 0
-        contador_errores = 0
-        
-        # Recorrer el diccionario de DataFrames
-        for nombre_archivo, dataframe in diccionario_dataframes.items():
+    s3_client = get_s3_client()
+
+    for archivo_key, nombre_archivo, _ in _listar_objetos_bronze(s3_client, extensiones):
+        nombre_sin_extension = Path(nombre_archivo).stem
+        partes_entregadas = 0
+        try:
+            response_obj = s3_client.get_object(Bucket=AWS_S3_BUCKET, Key=archivo_key)
+            body = response_obj['Body']
             try:
-                # Validar que el DataFrame no esté vacío
-                if dataframe is None:
-                    logger.warning(f"DataFrame '{nombre_archivo}' es None, se omite")
-                    contador_errores += 1
-                    continue
-                
-                if dataframe.empty:
-                    logger.warning(f"DataFrame '{nombre_archivo}' está vacío, se omite")
-                    contador_errores += 1
-                    continue
-                
-                # Asegurar que el nombre del archivo tenga extensión .parquet
-                if not nombre_archivo.endswith('.parquet'):
-                    nombre_archivo += '.parquet'
-                
-                # Construir la ruta completa en S3
-                s3_key = os.path.join(AWS_S3_SILVER_FOLDER, nombre_archivo).replace('\\', '/')
-                
-                # Convertir DataFrame a bytes en memoria
-                parquet_buffer = BytesIO()
-                dataframe.to_parquet(parquet_buffer, index=False, engine='pyarrow')
-                parquet_buffer.seek(0)  # Volver al inicio del buffer
-                
-                # Subir a S3
-                s3_client.put_object(
-                    Bucket=AWS_S3_BUCKET,
-                    Key=s3_key,
-                    Body=parquet_buffer,
-                    ContentType='application/parquet'
-                )
-                
-                logger.info(f"Archivo '{s3_key}' guardado exitosamente en S3")
-                contador_exitosos += 1
-                
-            except Exception as e:
-                logger.error(f"Error procesando '{nombre_archivo}': {str(e)}")
-                contador_errores += 1
-        
-        # Resumen del proceso
-        logger.info(f"Proceso completado. Exitosos: {contador_exitosos}, Errores: {contador_errores}")
-        
-        if contador_errores == 0:
-            logger.info("Todos los archivos fueron procesados exitosamente")
-            return True
-        else:
-            logger.warning(f"Proceso completado con {contador_errores} errores")
-            return False
-            
-    except Exception as e:
-        logger.error(f"Error general en la configuración de AWS: {str(e)}")
-        return False
+                for chunk in cargar_datos_desde_stream(body, nombre_archivo, chunksize, **kwargs):
+                    partes_entregadas += 1
+                    yield nombre_sin_extension, chunk
+            finally:
+                body.close()
 
+        except Exception as e:
+            if partes_entregadas:
+                # Las partes ya entregadas pueden estar cargadas: omitir el resto del
+                # archivo dejaría la tabla incompleta sin que nadie se entere
+                logger.error(f"Error con {archivo_key} después de {partes_entregadas} partes: {e}")
+                raise
+            logger.error(f"Error con {archivo_key}: {e}")
+            continue
 
-def create_tables_with_constraints(dataframes_dict, metadata_dict, engine):
-    """
-    Crea tablas en una base de datos PostgreSQL a partir de DataFrames de pandas
-    y establece las constraints (PK y FK) definidas en los metadatos.
-    Elimina automáticamente el prefijo 'df_' de los nombres de las tablas.
 
-    Parameters:
-    -----------
-    dataframes_dict : dict
-        Diccionario donde las claves son nombres de tablas (con prefijo df_) y los valores son DataFrames
-    metadata_dict : dict
-        Diccionario con metadatos para cada tabla (PK, FK, if_exists)
-    engine : sqlalchemy.engine.Engine
-        Objeto engine de SQLAlchemy para la conexión a la base de datos
+class _S3RangeReader(io.RawIOBase):
+    """
+    Archivo de solo lectura sobre un objeto de S3 que descarga únicamente los
+    rangos de bytes que se leen (GET con Range). Permite que pyarrow lea el footer
+    de un Parquet y solo las column chunks y row groups necesarios, sin bajar el
+    objeto completo.
     """
 
-    # Mapeo de nombres originales a nombres sin df_
-    table_name_mapping = {
-        original: original.replace("df_", "") for original in dataframes_dict.keys()
-    }
+    def __init__(self, s3_client, bucket, key, size):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.posicion = 0
+        self.bytes_leidos = 0
 
-    # Primera pasada: crear todas las tablas sin constraints
-    for original_name, df in dataframes_dict.items():
-        table_name = table_name_mapping[original_name]
+    def readable(self):
+        return True
 
-        if original_name in metadata_dict:
-            table_metadata = metadata_dict[original_name]
-            if_exists = table_metadata.get("if_exists", "replace")
-        else:
-            if_exists = "replace"
-
-        df.to_sql(
-            name=table_name,
-            con=engine,
-            if_exists=if_exists,
-            index=False,
-            method="multi",
-        )
-        logger.info(f"Tabla '{table_name}' creada exitosamente (original: {original_name})")
+    def seekable(self):
+        return True
 
-    # Segunda pasada: agregar constraints
-    with engine.connect() as conn:
-        for original_name, metadata in metadata_dict.items():
-            if original_name not in dataframes_dict:
-                continue
+    def tell(self):
+        return self.posicion
 
-            table_name = table_name_mapping[original_name]
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.posicion
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.posicion = min(max(offset, 0), self.size)
+        return self.posicion
 
-            # Agregar primary keys
-            if "primary_keys" in metadata and metadata["primary_keys"]:
-                pk_columns = ", ".join(metadata["primary_keys"])
-                alter_pk = f"ALTER TABLE {table_name} ADD PRIMARY KEY ({pk_columns});"
-                try:
-                    with conn.begin():  # maneja commit/rollback automáticamente
-                        conn.execute(text(alter_pk))
-                    logger.info(f"Primary key agregada a la tabla '{table_name}'")
-                except Exception as e:
-                    logger.error(f"Error al agregar PK a '{table_name}': {str(e)}")
-
-            # Agregar foreign keys
-            if "foreign_keys" in metadata and metadata["foreign_keys"]:
-                for fk_column, fk_info in metadata["foreign_keys"].items():
-                    referenced_table = fk_info["table"].replace("df_", "")
-                    alter_fk = f"""
-                    ALTER TABLE {table_name} 
-                    ADD CONSTRAINT fk_{table_name}_{fk_column}
-                    FOREIGN KEY ({fk_column}) 
-                    REFERENCES {referenced_table} ({fk_info['column']});
-                    """
-                    try:
-                        with conn.begin():
-                            conn.execute(text(alter_fk))
-                        logger.info(
-                            f"Foreign key agregada a la tabla '{table_name}' (columna: {fk_column})"
-                        )
-                    except Exception as e:
-                        logger.error(
-                            f"Error al agregar FK a '{table_name}.{fk_column}': {str(e)}"
-                        )
+    def read(self, size=-1):
+        fin = self.size if size is None or size < 0 else min(self.posicion + size, self.size)
+        if fin <= self.posicion:
+            return b""
+        respuesta = self.s3_client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={self.posicion}-{fin - 1}"
+        )
+        datos = respuesta['Body'].read()
+        self.posicion += len(datos)
+        self.bytes_leidos += len(datos)
+        return datos
 
-    logger.info("Proceso completado")
+    def readinto(self, buffer):
+        datos = self.read(len(buffer))
+        buffer[:len(datos)] = datos
+        return len(datos)
 
 
-def get_db_engine():
+def _descargar_y_cargar(s3_client, archivo_key, nombre_archivo, lectura=None, size=None, **kwargs):
     """
-    Crea y devuelve un engine de SQLAlchemy para PostgreSQL configurado con variables de entorno.
+    Descarga un objeto de S3 y lo convierte a DataFrame, midiendo tiempos y bytes.
+    Se ejecuta dentro de un hilo del pool, por lo que el parseo de un archivo
+    se solapa con la descarga de los demás.
+
+    Con proyección o filtro sobre un Parquet, el objeto no se descarga completo:
+    se leen por rangos solo el footer y las column chunks necesarias.
 
     Returns:
-        sqlalchemy.engine.Engine: Engine configurado para la conexión a la base de datos
+        tuple: (DataFrame o None, dict con estadísticas del archivo)
     """
+    tabla = Path(nombre_archivo).stem
+    lectura = lectura or {}
+    extension = os.path.splitext(nombre_archivo)[1].lower()
 
-    # Configuración de la conexión
-    db_config = {
-        "host": DB_HOST,
-        "port": int(DB_PORT),
-        "user": DB_USER,
-        "password": DB_PASSWORD,
-        "database": DB_NAME,
+    if extension == ".parquet" and size and (lectura.get("columns") or lectura.get("filters")):
+        inicio = time.perf_counter()
+        with medir("extraccion.parseo", tabla) as m:
+            origen = _S3RangeReader(s3_client, AWS_S3_BUCKET, archivo_key, size)
+            df = _leer_parquet(origen, lectura.get("columns"), lectura.get("filters"))
+            m["bytes_entrada"] = origen.bytes_leidos
+            m["filas"] = len(df)
+        logger.info(f"'{archivo_key}': leídos {origen.bytes_leidos} de {size} bytes por rangos")
+        return df, {
+            "key": archivo_key,
+            "bytes": origen.bytes_leidos,
+            "segundos_descarga": 0.0,
+            "segundos_parseo": time.perf_counter() - inicio,
+        }
+
+    inicio = time.perf_counter()
+    with medir("extraccion.descarga", tabla) as m:
+        response_obj = s3_client.get_object(Bucket=AWS_S3_BUCKET, Key=archivo_key)
+        file_content = response_obj['Body'].read()
+        m["bytes_entrada"] = len(file_content)
+    fin_descarga = time.perf_counter()
+
+    with medir("extraccion.parseo", tabla, bytes_entrada=len(file_content)) as m:
+        df = cargar_datos_desde_memoria(
+            file_content, nombre_archivo,
+            columnas=lectura.get("columns"), filtros=lectura.get("filters"), tipos=lectura.get("dtype"),
+            **kwargs
+        )
+        m["filas"] = 0 if df is None else len(df)
+    fin_parseo = time.perf_counter()
+
+    estadisticas = {
+        "key": archivo_key,
+        "bytes": len(file_content),
+        "segundos_descarga": fin_descarga - inicio,
+        "segundos_parseo": fin_parseo - fin_descarga,
     }
+    return df, estadisticas
 
-    # Crear cadena de conexión para PostgreSQL
-    connection_string = f"postgresql+psycopg2://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
 
-    # Crear y devolver el engine
-    engine = create_engine(connection_string)
+def cargar_datos_s3(extensiones=None, max_concurrencia=None, manifiesto=None, tablas=None, lectura=None, **kwargs):
+    """
+    Carga datos desde archivos en un bucket de S3 a DataFrames de Pandas.
+    El listado se pagina (sin límite de 1000 objetos) y las descargas se hacen
+    en paralelo con un pool acotado de hilos que comparten un único cliente.
+
+    Si se pasa un manifiesto (ver leer_manifiesto_bronze), la carga es incremental:
+    se omiten los objetos cuyo ETag, tamaño y LastModified no cambiaron (sus salidas
+    silver y en la base de datos de ejecuciones anteriores siguen vigentes) y el
+    manifiesto se actualiza en el lugar con los objetos descargados.
+
+    Parámetros:
+    -----------
+    extensiones : list, optional
+        Lista de extensiones a incluir (ej: ['.csv', '.xlsx']). Si es None, incluye todas.
+    max_concurrencia : int, optional
+        Cantidad máxima de descargas simultáneas. Por defecto S3_MAX_CONCURRENCY.
+    manifiesto : dict, optional
+        Manifiesto de objetos ya procesados. Si es None, se descargan todos.
+    tablas : list, optional
+        Nombres de tablas (archivo sin extensión) a cargar. Si es None, incluye todas.
+        Con tablas, un error al listar, descargar o parsear un archivo se propaga en
+        lugar de omitir el archivo (la tarea de la tabla debe fallar y reintentarse).
+    lectura : dict, optional
+        Proyección, filtro y tipos por tabla (ver especificacion_lectura).
+    **kwargs : dict
+        Argumentos adicionales para las funciones de Pandas
+    
+    Retorna:
+    --------
+    dict
+        Diccionario con nombres de archivo como keys y DataFrames como values
+
+    Raises:
+    -------
+    RuntimeError
+        Si se pasó tablas y algún archivo no se pudo cargar
+    """
+    max_concurrencia = max_concurrencia or S3_MAX_CONCURRENCY
+
+    # El pool de conexiones debe acompañar a la cantidad de hilos
+    s3_client = get_s3_client(max_concurrencia)
+    
+    dataframes = {}
+    
+    try:
+        archivos = _listar_objetos_bronze(s3_client, extensiones, tablas)
+
+        if manifiesto is not None:
+            sin_cambios = {
+                archivo_key for archivo_key, _, huella in archivos
+                if all(manifiesto.get(archivo_key, {}).get(campo) == valor for campo, valor in huella.items())
+            }
+            if sin_cambios:
+                logger.info(f"{len(sin_cambios)} archivos sin cambios desde la última ejecución, se omiten")
+            archivos = [archivo for archivo in archivos if archivo[0] not in sin_cambios]
+
+        if not archivos:
+            return dataframes
+
+        inicio = time.perf_counter()
+        total_bytes = 0
+        fallidos = []
+
+        with ThreadPoolExecutor(max_workers=max_concurrencia) as executor:
+            futuros = {
+                executor.submit(
+                    _descargar_y_cargar, s3_client, archivo_key, nombre_archivo,
+                    lectura=(lectura or {}).get(Path(nombre_archivo).stem), size=huella["size"], **kwargs
+                ): (archivo_key, nombre_archivo, huella)
+                for archivo_key, nombre_archivo, huella in archivos
+            }
+
+            for futuro in as_completed(futuros):
+                archivo_key, nombre_archivo, huella = futuros[futuro]
+                try:
+                    df, estadisticas = futuro.result()
+                    total_bytes += estadisticas["bytes"]
+                    logger.info(
+                        f"'{archivo_key}': {estadisticas['bytes']} bytes, "
+                        f"descarga {estadisticas['segundos_descarga']:.2f}s, "
+                        f"parseo {estadisticas['segundos_parseo']:.2f}s "
+                        f"({estadisticas['bytes'] / 1e6 / max(estadisticas['segundos_parseo'], 1e-6):.1f} MB/s, "
+                        f"lector {ETL_LECTOR})"
+                    )
+
+                    if df is not None:
+                        nombre_sin_extension = Path(nombre_archivo).stem
+                        dataframes[nombre_sin_extension] = df
+
+                        if manifiesto is not None:
+                            manifiesto[archivo_key] = {**huella, "tabla": nombre_sin_extension}
+                    else:
+                        fallidos.append(archivo_key)
+
+                except Exception as e:
+                    logger.error(f"Error con {archivo_key}: {e}")
+                    fallidos.append(archivo_key)
+                    continue
+
+        duracion = time.perf_counter() - inicio
+        logger.info(
+            f"Extracción completada: {len(dataframes)}/{len(archivos)} archivos, "
+            f"{total_bytes} bytes en {duracion:.2f}s (concurrencia: {max_concurrencia})"
+        )
+
+        if fallidos and tablas:
+            raise RuntimeError(f"No se pudieron cargar {len(fallidos)} archivos de {tablas}: {fallidos}")
+        
+        return dataframes
+    
+    except Exception as e:
+        logger.error(f"Error general: {e}")
+        if tablas:
+            raise
+        return {}    
+
+def _es_fecha_vectorizado(serie: pd.Series, threshold_fecha: float, tamano_muestra: int = 1000):
+    """
+    Clasifica una columna de texto como fecha en una sola pasada vectorizada.
+    Primero evalúa una muestra para descartar rápido las columnas que claramente
+    no son fechas y solo entonces clasifica la columna completa con una regex.
+
+    Returns:
+        pd.Series | None: Máscara booleana de valores con formato de fecha,
+        o None si la columna no alcanza el threshold.
+    """
+    if len(serie) > tamano_muestra:
+        muestra = serie.sample(tamano_muestra, random_state=0)
+    else:
+        muestra = serie
+
+    # Columnas de objetos que no son texto (ej: listas o dicts de un JSON)
+    if pd.api.types.infer_dtype(muestra, skipna=True) not in ("string", "mixed"):
+        return None
+
+    # Margen sobre el threshold para no descartar columnas por ruido de muestreo
+    proporcion_muestra = muestra.str.match(PATRON_FECHA, na=False).mean()
+    if proporcion_muestra < threshold_fecha / 2:
+        return None
+
+    try:
+        mask = serie.str.match(PATRON_FECHA, na=False)
+    except AttributeError:
+        return None
+    if mask.mean() < threshold_fecha:
+        return None
+    return mask
+
+
+def _parsear_fechas(serie: pd.Series, mask: pd.Series = None) -> pd.Series:
+    """
+    Convierte una columna de fechas a datetime. Solo se parsean los valores con
+    formato de fecha (PATRON_FECHA); el resto queda NaT. Se usa tanto al inferir
+    el esquema como al aplicar el cache, para que el resultado no dependa de él.
+
+    Args:
+        serie (pd.Series): Columna a convertir
+        mask (pd.Series, optional): Máscara de valores con formato de fecha, si ya
+            se calculó (ver _es_fecha_vectorizado)
+
+    Returns:
+        pd.Series: Columna datetime
+    """
+    if mask is None and _es_columna_texto(serie):
+        mask = serie.str.match(PATRON_FECHA, na=False)
+    if mask is not None:
+        serie = serie.where(mask)
+    return pd.to_datetime(serie, format="ISO8601", errors='coerce')
+
+
+def _es_columna_texto(serie: pd.Series) -> bool:
+    """
+    Indica si la columna puede contener texto: object (lector de pandas) o
+    string (lector de pyarrow).
+    """
+    return serie.dtype == "object" or isinstance(serie.dtype, pd.StringDtype)
+
+
+def _huella_columnas(df: pd.DataFrame) -> str:
+    """
+    Huella de los nombres y tipos de las columnas, para invalidar el cache de esquemas.
+    """
+    descripcion = ";".join(f"{col}:{dtype}" for col, dtype in df.dtypes.items())
+    return hashlib.sha256(descripcion.encode("utf-8")).hexdigest()[:16]
+
+
+def _leer_esquema_cache(nombre, huella):
+    """
+    Devuelve las columnas de fecha cacheadas para la tabla, o None si no hay
+    cache o si las columnas de entrada cambiaron.
+    """
+    ruta = os.path.join(ETL_SCHEMA_CACHE_DIR, f"{nombre}.json")
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            esquema = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if esquema.get("huella") != huella:
+        return None
+    return esquema["fechas"]
+
+
+def _guardar_esquema_cache(nombre, huella, columnas_fecha):
+    """
+    Persiste las columnas de fecha inferidas para la tabla (un archivo por tabla).
+    """
+    os.makedirs(ETL_SCHEMA_CACHE_DIR, exist_ok=True)
+    ruta = os.path.join(ETL_SCHEMA_CACHE_DIR, f"{nombre}.json")
+    ruta_tmp = ruta + ".tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump({"huella": huella, "fechas": columnas_fecha}, f)
+    os.replace(ruta_tmp, ruta)
+
+
+def _columnas_fijas(nombre, metadata_dict):
+    """
+    Columnas numéricas cuyo tipo no debe reducirse: las PKs y FKs (deben seguir
+    coincidiendo con las columnas que las referencian) y, en las tablas 'merge',
+    todas, porque su tabla en la base y sus particiones silver se conservan entre
+    ejecuciones y un tipo elegido con el rango de un lote no admitiría valores mayores.
+
+    Returns:
+        set | None: Columnas a conservar, o None si no se reduce ninguna columna numérica
+    """
+    table_metadata = (metadata_dict or {}).get(nombre, {})
+    if table_metadata.get("if_exists") == "merge":
+        return None
+    return set(table_metadata.get("primary_keys") or []) | set(table_metadata.get("foreign_keys") or {})
+
+
+def optimizar_tipos(nombre: str, df: pd.DataFrame, columnas_fijas=(), umbral_categoria: float = None):
+    """
+    Reduce la memoria de un DataFrame ya limpio, modificándolo en el lugar:
+
+    - Texto con pocos valores distintos (proporción <= umbral_categoria): category
+    - Resto del texto: string[pyarrow]
+    - Enteros: Int16 / Int32 nullable si el rango lo permite (salvo columnas_fijas)
+    - float64: float32 solo si todos los valores se conservan exactos (salvo columnas_fijas)
+
+    Los tipos resultantes se mantienen en el staging Arrow (diccionarios, int16,
+    float) y se cargan por COPY como text, smallint/integer y real.
+
+    Args:
+        nombre (str): Nombre de la tabla (para el log).
+        df (pd.DataFrame): DataFrame a optimizar.
+        columnas_fijas (set | None): Columnas numéricas que conservan su tipo; None para todas.
+        umbral_categoria (float, optional): Por defecto ETL_UMBRAL_CATEGORIA.
+
+    Returns:
+        pd.DataFrame: El mismo DataFrame con los tipos reducidos.
+    """
+    umbral_categoria = ETL_UMBRAL_CATEGORIA if umbral_categoria is None else umbral_categoria
+    memoria_antes = df.memory_usage(deep=True).sum()
+
+    for col in df.columns:
+        serie = df[col]
+
+        if _es_columna_texto(serie):
+            # Solo columnas de texto (no listas o dicts de un JSON)
+            if pd.api.types.infer_dtype(serie, skipna=True) != "string":
+                continue
+            if serie.nunique(dropna=False) <= umbral_categoria * len(serie):
+                df[col] = serie.astype("category")
+            else:
+                df[col] = serie.astype("string[pyarrow]")
+
+        elif pd.api.types.is_integer_dtype(serie.dtype):
+            if columnas_fijas is None or col in columnas_fijas or serie.isna().all():
+                continue
+            minimo, maximo = serie.min(), serie.max()
+            for tipo in ("Int16", "Int32"):
+                limites = np.iinfo(tipo.lower())
+                if limites.min <= minimo and maximo <= limites.max:
+                    df[col] = serie.astype(tipo)
+                    break
+
+        elif serie.dtype == "float64":
+            if columnas_fijas is None or col in columnas_fijas:
+                continue
+            # float32 tiene ~7 dígitos significativos: que entre en el rango no alcanza,
+            # se reduce solo si la conversión ida y vuelta no cambia ningún valor
+            with np.errstate(over="ignore"):
+                reducida = serie.astype("float32")
+            if reducida.astype("float64").equals(serie):
+                df[col] = reducida
+
+    memoria_despues = df.memory_usage(deep=True).sum()
+    logger.info(
+        f"Tipos optimizados en '{nombre}': {memoria_antes / 1e6:.1f} MB -> {memoria_despues / 1e6:.1f} MB "
+        f"({memoria_antes / max(memoria_despues, 1):.1f}x)"
+    )
+    return df
+
+
+def limpiar_dataframe(nombre: str, df: pd.DataFrame, threshold_fecha: float = 0.1, usar_cache_esquemas: bool = True,
+                      optimizar_tipos_datos: bool = False, metadata_dict: dict = None):
+    """
+    Aplica las transformaciones de limpieza a un único DataFrame.
+    La tabla se copia a lo sumo una vez (al eliminar duplicados); el resto de
+    las transformaciones se aplican sobre esa copia sin volver a duplicarla.
+
+    Args:
+        nombre (str): Nombre de la tabla (clave del cache de esquemas).
+        df (pd.DataFrame): DataFrame a limpiar. No se modifica.
+        threshold_fecha (float): Proporción mínima para considerar que una columna es fecha.
+        usar_cache_esquemas (bool): Si es True, lee y guarda el cache de esquemas inferidos.
+        optimizar_tipos_datos (bool): Si es True, reduce los tipos al final (ver optimizar_tipos).
+        metadata_dict (dict, optional): Metadatos de las tablas, para no reducir PKs, FKs
+            ni las tablas 'merge' (ver _columnas_fijas).
+
+    Returns:
+        pd.DataFrame: DataFrame transformado.
+    """
+    with medir("transformacion", nombre, filas_entrada=len(df)) as metrica:
+        # 🔹 1. Eliminar duplicados (única copia de la tabla). Se usa take en lugar de
+        # drop_duplicates para obtener un DataFrame propio y poder modificarlo sin copiar de nuevo
+        with medir("transformacion.duplicados", nombre):
+            df = df.take(np.flatnonzero(~df.duplicated().to_numpy()))
+
+        # 🔹 2. Detectar y convertir tipos de datos
+        with medir("transformacion.fechas", nombre) as m:
+            huella = _huella_columnas(df)
+            columnas_fecha = _leer_esquema_cache(nombre, huella) if usar_cache_esquemas else None
+            m["cache"] = columnas_fecha is not None
+
+            if columnas_fecha is not None:
+                # Esquema conocido: se parsea directamente, sin inferencia
+                for col in columnas_fecha:
+                    df[col] = _parsear_fechas(df[col])
+            else:
+                columnas_fecha = []
+                for col in df.columns:
+                    serie = df[col]
+
+                    # Si es fecha
+                    if _es_columna_texto(serie):
+                        mask = _es_fecha_vectorizado(serie, threshold_fecha)
+                        if mask is not None:
+                            df[col] = _parsear_fechas(serie, mask)
+                            columnas_fecha.append(col)
+
+                if usar_cache_esquemas:
+                    _guardar_esquema_cache(nombre, huella, columnas_fecha)
+
+        # 🔹 3. Manejo de nulos (las fechas mantienen NaT)
+        with medir("transformacion.nulos", nombre):
+            valores_nulos = {}
+            for col in df.columns:
+                if df[col].dtype in ["float64", "int64"]:
+                    valores_nulos[col] = 0  # default para numéricos
+                elif not pd.api.types.is_datetime64_any_dtype(df[col]):
+                    valores_nulos[col] = ""  # default para strings
+            df.fillna(valores_nulos, inplace=True)
+
+        # 🔹 4. Tipos compactos (opcional)
+        if optimizar_tipos_datos:
+            with medir("transformacion.tipos", nombre) as m:
+                m["bytes_entrada"] = int(df.memory_usage(deep=True).sum())
+                optimizar_tipos(nombre, df, _columnas_fijas(nombre, metadata_dict))
+                m["bytes_salida"] = int(df.memory_usage(deep=True).sum())
+
+        metrica["filas"] = len(df)
+
+    return df
+
+
+def _a_tabla_arrow(datos) -> pa.Table:
+    """
+    Devuelve los datos como pyarrow.Table (sin copiar si ya lo son).
+    """
+    if isinstance(datos, pa.Table):
+        return datos
+    return pa.Table.from_pandas(datos, preserve_index=False)
+
+
+def _a_ipc(tabla: pa.Table) -> pa.Buffer:
+    """
+    Serializa una tabla Arrow a un buffer IPC en memoria.
+    """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, tabla.schema) as writer:
+        writer.write_table(tabla)
+    return sink.getvalue()
+
+
+def _limpiar_en_proceso(nombre, origen, threshold_fecha, usar_cache_esquemas, optimizar_tipos_datos, metadata_dict):
+    """
+    Ejecuta limpiar_dataframe en un proceso del pool. La entrada llega como
+    entrada de manifiesto de staging (se abre con memory-map) o como buffer
+    Arrow IPC, y el resultado vuelve como buffer Arrow IPC: un único bloque
+    contiguo en lugar de un DataFrame serializado objeto por objeto.
+    Las métricas medidas en el proceso vuelven junto con el resultado.
+    """
+    if isinstance(origen, dict):
+        df = _tabla_a_pandas(leer_tabla_arrow(origen))
+    else:
+        df = _tabla_a_pandas(pa.ipc.open_stream(origen).read_all())
+
+    df = limpiar_dataframe(nombre, df, threshold_fecha, usar_cache_esquemas, optimizar_tipos_datos, metadata_dict)
+    return _a_ipc(pa.Table.from_pandas(df, preserve_index=False)), tomar_registros()
+
+
+def limpiar_diccionario(dfs: dict, threshold_fecha: float = 0.1, usar_cache_esquemas: bool = True,
+                        paralelismo: str = None, max_workers: int = None,
+                        optimizar_tipos_datos: bool = False, metadata_dict: dict = None):
+    """
+    Aplica transformaciones típicas de limpieza a un diccionario de DataFrames.
+
+    La detección de fechas se hace con una regex vectorizada (con descarte previo
+    por muestreo) y cada columna de fecha se parsea una única vez. Las columnas de
+    fecha inferidas se cachean por tabla en ETL_SCHEMA_CACHE_DIR, por lo que las
+    ejecuciones siguientes (o las siguientes partes en modo streaming) no repiten
+    la inferencia mientras no cambien las columnas de entrada.
+
+    Las tablas son independientes, por lo que pueden limpiarse en paralelo:
+    - "procesos": ProcessPoolExecutor; las tablas viajan como buffers Arrow IPC
+      (o se abren directo desde el staging si dfs es un StagingDict).
+    - "hilos": ThreadPoolExecutor, útil cuando dominan operaciones que liberan el GIL.
+
+    Args:
+        dfs (dict[str, pd.DataFrame]): Diccionario con DataFrames de pandas.
+        threshold_fecha (float): Proporción mínima para considerar que una columna es fecha.
+        usar_cache_esquemas (bool): Si es True, lee y guarda el cache de esquemas inferidos.
+        paralelismo (str, optional): None (secuencial), "hilos" o "procesos".
+        max_workers (int, optional): Tamaño del pool. Por defecto ETL_TRANSFORM_WORKERS.
+        optimizar_tipos_datos (bool): Si es True, reduce los tipos de cada tabla (category,
+            string[pyarrow], Int16/Int32, float32) e informa la memoria antes y después.
+        metadata_dict (dict, optional): Metadatos de las tablas (ver _columnas_fijas).
+
+    Returns:
+        dict[str, pd.DataFrame]: Nuevo diccionario con DataFrames transformados.
+    """
+    if paralelismo is None or len(dfs) <= 1:
+        return {
+            nombre: limpiar_dataframe(
+                nombre, df, threshold_fecha, usar_cache_esquemas, optimizar_tipos_datos, metadata_dict
+            )
+            for nombre, df in dfs.items()
+        }
+
+    max_workers = min(max_workers or ETL_TRANSFORM_WORKERS, len(dfs))
+    dfs_limpios = {}
+
+    if paralelismo == "hilos":
+        # La tabla se obtiene dentro del hilo para que las lecturas perezosas también sean paralelas
+        def limpiar_tabla(nombre):
+            return limpiar_dataframe(
+                nombre, dfs[nombre], threshold_fecha, usar_cache_esquemas, optimizar_tipos_datos, metadata_dict
+            )
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {executor.submit(limpiar_tabla, nombre): nombre for nombre in dfs}
+            for futuro in as_completed(futuros):
+                dfs_limpios[futuros[futuro]] = futuro.result()
+
+    elif paralelismo == "procesos":
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {}
+            for nombre in dfs:
+                if isinstance(dfs, StagingDict):
+                    origen = dfs.manifiesto[nombre]
+                else:
+                    origen = _a_ipc(pa.Table.from_pandas(dfs[nombre], preserve_index=False))
+                futuro = executor.submit(
+                    _limpiar_en_proceso, nombre, origen, threshold_fecha, usar_cache_esquemas,
+                    optimizar_tipos_datos, metadata_dict,
+                )
+                futuros[futuro] = nombre
+
+            for futuro in as_completed(futuros):
+                buffer, registros = futuro.result()
+                registrar(registros)
+                dfs_limpios[futuros[futuro]] = _tabla_a_pandas(pa.ipc.open_stream(buffer).read_all())
+
+    else:
+        raise ValueError(f"Paralelismo '{paralelismo}' no soportado. Use None, 'hilos' o 'procesos'.")
+
+    # Mantener el orden original de las tablas
+    return {nombre: dfs_limpios[nombre] for nombre in dfs}
+
+def limpiar_chunks(chunks, threshold_fecha: float = 0.1, metadata_dict: dict = None, dedup_persistente: bool = False):
+    """
+    Aplica limpiar_diccionario parte por parte sobre un iterador de (tabla, DataFrame).
+
+    Los duplicados se eliminan también entre partes: cada fila se resume en un hash
+    de 64 bits que se busca en un conjunto particionado en disco (ConjuntoHashes),
+    por lo que la memoria no crece con el tamaño de la tabla. Con dedup_persistente,
+    las tablas 'merge' y 'append' usan un conjunto que se conserva entre ejecuciones
+    (ETL_DEDUP_DIR): las filas idénticas a otras ya cargadas se omiten. Las tablas
+    'replace' se recargan completas, por lo que su conjunto dura una sola ejecución.
+
+    Los hashes de una parte se confirman recién cuando se pide la siguiente, es
+    decir, después de que el consumidor (ej: cargar_chunks_en_db) la cargó.
+
+    Args:
+        chunks (Iterable[tuple]): Pares (nombre de la tabla, pd.DataFrame), ej: iterar_datos_s3()
+        threshold_fecha (float): Proporción mínima para considerar que una columna es fecha.
+        metadata_dict (dict, optional): Metadatos de las tablas (se usa if_exists).
+        dedup_persistente (bool): Si es True, deduplica también contra ejecuciones anteriores.
+
+    Yields:
+        tuple: (nombre de la tabla, pd.DataFrame limpio)
+    """
+    metadata_dict = metadata_dict or {}
+    directorio_ejecucion = os.path.join(ETL_DEDUP_DIR, "_ejecuciones", uuid.uuid4().hex)
+    conjuntos = {}
+
+    try:
+        for nombre, chunk in chunks:
+            if nombre not in conjuntos:
+                if_exists = metadata_dict.get(nombre, {}).get("if_exists", "replace")
+                persistente = dedup_persistente and if_exists in ("merge", "append")
+                conjuntos[nombre] = ConjuntoHashes(nombre, None if persistente else directorio_ejecucion)
+
+            # Se hashean las filas tal como llegaron del origen, antes de limpiarlas
+            conjunto = conjuntos[nombre]
+            mascara = conjunto.filtrar(hash_filas(chunk))
+            if not mascara.all():
+                chunk = chunk[mascara]
+
+            yield nombre, limpiar_diccionario({nombre: chunk}, threshold_fecha)[nombre]
+            conjunto.confirmar()
+    finally:
+        shutil.rmtree(directorio_ejecucion, ignore_errors=True)
+
+class _S3MultipartWriter(io.RawIOBase):
+    """
+    Archivo de solo escritura que sube a S3 por multipart upload a medida que se
+    escribe. Mantiene en memoria a lo sumo una parte (ETL_S3_PART_SIZE bytes), por
+    lo que el Parquet nunca se materializa completo. Si el archivo entero es menor
+    que una parte, se sube con un único put_object.
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=None, content_type='application/parquet'):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size or ETL_S3_PART_SIZE, 5 * 1024 * 1024)  # mínimo de S3
+        self.content_type = content_type
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.partes = []
+        self.posicion = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.posicion
+
+    def write(self, datos):
+        self.buffer.extend(datos)
+        self.posicion += len(datos)
+        while len(self.buffer) >= self.part_size:
+            self._subir_parte(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(datos)
+
+    def _subir_parte(self, datos):
+        if self.upload_id is None:
+            respuesta = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+            )
+            self.upload_id = respuesta['UploadId']
+        numero = len(self.partes) + 1
+        respuesta = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=numero, Body=datos
+        )
+        self.partes.append({'ETag': respuesta['ETag'], 'PartNumber': numero})
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.s3_client.put_object(
+                    Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), ContentType=self.content_type
+                )
+            else:
+                if self.buffer:
+                    self._subir_parte(bytes(self.buffer))
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                    MultipartUpload={'Parts': self.partes}
+                )
+            self.buffer = bytearray()
+        finally:
+            super().close()
+
+    def abort(self):
+        """
+        Cancela la subida en curso (las partes ya subidas se descartan en S3).
+        """
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        self.buffer = bytearray()
+        super().close()
+
+
+def _escribir_parquet_s3(tabla, s3_client, s3_key, row_group_size, compression, use_dictionary, nombre_tabla=None):
+    """
+    Codifica una tabla Arrow a Parquet row group por row group y la sube en streaming a S3.
+    """
+    destino = _S3MultipartWriter(s3_client, AWS_S3_BUCKET, s3_key)
+    with medir("silver.escritura", nombre_tabla, filas=tabla.num_rows, bytes_entrada=tabla.nbytes) as m:
+        try:
+            with pq.ParquetWriter(destino, tabla.schema, compression=compression, use_dictionary=use_dictionary) as writer:
+                writer.write_table(tabla, row_group_size=row_group_size)
+            destino.close()
+        except Exception:
+            destino.abort()
+            raise
+        m["bytes_salida"] = destino.posicion
+    logger.info(f"Archivo '{s3_key}' guardado exitosamente en S3 ({tabla.num_rows} filas)")
+
+
+def _valores_particion(serie, particion):
+    """
+    Calcula el valor de partición (estilo Hive) de cada fila.
+
+    Args:
+        serie (pd.Series): Columna por la que se particiona
+        particion (dict): {"column": columna, "freq": alias de período opcional (ej: "D", "M")}
+
+    Returns:
+        tuple: (nombre de la clave de partición, pd.Series con el valor de cada fila)
+    """
+    columna = particion["column"]
+    freq = particion.get("freq")
+
+    if freq:
+        clave = f"{columna}_{freq.lower()}"
+        valores = pd.to_datetime(serie, errors='coerce').dt.to_period(freq).astype(str)
+    else:
+        clave = columna
+        valores = serie.astype(str)
+
+    valores = valores.where(~valores.isin(["NaT", "nan", "None", ""]), "__HIVE_DEFAULT_PARTITION__")
+    return clave, valores
+
+
+def _en_carpeta(table_metadata, modo):
+    """
+    Indica si una tabla se escribe como carpeta de archivos (s3_silver/tabla/...) en
+    lugar de un único s3_silver/tabla.parquet: las particionadas y las que acumulan
+    filas ('merge' o 'append', ej: las tablas de eventos que también cargan los
+    micro-lotes), para que el DAG batch y los micro-lotes compartan el mismo layout.
+    """
+    return (
+        bool(table_metadata.get("partition_by"))
+        or modo == "append"
+        or table_metadata.get("if_exists") in ("merge", "append")
+    )
+
+
+def _archivos_parquet_tabla(nombre_archivo, dataframe, particion, token, modo="overwrite", en_carpeta=False):
+    """
+    Arma la lista de archivos a escribir para una tabla (DataFrame o pyarrow.Table):
+    uno solo si no se escribe en carpeta, o uno por partición en s3_silver/tabla/clave=valor/
+    (s3_silver/tabla/ si no está particionada). Los archivos de una escritura "overwrite"
+    se llaman part-{token}.parquet y los de una "append", lote-{token}.parquet (ver
+    _eliminar_archivos_previos).
+
+    Returns:
+        list[tuple]: Lista de (key de S3, pyarrow.Table)
+    """
+    tabla = _a_tabla_arrow(dataframe)
+
+    if not particion and not en_carpeta:
+        s3_key = os.path.join(AWS_S3_SILVER_FOLDER, f"{nombre_archivo}.parquet").replace('\\', '/')
+        return [(s3_key, tabla)]
+
+    if particion:
+        clave, valores = _valores_particion(tabla.column(particion["column"]).to_pandas(), particion)
+
+        # Sin frecuencia, la columna pasa a la ruta y no se repite dentro del archivo
+        if not particion.get("freq"):
+            tabla = tabla.drop_columns([particion["column"]])
+
+    # Las particiones acumulan archivos de distintas ejecuciones: las columnas category
+    # se escriben con su tipo de valores (de un lote a otro puede cambiar el ancho de
+    # sus índices) y large_string como string. Parquet aplica igual su propio
+    # dictionary encoding.
+    campos = []
+    for campo in tabla.schema:
+        if pa.types.is_dictionary(campo.type):
+            campo = campo.with_type(campo.type.value_type)
+        if pa.types.is_large_string(campo.type):
+            campo = campo.with_type(pa.string())
+        campos.append(campo)
+    tabla = tabla.cast(pa.schema(campos, metadata=tabla.schema.metadata))
+    archivo = f"{PREFIJO_APPEND if modo == 'append' else PREFIJO_OVERWRITE}-{token}.parquet"
+
+    if not particion:
+        s3_key = os.path.join(AWS_S3_SILVER_FOLDER, nombre_archivo, archivo).replace('\\', '/')
+        return [(s3_key, tabla)]
+
+    archivos = []
+    for valor, indices in valores.groupby(valores).indices.items():
+        s3_key = os.path.join(
+            AWS_S3_SILVER_FOLDER, nombre_archivo, f"{clave}={valor}", archivo
+        ).replace('\\', '/')
+        archivos.append((s3_key, tabla.take(pa.array(indices))))
+    return archivos
+
+
+def convertir_dataframes_a_parquet_s3(diccionario_dataframes, metadata_dict=None, modo="overwrite",
+                                      row_group_size=None, compression=None, use_dictionary=True,
+                                      max_concurrencia=None, token=None):
+    """
+    Convierte DataFrames de un diccionario a archivos Parquet y los guarda en S3
+
+    Las tablas (y sus particiones) se escriben en paralelo. Cada archivo se codifica
+    row group por row group y se sube por multipart upload, sin armar el archivo
+    completo en memoria. Las tablas con "partition_by" en los metadatos se escriben
+    con particionado estilo Hive (ej: silver/plays/start_time_d=2025-08-01/part-*.parquet)
+    para que los lectores puedan descartar particiones.
+    
+    Args:
+        diccionario_dataframes (dict): Diccionario con nombres de archivo como keys
+                                      y DataFrames de pandas (o pyarrow.Table) como values
+        metadata_dict (dict, optional): Metadatos de las tablas (se usan "partition_by" e "if_exists")
+        modo (str): "overwrite" reemplaza los archivos de la escritura "overwrite" anterior
+                    de la tabla; "append" agrega archivos nuevos a sus particiones (o a
+                    s3_silver/tabla/). Los archivos agregados con "append" (ej: por los
+                    micro-lotes) no se eliminan al sobrescribir.
+        row_group_size (int, optional): Filas por row group. Por defecto ETL_PARQUET_ROW_GROUP_SIZE.
+        compression (str, optional): Codec de compresión. Por defecto ETL_PARQUET_COMPRESSION.
+        use_dictionary (bool): Si es True, usa dictionary encoding
+        max_concurrencia (int, optional): Archivos subidos en simultáneo. Por defecto S3_MAX_CONCURRENCY.
+        token (str, optional): Identificador de los archivos escritos (part-{token} / lote-{token}).
+                    Por defecto la fecha y hora con un sufijo aleatorio. Con un token
+                    determinístico (ej: el de un micro-lote), repetir la escritura
+                    sobrescribe los mismos archivos en lugar de duplicar filas.
+    
+    Returns:
+        bool: True si todos los archivos se procesaron exitosamente, False si hubo errores
+    """
+    metadata_dict = metadata_dict or {}
+    row_group_size = row_group_size or ETL_PARQUET_ROW_GROUP_SIZE
+    compression = compression or ETL_PARQUET_COMPRESSION
+    max_concurrencia = max_concurrencia or S3_MAX_CONCURRENCY
+    
+    try:
+        # Cliente de S3 compartido del proceso
+        s3_client = get_s3_client(max_concurrencia)
+        
+        # Validar que el bucket existe
+        if not AWS_S3_BUCKET:
+            logger.error("El nombre del bucket S3 no está configurado en las variables de entorno")
+            return False
+        
+        logger.info(f"Iniciando proceso de conversión para {len(diccionario_dataframes)} DataFrames")
+        logger.info(f"Bucket destino: {AWS_S3_BUCKET}")
+        logger.info(f"Folder destino: {AWS_S3_SILVER_FOLDER}")
+        
+        contador_exitosos = 0
+        contador_errores = 0
+        token = token or f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        
+        with ThreadPoolExecutor(max_workers=max_concurrencia) as executor:
+            futuros = {}
+
+            # Recorrer el diccionario de DataFrames
+            for nombre_archivo, dataframe in diccionario_dataframes.items():
+                try:
+                    # Validar que el DataFrame no esté vacío
+                    if dataframe is None:
+                        logger.warning(f"DataFrame '{nombre_archivo}' es None, se omite")
+                        contador_errores += 1
+                        continue
+                    
+                    if len(dataframe) == 0:
+                        logger.warning(f"DataFrame '{nombre_archivo}' está vacío, se omite")
+                        contador_errores += 1
+                        continue
+                    
+                    # El nombre base de la tabla, sin extensión .parquet
+                    if nombre_archivo.endswith('.parquet'):
+                        nombre_archivo = nombre_archivo[:-len('.parquet')]
+
+                    table_metadata = metadata_dict.get(nombre_archivo, {})
+                    particion = table_metadata.get("partition_by")
+                    en_carpeta = _en_carpeta(table_metadata, modo)
+                    archivos = _archivos_parquet_tabla(nombre_archivo, dataframe, particion, token, modo, en_carpeta)
+
+                    escrituras = [
+                        executor.submit(
+                            _escribir_parquet_s3, tabla, s3_client, s3_key,
+                            row_group_size, compression, use_dictionary, nombre_archivo
+                        )
+                        for s3_key, tabla in archivos
+                    ]
+                    reemplazar_previos = en_carpeta and modo == "overwrite"
+                    futuros[nombre_archivo] = (escrituras, [s3_key for s3_key, _ in archivos], reemplazar_previos)
+                    
+                except Exception as e:
+                    logger.error(f"Error procesando '{nombre_archivo}': {str(e)}")
+                    contador_errores += 1
+
+            for nombre_archivo, (escrituras, escritos, reemplazar_previos) in futuros.items():
+                try:
+                    for escritura in escrituras:
+                        escritura.result()
+
+                    # Con todas las particiones nuevas escritas, se eliminan las anteriores
+                    if reemplazar_previos:
+                        _eliminar_archivos_previos(s3_client, nombre_archivo, set(escritos))
+
+                    contador_exitosos += 1
+                except Exception as e:
+                    logger.error(f"Error procesando '{nombre_archivo}': {str(e)}")
+                    contador_errores += 1
+        
+        # Resumen del proceso
+        logger.info(f"Proceso completado. Exitosos: {contador_exitosos}, Errores: {contador_errores}")
+        
+        if contador_errores == 0:
+            logger.info("Todos los archivos fueron procesados exitosamente")
+            return True
+        else:
+            logger.warning(f"Proceso completado con {contador_errores} errores")
+            return False
+            
+    except Exception as e:
+        logger.error(f"Error general en la configuración de AWS: {str(e)}")
+        return False
+
+
+def _eliminar_archivos_previos(s3_client, nombre_archivo, conservar):
+    """
+    Elimina los archivos de escrituras "overwrite" anteriores de una tabla escrita en
+    carpeta (part-*.parquet que no pertenecen a la escritura actual). Los lote-*.parquet
+    agregados en modo "append" se conservan, al igual que cualquier otro objeto.
+    """
+    prefijo = os.path.join(AWS_S3_SILVER_FOLDER, nombre_archivo, "").replace('\\', '/')
+    paginator = s3_client.get_paginator('list_objects_v2')
+
+    # Archivo único del layout anterior a escribir la tabla en carpeta
+    s3_client.delete_object(
+        Bucket=AWS_S3_BUCKET,
+        Key=os.path.join(AWS_S3_SILVER_FOLDER, f"{nombre_archivo}.parquet").replace('\\', '/'),
+    )
+
+    for pagina in paginator.paginate(Bucket=AWS_S3_BUCKET, Prefix=prefijo):
+        obsoletos = [
+            {'Key': obj['Key']} for obj in pagina.get('Contents', [])
+            if obj['Key'] not in conservar and os.path.basename(obj['Key']).startswith(f"{PREFIJO_OVERWRITE}-")
+        ]
+        if obsoletos:
+            s3_client.delete_objects(Bucket=AWS_S3_BUCKET, Delete={'Objects': obsoletos})
+            logger.info(f"Se eliminaron {len(obsoletos)} archivos previos de '{prefijo}'")
+
+
+def cargar_silver_y_db(dataframes, metadata_dict, engine, modo="overwrite", token=None):
+    """
+    Etapa de carga unificada: cada tabla se serializa a Arrow una sola vez y, desde
+    esos mismos buffers, se escriben en paralelo el Parquet de la capa silver y el
+    COPY a PostgreSQL.
+
+    Args:
+        dataframes (dict): Tablas a cargar (DataFrames o pyarrow.Table, ej: un StagingDict)
+        metadata_dict (dict): Metadatos de las tablas (PK, FK, if_exists, partition_by)
+        engine (sqlalchemy.engine.Engine): Engine de la base de datos
+        modo (str): Modo de escritura silver, "overwrite" o "append" (ver convertir_dataframes_a_parquet_s3)
+        token (str, optional): Identificador de los archivos silver (ver convertir_dataframes_a_parquet_s3)
+
+    Returns:
+        bool: Resultado de la escritura silver (ver convertir_dataframes_a_parquet_s3).
+        Los errores de la carga en la base de datos se propagan.
+    """
+    tablas = {nombre: _a_tabla_arrow(df) for nombre, df in dataframes.items() if df is not None}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        silver = executor.submit(convertir_dataframes_a_parquet_s3, tablas, metadata_dict, modo, token=token)
+        db = executor.submit(create_tables_with_constraints, tablas, metadata_dict, engine)
+        db.result()
+        return silver.result()
+
+
+def create_tables_with_constraints(dataframes_dict, metadata_dict, engine, max_workers=None, al_cargar=None):
+    """
+    Crea tablas en una base de datos PostgreSQL a partir de DataFrames de pandas
+    y establece las constraints (PK y FK) definidas en los metadatos.
+    Elimina automáticamente el prefijo 'df_' de los nombres de las tablas.
+
+    Las cargas se ejecutan en paralelo sobre el pool de conexiones del engine.
+    Cada tabla agrega su PK apenas termina de cargarse y sus FKs apenas están
+    listas las tablas a las que referencia (orden topológico de los metadatos),
+    por lo que el tiempo total tiende al de la cadena de dependencias más larga.
+    Las FKs se agregan como NOT VALID, se indexan y se validan en paralelo
+    (ver _agregar_foreign_key).
+
+    Las tablas con if_exists 'merge' que ya existen no se recrean: sus filas se
+    insertan o actualizan por primary key (ver _merge_dataframe) y conservan sus
+    constraints. Si una de sus FKs apunta a una tabla reemplazada en esta carga,
+    la FK se vuelve a agregar cuando esa tabla termina de cargarse.
+
+    Parameters:
+    -----------
+    dataframes_dict : dict
+        Diccionario donde las claves son nombres de tablas (con prefijo df_) y los valores son DataFrames
+    metadata_dict : dict
+        Diccionario con metadatos para cada tabla (PK, FK, if_exists)
+    engine : sqlalchemy.engine.Engine
+        Objeto engine de SQLAlchemy para la conexión a la base de datos
+    max_workers : int, optional
+        Cantidad de tablas cargadas en simultáneo. Por defecto ETL_DB_WORKERS.
+    al_cargar : callable, optional
+        Se llama con el nombre de cada tabla apenas terminan de cargarse sus filas,
+        antes de sus constraints (ej: para registrar un checkpoint de la carga).
+    """
+    max_workers = max_workers or ETL_DB_WORKERS
+
+    niveles = ordenar_por_dependencias(metadata_dict, dataframes_dict.keys())
+    orden = [original_name for nivel in niveles for original_name in nivel]
+
+    def modo(original_name):
+        return metadata_dict.get(original_name, {}).get("if_exists", "replace")
+
+    existentes = set(inspect(engine).get_table_names())
+    reemplazadas = {
+        original_name for original_name in orden
+        if modo(original_name) == "replace" and original_name.replace("df_", "") in existentes
+    }
+    # Tablas que se crean de cero en esta carga y necesitan todas sus constraints
+    recreadas = {
+        original_name for original_name in orden
+        if modo(original_name) == "replace" or original_name.replace("df_", "") not in existentes
+    }
+
+    # FKs a crear: las de tablas recreadas y las de tablas que se conservan pero
+    # referencian una tabla reemplazada (el DROP ... CASCADE elimina esas FKs)
+    fks = []
+    for original_name, table_metadata in metadata_dict.items():
+        conserva_tabla = original_name not in recreadas and original_name.replace("df_", "") in existentes
+        for fk_column, fk_info in (table_metadata.get("foreign_keys") or {}).items():
+            if original_name in recreadas or (conserva_tabla and fk_info["table"] in reemplazadas):
+                requisitos = {nombre for nombre in (original_name, fk_info["table"]) if nombre in orden}
+                fks.append((original_name, fk_column, fk_info, requisitos))
+
+    # Antes de eliminar nada: un merge que no se puede hacer no debe dejar la base a medias
+    for original_name in orden:
+        if modo(original_name) == "merge" and original_name.replace("df_", "") in existentes:
+            _validar_dialecto_merge(original_name.replace("df_", ""), engine)
+
+    _eliminar_tablas_a_reemplazar(list(reversed(orden)), metadata_dict, engine)
+
+    def cargar_tabla(original_name):
+        table_name = original_name.replace("df_", "")
+        table_metadata = metadata_dict.get(original_name, {})
+        if_exists = modo(original_name)
+
+        if if_exists == "merge":
+            _merge_dataframe(dataframes_dict[original_name], table_name, table_metadata.get("primary_keys"), engine)
+        else:
+            _cargar_dataframe(dataframes_dict[original_name], table_name, if_exists, engine)
+        logger.info(f"Tabla '{table_name}' cargada exitosamente (original: {original_name}, modo: {if_exists})")
+        if al_cargar is not None:
+            al_cargar(original_name)
+
+        if original_name in recreadas:
+            with engine.connect() as conn:
+                _agregar_primary_key(conn, table_name, table_metadata)
+
+    def agregar_fk(original_name, fk_column, fk_info):
+        with engine.connect() as conn:
+            _agregar_foreign_key(conn, original_name.replace("df_", ""), fk_column, fk_info)
+
+    cargadas = set()
+    fallidas = set()
+    errores = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Las cargas se encolan en orden topológico para que las tablas padre empiecen primero
+        pendientes = {executor.submit(cargar_tabla, nombre): ("carga", nombre) for nombre in orden}
+
+        while pendientes or fks:
+            if pendientes:
+                completados, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            else:
+                completados = []
+
+            for futuro in completados:
+                etapa, original_name = pendientes.pop(futuro)
+                try:
+                    futuro.result()
+                except Exception as e:
+                    logger.error(f"Error en {etapa} de '{original_name}': {str(e)}")
+                    errores.append(e)
+                    if etapa == "carga":
+                        fallidas.add(original_name)
+                    continue
+                if etapa == "carga":
+                    cargadas.add(original_name)
+
+            # FKs cuyas tablas ya terminaron de cargarse. Cada FK es una tarea
+            # propia, por lo que sus validaciones corren en paralelo
+            for fk in list(fks):
+                original_name, fk_column, fk_info, requisitos = fk
+                if requisitos & fallidas:
+                    logger.error(
+                        f"Se omite la FK '{original_name}.{fk_column}': falló la carga de una tabla requerida"
+                    )
+                    fks.remove(fk)
+                elif requisitos <= cargadas:
+                    futuro = executor.submit(agregar_fk, original_name, fk_column, fk_info)
+                    pendientes[futuro] = (f"FK {fk_column}", original_name)
+                    fks.remove(fk)
+
+    if errores:
+        raise errores[0]
+
+    logger.info("Proceso completado")
+
+
+def _dependencias(original_name, metadata_dict, tablas):
+    """
+    Devuelve las tablas (dentro de 'tablas') referenciadas por las FKs de una tabla.
+    """
+    foreign_keys = metadata_dict.get(original_name, {}).get("foreign_keys") or {}
+    return {
+        fk_info["table"] for fk_info in foreign_keys.values()
+        if fk_info["table"] in tablas and fk_info["table"] != original_name
+    }
+
+
+def ordenar_por_dependencias(metadata_dict, tablas=None):
+    """
+    Ordena topológicamente las tablas según las foreign keys de los metadatos.
+
+    Parameters:
+    -----------
+    metadata_dict : dict
+        Diccionario con metadatos para cada tabla (PK, FK, if_exists)
+    tablas : Iterable, optional
+        Tablas a ordenar. Si es None, todas las de los metadatos. Las referencias a
+        tablas fuera de este conjunto se ignoran (se asume que ya existen en la base).
+
+    Returns:
+    --------
+    list[list[str]]
+        Niveles de tablas: cada nivel solo depende de niveles anteriores, por lo que
+        las tablas de un mismo nivel pueden cargarse en paralelo.
+
+    Raises:
+    -------
+    ValueError
+        Si las foreign keys forman un ciclo
+    """
+    tablas = list(metadata_dict.keys()) if tablas is None else list(tablas)
+    pendientes = {
+        original_name: _dependencias(original_name, metadata_dict, tablas)
+        for original_name in tablas
+    }
+
+    niveles = []
+    while pendientes:
+        nivel = [original_name for original_name, deps in pendientes.items() if not deps]
+        if not nivel:
+            raise ValueError(f"Dependencias circulares entre las tablas: {sorted(pendientes)}")
+
+        niveles.append(nivel)
+        for original_name in nivel:
+            del pendientes[original_name]
+        for deps in pendientes.values():
+            deps.difference_update(nivel)
+
+    return niveles
+
+
+def _eliminar_tablas_a_reemplazar(tablas, metadata_dict, engine):
+    """
+    Elimina las tablas cuyo if_exists es 'replace'. En PostgreSQL se eliminan en el
+    orden dado con CASCADE, para que las FKs de tablas que se conservan (ej: en modo
+    'merge') no impidan el DROP; create_tables_with_constraints vuelve a agregar esas
+    FKs. Los demás dialectos no tienen CASCADE: las tablas se eliminan en orden
+    topológico inverso (primero las que referencian a otras).
+    """
+    cascade = " CASCADE" if engine.dialect.name == "postgresql" else ""
+    if not cascade:
+        niveles = ordenar_por_dependencias(metadata_dict, tablas)
+        tablas = [original_name for nivel in reversed(niveles) for original_name in nivel]
+
+    with engine.connect() as conn:
+        for original_name in tablas:
+            if metadata_dict.get(original_name, {}).get("if_exists", "replace") != "replace":
+                continue
+            with conn.begin():
+                conn.execute(text(f'DROP TABLE IF EXISTS {original_name.replace("df_", "")}{cascade};'))
+
+
+def _validar_dialecto_merge(table_name, engine):
+    """
+    El merge usa tablas UNLOGGED, DISTINCT ON e INSERT ... ON CONFLICT, que solo
+    existen en PostgreSQL.
+
+    Raises:
+        ValueError: Si el engine no es de PostgreSQL
+    """
+    if engine.dialect.name != "postgresql":
+        raise ValueError(
+            f"if_exists='merge' en la tabla '{table_name}' solo está soportado en PostgreSQL "
+            f"(dialecto: {engine.dialect.name}); usar 'replace' o 'append'"
+        )
+
+
+def psql_insert_copy(table, conn, keys, data_iter):
+    """
+    Método de inserción para DataFrame.to_sql que carga cada lote con COPY ... FROM STDIN
+    (psycopg2 copy_expert) en lugar de INSERTs parametrizados. El lote se escribe como CSV
+    en un buffer temporal que pasa a disco si supera ETL_SPOOL_MAX_BYTES.
+
+    Los nulos se envían como \\N para distinguirlos de los strings vacíos.
+    """
+    dbapi_conn = conn.connection
+    with dbapi_conn.cursor() as cur:
+        with tempfile.SpooledTemporaryFile(max_size=ETL_SPOOL_MAX_BYTES, mode="w+", newline="") as buffer:
+            writer = csv.writer(buffer)
+            writer.writerows(
+                tuple(NULO_COPY if valor is None else valor for valor in fila) for fila in data_iter
+            )
+            buffer.seek(0)
+
+            columnas = ", ".join(f'"{k}"' for k in keys)
+            table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+            sql = f"COPY {table_name} ({columnas}) FROM STDIN WITH (FORMAT csv, NULL '{NULO_COPY}')"
+            cur.copy_expert(sql=sql, file=buffer)
+
+
+def _copiar_tabla_arrow(tabla, table_name, if_exists, engine, batch_size):
+    """
+    Carga una pyarrow.Table con COPY: la estructura de la tabla se crea con to_sql
+    sobre un DataFrame vacío del mismo esquema y los datos se serializan a CSV lote
+    por lote con el writer de Arrow, directamente desde los buffers de la tabla.
+    Arrow escribe los strings entre comillas y los nulos vacíos, por lo que NULL
+    y string vacío se distinguen sin marcador especial.
+    """
+    tabla.schema.empty_table().to_pandas().to_sql(
+        name=table_name,
+        con=engine,
+        if_exists=if_exists,
+        index=False,
+    )
+
+    columnas = ", ".join(f'"{col}"' for col in tabla.column_names)
+    sql = f'COPY "{table_name}" ({columnas}) FROM STDIN WITH (FORMAT csv)'
+    opciones = pa_csv.WriteOptions(include_header=False)
+
+    dbapi_conn = engine.raw_connection()
+    try:
+        with dbapi_conn.cursor() as cur:
+            for lote in tabla.to_batches(max_chunksize=batch_size):
+                with tempfile.SpooledTemporaryFile(max_size=ETL_SPOOL_MAX_BYTES) as buffer:
+                    pa_csv.write_csv(lote, buffer, opciones)
+                    buffer.seek(0)
+                    cur.copy_expert(sql=sql, file=buffer)
+        dbapi_conn.commit()
+    except Exception:
+        dbapi_conn.rollback()
+        raise
+    finally:
+        dbapi_conn.close()
+
+
+def _cargar_dataframe(df, table_name, if_exists, engine, batch_size=None):
+    """
+    Carga un DataFrame en una tabla usando COPY en PostgreSQL y to_sql(method="multi")
+    en otros dialectos. Registra el throughput en filas por segundo.
+
+    Args:
+        df (pd.DataFrame | pyarrow.Table): Datos a cargar
+        table_name (str): Nombre de la tabla destino
+        if_exists (str): 'replace', 'append' o 'fail'
+        engine (sqlalchemy.engine.Engine): Engine de la base de datos
+        batch_size (int, optional): Filas por lote. Por defecto ETL_DB_BATCH_SIZE.
+    """
+    batch_size = batch_size or ETL_DB_BATCH_SIZE
+    method = psql_insert_copy if engine.dialect.name == "postgresql" else "multi"
+
+    if isinstance(df, pa.Table):
+        # Las tablas Arrow planas se copian directo desde sus buffers, sin pasar por pandas
+        if method is psql_insert_copy and not any(pa.types.is_nested(campo.type) for campo in df.schema):
+            method = "COPY (Arrow)"
+        else:
+            df = df.to_pandas()
+
+    inicio = time.perf_counter()
+    with medir("db.carga", table_name, filas=len(df)):
+        if method == "COPY (Arrow)":
+            _copiar_tabla_arrow(df, table_name, if_exists, engine, batch_size)
+        else:
+            df.to_sql(
+                name=table_name,
+                con=engine,
+                if_exists=if_exists,
+                index=False,
+                method=method,
+                chunksize=batch_size,
+            )
+    duracion = time.perf_counter() - inicio
+
+    filas_por_segundo = len(df) / duracion if duracion > 0 else float("inf")
+    logger.info(
+        f"Tabla '{table_name}': {len(df)} filas en {duracion:.2f}s "
+        f"({filas_por_segundo:,.0f} filas/s, método: {'COPY' if method is psql_insert_copy else method})"
+    )
+
+
+def _merge_dataframe(df, table_name, primary_keys, engine, batch_size=None):
+    """
+    Inserta o actualiza las filas de un DataFrame en una tabla existente sin recrearla.
+
+    Las filas se copian (COPY) a una tabla staging UNLOGGED con la misma estructura y
+    luego se aplican con INSERT ... ON CONFLICT (primary_keys) DO UPDATE. Solo se
+    reescriben las filas que efectivamente cambiaron, y la tabla conserva sus
+    constraints e índices. Si la tabla no existe, se crea con una carga normal
+    (en cualquier dialecto); el merge sobre una tabla existente requiere PostgreSQL.
+
+    Args:
+        df (pd.DataFrame | pyarrow.Table): Filas nuevas o modificadas
+        table_name (str): Nombre de la tabla destino
+        primary_keys (list): Columnas de la primary key (obligatorias para el merge)
+        engine (sqlalchemy.engine.Engine): Engine de la base de datos
+        batch_size (int, optional): Filas por lote del COPY. Por defecto ETL_DB_BATCH_SIZE.
+
+    Raises:
+        ValueError: Si la tabla no tiene primary keys definidas o si ya existe y el
+            dialecto no es PostgreSQL
+    """
+    if not primary_keys:
+        raise ValueError(f"La tabla '{table_name}' necesita primary_keys para usar if_exists='merge'")
+
+    if not inspect(engine).has_table(table_name):
+        _cargar_dataframe(df, table_name, "fail", engine, batch_size)
+        return
+    _validar_dialecto_merge(table_name, engine)
+
+    # Nombre único: el DAG batch y el modo micro-lotes pueden hacer merge sobre la misma tabla a la vez
+    staging_name = f"{table_name}__staging_{uuid.uuid4().hex[:8]}"
+    columnas = df.column_names if isinstance(df, pa.Table) else list(df.columns)
+    lista_columnas = ", ".join(columnas)
+    lista_pks = ", ".join(primary_keys)
+    columnas_actualizables = [col for col in columnas if col not in primary_keys]
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {staging_name};"))
+        conn.execute(text(f"CREATE UNLOGGED TABLE {staging_name} (LIKE {table_name} INCLUDING DEFAULTS);"))
+
+    try:
+        _cargar_dataframe(df, staging_name, "append", engine, batch_size)
+
+        if columnas_actualizables:
+            set_clause = ", ".join(f"{col} = EXCLUDED.{col}" for col in columnas_actualizables)
+            actuales = ", ".join(f"{table_name}.{col}" for col in columnas_actualizables)
+            nuevas = ", ".join(f"EXCLUDED.{col}" for col in columnas_actualizables)
+            on_conflict = (
+                f"DO UPDATE SET {set_clause} "
+                f"WHERE ROW({actuales}) IS DISTINCT FROM ROW({nuevas})"
+            )
+        else:
+            on_conflict = "DO NOTHING"
+
+        # DISTINCT ON evita que el mismo lote intente actualizar dos veces una fila
+        upsert = f"""
+        INSERT INTO {table_name} ({lista_columnas})
+        SELECT DISTINCT ON ({lista_pks}) {lista_columnas} FROM {staging_name}
+        ON CONFLICT ({lista_pks}) {on_conflict};
+        """
+        inicio = time.perf_counter()
+        with medir("db.merge", table_name) as m, engine.begin() as conn:
+            resultado = conn.execute(text(upsert))
+            m["filas"] = resultado.rowcount
+        logger.info(
+            f"Merge en '{table_name}': {resultado.rowcount} filas insertadas o actualizadas "
+            f"de {len(df)} en {time.perf_counter() - inicio:.2f}s"
+        )
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {staging_name};"))
+
+
+def _inspeccionar(conn, consulta):
+    """
+    Ejecuta una consulta del Inspector sobre la conexión recibida, sin tomar otra
+    del pool, y cierra la transacción que el Inspector abre implícitamente para
+    que los pasos siguientes puedan usar conn.begin().
+
+    Args:
+        conn (sqlalchemy.engine.Connection): Conexión en uso
+        consulta (callable): Recibe el Inspector y devuelve el resultado
+    """
+    try:
+        return consulta(inspect(conn))
+    finally:
+        if conn.in_transaction():
+            conn.rollback()
+
+
+def _agregar_primary_key(conn, table_name, metadata):
+    """
+    Agrega la primary key definida en los metadatos, salvo que la tabla ya tenga
+    una (ej: al reanudar una carga). Los errores se registran y no se propagan.
+    """
+    if "primary_keys" in metadata and metadata["primary_keys"]:
+        if _inspeccionar(conn, lambda inspector: inspector.get_pk_constraint(table_name)).get("constrained_columns"):
+            logger.info(f"La tabla '{table_name}' ya tiene primary key, se omite")
+            return
+        pk_columns = ", ".join(metadata["primary_keys"])
+        alter_pk = f"ALTER TABLE {table_name} ADD PRIMARY KEY ({pk_columns});"
+        try:
+            inicio = time.perf_counter()
+            with medir("db.primary_key", table_name), conn.begin():  # maneja commit/rollback automáticamente
+                conn.execute(text(alter_pk))
+            logger.info(f"Primary key agregada a la tabla '{table_name}' ({time.perf_counter() - inicio:.2f}s)")
+        except Exception as e:
+            logger.error(f"Error al agregar PK a '{table_name}': {str(e)}")
+
+
+def _agregar_foreign_key(conn, table_name, fk_column, fk_info):
+    """
+    Agrega una foreign key en tres pasos, cada uno en su propia transacción:
+
+    1. ADD CONSTRAINT ... NOT VALID: solo registra la constraint, sin recorrer la tabla.
+    2. CREATE INDEX sobre la columna FK (lo usan las consultas de análisis y los joins).
+    3. VALIDATE CONSTRAINT: recorre la tabla con un lock que no bloquea lecturas ni
+       escrituras, por lo que puede correr en paralelo con las validaciones de otras tablas.
+
+    Si la constraint ya existe (ej: al reanudar una carga) se omite el paso 1; el
+    índice y la validación son idempotentes. Los errores se registran y no se propagan.
+    """
+    referenced_table = fk_info["table"].replace("df_", "")
+    constraint_name = f"fk_{table_name}_{fk_column}"
+    existentes = _inspeccionar(conn, lambda inspector: inspector.get_foreign_keys(table_name))
+    existe = constraint_name in {fk["name"] for fk in existentes}
+    alter_fk = f"""
+    ALTER TABLE {table_name} 
+    ADD CONSTRAINT {constraint_name}
+    FOREIGN KEY ({fk_column}) 
+    REFERENCES {referenced_table} ({fk_info['column']})
+    NOT VALID;
+    """
+    pasos = [
+        *([] if existe else [("agregar", alter_fk)]),
+        ("indexar", f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{fk_column} ON {table_name} ({fk_column});"),
+        ("validar", f"ALTER TABLE {table_name} VALIDATE CONSTRAINT {constraint_name};"),
+    ]
+
+    tiempos = []
+    try:
+        for paso, sql in pasos:
+            inicio = time.perf_counter()
+            with medir(f"db.foreign_key.{paso}", table_name, columna=fk_column), conn.begin():
+                conn.execute(text(sql))
+            tiempos.append(f"{paso} {time.perf_counter() - inicio:.2f}s")
+        logger.info(
+            f"Foreign key agregada a la tabla '{table_name}' (columna: {fk_column}; {', '.join(tiempos)})"
+        )
+    except Exception as e:
+        logger.error(
+            f"Error al agregar FK a '{table_name}.{fk_column}' (paso {paso}): {str(e)}"
+        )
+
+
+def _agregar_foreign_keys(conn, table_name, metadata):
+    """
+    Agrega todas las foreign keys definidas en los metadatos de una tabla.
+    """
+    if "foreign_keys" in metadata and metadata["foreign_keys"]:
+        for fk_column, fk_info in metadata["foreign_keys"].items():
+            _agregar_foreign_key(conn, table_name, fk_column, fk_info)
+
+
+def agregar_constraints(tablas, metadata_dict, engine):
+    """
+    Agrega las primary keys y foreign keys definidas en los metadatos
+    a tablas ya cargadas en la base de datos, en orden topológico.
+
+    También vuelve a agregar las FKs de las tablas existentes que referencian a
+    una tabla 'replace' de la lista: el DROP ... CASCADE de esa tabla las eliminó
+    (ej: al reanudar una carga que falló antes de sus constraints).
+
+    Parameters:
+    -----------
+    tablas : list
+        Nombres de las tablas (con o sin prefijo df_) a las que se agregan constraints
+    metadata_dict : dict
+        Diccionario con metadatos para cada tabla (PK, FK, if_exists)
+    engine : sqlalchemy.engine.Engine
+        Objeto engine de SQLAlchemy para la conexión a la base de datos
+    """
+    niveles = ordenar_por_dependencias(metadata_dict, tablas)
+    orden = [original_name for nivel in niveles for original_name in nivel]
+
+    reemplazadas = {
+        original_name for original_name in orden
+        if metadata_dict.get(original_name, {}).get("if_exists", "replace") == "replace"
+    }
+
+    with engine.connect() as conn:
+        for original_name in orden:
+            _agregar_primary_key(conn, original_name.replace("df_", ""), metadata_dict.get(original_name, {}))
+        for original_name in orden:
+            _agregar_foreign_keys(conn, original_name.replace("df_", ""), metadata_dict.get(original_name, {}))
+
+        existentes = set(_inspeccionar(conn, lambda inspector: inspector.get_table_names()))
+        for original_name, table_metadata in metadata_dict.items():
+            table_name = original_name.replace("df_", "")
+            if original_name in orden or table_name not in existentes:
+                continue
+            for fk_column, fk_info in (table_metadata.get("foreign_keys") or {}).items():
+                if fk_info["table"] in reemplazadas:
+                    _agregar_foreign_key(conn, table_name, fk_column, fk_info)
+
+
+def cargar_chunks_en_db(chunks, metadata_dict, engine):
+    """
+    Carga en la base de datos un iterador de (tabla, DataFrame) parte por parte,
+    sin materializar las tablas completas, y luego agrega las constraints.
+    La primera parte de cada tabla respeta el if_exists de los metadatos (las
+    tablas 'replace' se eliminan con _eliminar_tablas_a_reemplazar, que no falla
+    si otras tablas las referencian por FK); las siguientes se agregan con append
+    (o con merge, en las tablas 'merge').
+
+    Parameters:
+    -----------
+    chunks : Iterable[tuple]
+        Pares (nombre de la tabla, pd.DataFrame), ej: limpiar_chunks(iterar_datos_s3())
+    metadata_dict : dict
+        Diccionario con metadatos para cada tabla (PK, FK, if_exists)
+    engine : sqlalchemy.engine.Engine
+        Objeto engine de SQLAlchemy para la conexión a la base de datos
+    """
+    filas_por_tabla = {}
+    mergeadas = set()
+
+    for original_name, df in chunks:
+        table_name = original_name.replace("df_", "")
+
+        table_metadata = metadata_dict.get(original_name, {})
+        if_exists = table_metadata.get("if_exists", "replace")
+
+        primera_parte = original_name not in filas_por_tabla
+        if primera_parte:
+            filas_por_tabla[original_name] = 0
+            if if_exists == "merge" and inspect(engine).has_table(table_name):
+                # La tabla se conserva con sus constraints
+                mergeadas.add(original_name)
+            elif if_exists == "replace":
+                # to_sql(if_exists="replace") hace un DROP simple, que falla si ya hay FKs hacia la tabla
+                _eliminar_tablas_a_reemplazar([original_name], metadata_dict, engine)
+                if_exists = "append"
+        elif if_exists != "merge":
+            if_exists = "append"
+
+        if if_exists == "merge":
+            _merge_dataframe(df, table_name, table_metadata.get("primary_keys"), engine)
+            if primera_parte and original_name not in mergeadas:
+                # La primera parte creó la tabla: las siguientes necesitan la PK para el ON CONFLICT
+                with engine.connect() as conn:
+                    _agregar_primary_key(conn, table_name, table_metadata)
+        else:
+            _cargar_dataframe(df, table_name, if_exists, engine)
+        filas_por_tabla[original_name] += len(df)
+
+    for original_name, filas in filas_por_tabla.items():
+        logger.info(f"Tabla '{original_name}' cargada por partes ({filas} filas)")
+
+    # También en las tablas mergeadas: el DROP ... CASCADE de una tabla padre elimina
+    # sus FKs, y agregar_constraints omite las constraints que ya existen
+    agregar_constraints(list(filas_por_tabla), metadata_dict, engine)
+
+
+def get_db_engine():
+    """
+    Devuelve el engine de SQLAlchemy para PostgreSQL configurado con variables de entorno.
+
+    El engine se crea una vez por proceso y se comparte entre tareas e hilos de
+    carga. Su pool (ETL_DB_POOL_SIZE + ETL_DB_MAX_OVERFLOW conexiones) acota las
+    conexiones que un worker abre contra PostgreSQL; pool_pre_ping descarta las
+    conexiones caídas y los keepalives TCP evitan que un firewall corte las ociosas.
+
+    Returns:
+        sqlalchemy.engine.Engine: Engine configurado para la conexión a la base de datos
+    """
+    with _recursos_lock:
+        recursos = _recursos_del_proceso()
+        if "engine" not in recursos:
+            recursos["engine"] = _crear_db_engine()
+        return recursos["engine"]
+
+
+def _crear_db_engine():
+
+    # Configuración de la conexión
+    db_config = {
+        "host": DB_HOST,
+        "port": int(DB_PORT),
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "database": DB_NAME,
+    }
+
+    # Crear cadena de conexión para PostgreSQL
+    connection_string = f"postgresql+psycopg2://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
+
+    # Crear y devolver el engine
+    engine = create_engine(
+        connection_string,
+        pool_size=ETL_DB_POOL_SIZE,
+        max_overflow=ETL_DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=ETL_DB_POOL_RECYCLE,
+        connect_args={
+            "keepalives": 1,
+            "keepalives_idle": 30,
+            "keepalives_interval": 10,
+            "keepalives_count": 5,
+        },
+    )
     return engine
 
 
@@ -0,0 +1,167 @@
+import os
+import re
+import shutil
+import hashlib
+import logging
+from collections.abc import Mapping
+
+import pyarrow as pa
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Directorio local o compartido (volumen) donde se escriben las tablas intermedias
+ETL_STAGING_DIR = os.getenv(
+    "ETL_STAGING_DIR",
+    os.path.join(os.getenv("AIRFLOW_HOME", "/tmp"), "staging"),
+)
+
+
+def _normalizar_run_id(run_id):
+    """
+    Convierte el run_id de Airflow en un nombre de carpeta seguro.
+    """
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(run_id))
+
+
+def huella_esquema(schema):
+    """
+    Calcula una huella corta y estable del esquema Arrow (nombres y tipos de columnas).
+
+    Args:
+        schema (pyarrow.Schema): Esquema de la tabla
+
+    Returns:
+        str: Hash hexadecimal de 16 caracteres
+    """
+    descripcion = ";".join(f"{campo.name}:{campo.type}" for campo in schema)
+    return hashlib.sha256(descripcion.encode("utf-8")).hexdigest()[:16]
+
+
+def guardar_staging(dataframes, run_id, etapa):
+    """
+    Escribe cada DataFrame una sola vez como archivo Arrow IPC sin compresión
+    (apto para memory-map) y devuelve un manifiesto liviano para pasar por XCom.
+
+    Args:
+        dataframes (dict[str, pd.DataFrame]): Tablas a persistir
+        run_id (str): Identificador de la ejecución del DAG
+        etapa (str): Nombre de la etapa (ej: 'raw', 'clean')
+
+    Returns:
+        dict: Manifiesto {tabla: {"uri", "filas", "schema"}}
+    """
+    directorio = os.path.join(ETL_STAGING_DIR, _normalizar_run_id(run_id), etapa)
+    os.makedirs(directorio, exist_ok=True)
+
+    manifiesto = {}
+
+    for nombre, df in dataframes.items():
+        if df is None:
+            continue
+
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        ruta = os.path.join(directorio, f"{nombre}.arrow")
+
+        # Escritura a archivo temporal + rename para no dejar archivos a medias
+        ruta_tmp = ruta + ".tmp"
+        with pa.OSFile(ruta_tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, tabla.schema) as writer:
+                writer.write_table(tabla)
+        os.replace(ruta_tmp, ruta)
+
+        manifiesto[nombre] = {
+            "uri": ruta,
+            "filas": tabla.num_rows,
+            "schema": huella_esquema(tabla.schema),
+        }
+        logger.info(f"Tabla '{nombre}' escrita en staging: {ruta} ({tabla.num_rows} filas)")
+
+    return manifiesto
+
+
+def leer_tabla_arrow(entrada):
+    """
+    Abre una tabla del staging mediante memory-map (lectura zero-copy). El archivo
+    se cierra al terminar la lectura; el mapeo sigue vigente mientras la tabla
+    devuelta (o una columna de ella) esté en uso.
+
+    Args:
+        entrada (dict): Entrada del manifiesto con 'uri', 'filas' y 'schema'
+
+    Returns:
+        pyarrow.Table: Tabla respaldada por el archivo mapeado en memoria
+
+    Raises:
+        ValueError: Si el esquema o la cantidad de filas no coinciden con el manifiesto
+    """
+    with pa.memory_map(entrada["uri"], "r") as fuente:
+        tabla = pa.ipc.open_file(fuente).read_all()
+
+    if huella_esquema(tabla.schema) != entrada["schema"]:
+        raise ValueError(f"El esquema de '{entrada['uri']}' no coincide con el manifiesto")
+    if tabla.num_rows != entrada["filas"]:
+        raise ValueError(f"La cantidad de filas de '{entrada['uri']}' no coincide con el manifiesto")
+
+    return tabla
+
+
+def eliminar_staging(run_id):
+    """
+    Elimina el directorio de staging de una ejecución: las tablas intermedias de
+    todas las etapas y sus checkpoints. Solo debe llamarse cuando la ejecución
+    terminó bien; las fallidas lo conservan para reanudarse desde los checkpoints.
+
+    Args:
+        run_id (str): Identificador de la ejecución del DAG
+
+    Returns:
+        bool: True si había un directorio y se eliminó
+    """
+    directorio = os.path.join(ETL_STAGING_DIR, _normalizar_run_id(run_id))
+    if not os.path.isdir(directorio):
+        return False
+
+    shutil.rmtree(directorio)
+    logger.info(f"Staging de la ejecución '{run_id}' eliminado: {directorio}")
+    return True
+
+
+class StagingDict(Mapping):
+    """
+    Vista de solo lectura sobre un manifiesto de staging. Cada tabla se abre
+    recién cuando se accede a ella, por lo que iterar con .items() mantiene
+    en memoria una sola tabla a la vez.
+
+    Con como_arrow=True devuelve directamente la pyarrow.Table mapeada en memoria,
+    sin convertirla a pandas.
+    """
+
+    def __init__(self, manifiesto, como_arrow=False):
+        self.manifiesto = manifiesto or {}
+        self.como_arrow = como_arrow
+
+    def __getitem__(self, nombre):
+        tabla = leer_tabla_arrow(self.manifiesto[nombre])
+        return tabla if self.como_arrow else tabla.to_pandas()
+
+    def __iter__(self):
+        return iter(self.manifiesto)
+
+    def __len__(self):
+        return len(self.manifiesto)
+
+
+def cargar_staging(manifiesto, como_arrow=False):
+    """
+    Devuelve un diccionario perezoso de DataFrames a partir de un manifiesto de staging.
+
+    Args:
+        manifiesto (dict): Manifiesto generado por guardar_staging
+        como_arrow (bool): Si es True, los valores son pyarrow.Table en lugar de DataFrames
+
+    Returns:
+        StagingDict: Mapping {tabla: pd.DataFrame} que abre cada tabla al accederla
+    """
+    return StagingDict(manifiesto, como_arrow)
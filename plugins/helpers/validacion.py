@@ -0,0 +1,220 @@
+import os
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import inspect
+
+from .metricas import medir
+from .my_utilities import ordenar_por_dependencias
+from .staging import ETL_STAGING_DIR, _normalizar_run_id
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Qué hacer con las filas inválidas: "cuarentena" (se apartan), "reporte" (solo se
+# informan y se cargan igual) o "error" (se interrumpe la carga)
+ETL_VALIDACION_MODO = os.getenv("ETL_VALIDACION_MODO", "cuarentena")
+ETL_CUARENTENA_DIR = os.getenv("ETL_CUARENTENA_DIR", os.path.join(ETL_STAGING_DIR, "cuarentena"))
+
+MODOS_VALIDACION = ("cuarentena", "reporte", "error")
+
+
+def _columna(datos, columna):
+    """
+    Devuelve una columna como pd.Series, tanto de un DataFrame como de una pyarrow.Table.
+    """
+    if isinstance(datos, pa.Table):
+        return datos.column(columna).to_pandas()
+    return datos[columna].reset_index(drop=True)
+
+
+def _filtrar(datos, mascara):
+    if isinstance(datos, pa.Table):
+        return datos.filter(pa.array(mascara))
+    return datos[mascara]
+
+
+def _claves_en_db(engine, table_name, columna):
+    """
+    Lee los valores distintos de una columna de una tabla existente en la base.
+    """
+    if engine is None or not inspect(engine).has_table(table_name):
+        return None
+    inicio = time.perf_counter()
+    claves = pd.read_sql(f"SELECT DISTINCT {columna} FROM {table_name}", engine)[columna]
+    logger.info(
+        f"Claves de '{table_name}.{columna}' leídas de la base: {len(claves)} "
+        f"en {time.perf_counter() - inicio:.2f}s"
+    )
+    return claves
+
+
+def _guardar_cuarentena(datos, motivos, mascara_invalidas, original_name, run_id):
+    """
+    Escribe las filas apartadas, con una columna '_motivo', en
+    {ETL_CUARENTENA_DIR}/{run_id}/{tabla}.parquet.
+    """
+    rechazadas = _filtrar(datos, mascara_invalidas)
+    if not isinstance(rechazadas, pa.Table):
+        rechazadas = pa.Table.from_pandas(rechazadas, preserve_index=False)
+    rechazadas = rechazadas.append_column("_motivo", pa.array(motivos[mascara_invalidas], type=pa.string()))
+
+    directorio = os.path.join(ETL_CUARENTENA_DIR, _normalizar_run_id(run_id))
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"{original_name}.parquet")
+    pq.write_table(rechazadas, ruta)
+    return ruta
+
+
+def validar_integridad(dataframes, metadata_dict, engine=None, modo=None, run_id=None, claves_db=None,
+                       padres=None):
+    """
+    Valida en memoria, antes de escribir en la base, la integridad que luego exigirán
+    las constraints: primary keys únicas y no nulas, y que cada valor de FK exista en
+    la tabla referenciada. Las tablas se recorren en orden topológico, de modo que las
+    filas apartadas de una tabla padre también invalidan a sus hijas.
+
+    Las claves válidas de cada tabla referenciada son:
+    - las del lote, si la tabla viene en el lote con if_exists 'replace' (se reemplaza);
+    - las del lote más las de la base, si viene en modo 'merge' (las filas previas se conservan);
+    - las de padres, con el mismo criterio, si viene ahí en lugar de en el lote;
+    - las de la base, si no viene en el lote (requiere engine; sin engine no se valida esa FK).
+
+    Cada chequeo es un isin (hash set), lineal en la cantidad de filas. Los valores
+    nulos de una FK son válidos, igual que en PostgreSQL.
+
+    Args:
+        dataframes (dict): Tablas a validar (DataFrames o pyarrow.Table)
+        metadata_dict (dict): Metadatos de las tablas (PK, FK, if_exists)
+        engine (sqlalchemy.engine.Engine, optional): Para leer las claves ya cargadas
+        modo (str, optional): "cuarentena", "reporte" o "error". Por defecto ETL_VALIDACION_MODO.
+        run_id (str, optional): Carpeta de la cuarentena. Por defecto la fecha y hora actual.
+        claves_db (dict, optional): Cache {(tabla, columna): claves} de las claves leídas de
+            la base, para reutilizarlas entre llamadas (ej: micro-lotes). Quien lo pasa
+            decide cuándo vaciarlo.
+        padres (Mapping, optional): Tablas padre ya validadas en otra llamada (ej: la
+            transformación de cada tabla en el DAG), que solo aportan sus claves y no
+            se vuelven a validar ni se devuelven
+
+    Returns:
+        tuple: (dict con las tablas a cargar, dict con el reporte por tabla)
+
+    Raises:
+        ValueError: Si el modo es "error" y hay filas inválidas, o si el modo no existe
+    """
+    modo = modo or ETL_VALIDACION_MODO
+    if modo not in MODOS_VALIDACION:
+        raise ValueError(f"Modo de validación '{modo}' no soportado. Use {', '.join(MODOS_VALIDACION)}.")
+    run_id = run_id or time.strftime("%Y%m%dT%H%M%S")
+
+    niveles = ordenar_por_dependencias(metadata_dict, dataframes.keys())
+    orden = [original_name for nivel in niveles for original_name in nivel]
+
+    validas = {}
+    reporte = {}
+    claves_cache = {}
+
+    def claves_en_db(table_name, columna):
+        if claves_db is None:
+            return _claves_en_db(engine, table_name, columna)
+        if (table_name, columna) not in claves_db:
+            claves_db[(table_name, columna)] = _claves_en_db(engine, table_name, columna)
+        return claves_db[(table_name, columna)]
+
+    def claves_validas(tabla_padre, columna):
+        clave = (tabla_padre, columna)
+        if clave in claves_cache:
+            return claves_cache[clave]
+
+        table_name = tabla_padre.replace("df_", "")
+        origen = validas.get(tabla_padre)
+        if origen is None and padres is not None and tabla_padre in padres:
+            origen = padres[tabla_padre]
+        if origen is not None:
+            claves = _columna(origen, columna)
+            if metadata_dict.get(tabla_padre, {}).get("if_exists", "replace") == "merge":
+                en_db = claves_en_db(table_name, columna)
+                if en_db is not None:
+                    claves = pd.concat([claves, en_db], ignore_index=True)
+        else:
+            claves = claves_en_db(table_name, columna)
+
+        claves_cache[clave] = None if claves is None else pd.unique(claves.dropna())
+        return claves_cache[clave]
+
+    for original_name in orden:
+        datos = dataframes[original_name]
+        if datos is None:
+            continue
+        table_metadata = metadata_dict.get(original_name, {})
+
+        with medir("validacion", original_name, filas=len(datos)):
+            motivos = np.full(len(datos), None, dtype=object)
+            resultado = {"filas": len(datos)}
+
+            # Primary key: no nula y única (se conserva la primera aparición)
+            primary_keys = table_metadata.get("primary_keys") or []
+            if primary_keys:
+                claves_pk = pd.DataFrame({col: _columna(datos, col) for col in primary_keys})
+                nulas = claves_pk.isna().any(axis=1).to_numpy()
+                duplicadas = claves_pk.duplicated().to_numpy() & ~nulas
+                motivos[nulas] = "pk_nula"
+                motivos[duplicadas & pd.isna(motivos)] = "pk_duplicada"
+                resultado["pk_nulas"] = int(nulas.sum())
+                resultado["pk_duplicadas"] = int(duplicadas.sum())
+
+            # Foreign keys: cada valor debe existir en la tabla referenciada
+            huerfanas = {}
+            for fk_column, fk_info in (table_metadata.get("foreign_keys") or {}).items():
+                tabla_padre = fk_info["table"]
+                if tabla_padre == original_name:
+                    # Autorreferencia: se valida contra las claves del propio lote
+                    claves = pd.unique(_columna(datos, fk_info["column"]).dropna())
+                else:
+                    claves = claves_validas(tabla_padre, fk_info["column"])
+
+                if claves is None:
+                    logger.warning(
+                        f"No se valida la FK '{original_name}.{fk_column}': "
+                        f"'{tabla_padre}' no está en el lote ni en la base"
+                    )
+                    continue
+
+                valores = _columna(datos, fk_column)
+                invalidas = ~(valores.isin(claves) | valores.isna()).to_numpy()
+                motivos[invalidas & pd.isna(motivos)] = f"fk_{fk_column}"
+                huerfanas[fk_column] = int(invalidas.sum())
+            resultado["fk_huerfanas"] = huerfanas
+
+            mascara_invalidas = ~pd.isna(motivos)
+            total_invalidas = int(mascara_invalidas.sum())
+            resultado["invalidas"] = total_invalidas
+
+            if total_invalidas:
+                logger.warning(
+                    f"Tabla '{original_name}': {total_invalidas} filas inválidas de {len(datos)} "
+                    f"(pk nulas: {resultado.get('pk_nulas', 0)}, pk duplicadas: {resultado.get('pk_duplicadas', 0)}, "
+                    f"fk huérfanas: {huerfanas})"
+                )
+                if modo == "cuarentena":
+                    resultado["cuarentena"] = _guardar_cuarentena(
+                        datos, motivos, mascara_invalidas, original_name, run_id
+                    )
+                    datos = _filtrar(datos, ~mascara_invalidas)
+                    logger.info(f"Filas inválidas de '{original_name}' en cuarentena: {resultado['cuarentena']}")
+
+        validas[original_name] = datos
+        reporte[original_name] = resultado
+
+    if modo == "error":
+        con_errores = {nombre: r["invalidas"] for nombre, r in reporte.items() if r["invalidas"]}
+        if con_errores:
+            raise ValueError(f"Filas que violan PK/FK antes de la carga: {con_errores}")
+
+    # Mantener el orden original de las tablas
+    return {nombre: validas[nombre] for nombre in dataframes if nombre in validas}, reporte
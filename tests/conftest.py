@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Los helpers se importan como en Airflow (plugins/ en el path)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins"))
+
+# Los directorios de trabajo (staging, dedup, cuarentena, métricas) se leen del entorno
+# al importar los helpers: se apuntan a un directorio temporal para no tocar el real
+os.environ.setdefault("ETL_STAGING_DIR", tempfile.mkdtemp(prefix="etl_tests_"))
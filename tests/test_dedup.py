@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from helpers import dedup
+from helpers.dedup import ConjuntoHashes, hash_filas
+
+
+def _hashes(valores):
+    return np.asarray(valores, dtype=np.uint64)
+
+
+def test_filtrar_descarta_repetidas_del_lote_y_pendientes(tmp_path):
+    conjunto = ConjuntoHashes("plays", directorio=tmp_path, particiones=4)
+
+    assert conjunto.filtrar(_hashes([1, 2, 2, 3])).tolist() == [True, True, False, True]
+    # Pendientes sin confirmar también cuentan como vistas dentro de la misma ejecución
+    assert conjunto.filtrar(_hashes([3, 4])).tolist() == [False, True]
+
+
+def test_confirmar_persiste_entre_instancias(tmp_path):
+    conjunto = ConjuntoHashes("plays", directorio=tmp_path, particiones=4)
+    conjunto.filtrar(_hashes([10, 11, 12, 13, 14]))
+    conjunto.confirmar()
+
+    nuevo = ConjuntoHashes("plays", directorio=tmp_path, particiones=4)
+    assert nuevo.filtrar(_hashes([10, 14, 15])).tolist() == [False, False, True]
+
+
+def test_descartar_vuelve_a_aceptar_las_filas(tmp_path):
+    conjunto = ConjuntoHashes("plays", directorio=tmp_path, particiones=4)
+    conjunto.filtrar(_hashes([1, 2]))
+    conjunto.confirmar()
+
+    conjunto.filtrar(_hashes([3, 4]))
+    conjunto.descartar()
+
+    assert conjunto.filtrar(_hashes([1, 3, 4])).tolist() == [False, True, True]
+
+
+def test_retirar_quita_solo_los_hashes_indicados(tmp_path):
+    conjunto = ConjuntoHashes("plays", directorio=tmp_path, particiones=4)
+    conjunto.filtrar(_hashes([1, 2, 3, 4, 5]))
+    conjunto.retirar(_hashes([2, 4]))
+    conjunto.confirmar()
+
+    nuevo = ConjuntoHashes("plays", directorio=tmp_path, particiones=4)
+    assert nuevo.filtrar(_hashes([1, 2, 3, 4, 5])).tolist() == [False, True, False, True, False]
+
+
+def test_segmentos_se_compactan_sin_perder_hashes(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "ETL_DEDUP_SEGMENTOS", 2)
+    conjunto = ConjuntoHashes("plays", directorio=tmp_path, particiones=2)
+
+    vistos = []
+    for lote in range(5):
+        valores = _hashes(range(lote * 10, lote * 10 + 10))
+        assert conjunto.filtrar(valores).all()
+        conjunto.confirmar()
+        vistos.extend(valores.tolist())
+
+        segmentos = conjunto._segmentos()
+        assert all(len(secuencias) <= 2 for secuencias in segmentos.values())
+
+    nuevo = ConjuntoHashes("plays", directorio=tmp_path, particiones=2)
+    assert not nuevo.filtrar(_hashes(vistos)).any()
+    assert nuevo.filtrar(_hashes([1000, 1001])).all()
+
+
+def test_hash_filas_por_columnas_clave():
+    df = pd.DataFrame({"id": [1, 1, 2], "valor": ["a", "b", "a"]})
+
+    assert hash_filas(df)[0] != hash_filas(df)[1]
+    assert hash_filas(df, ["id"])[0] == hash_filas(df, ["id"])[1]
@@ -0,0 +1,119 @@
+import time
+
+import pandas as pd
+import pytest
+
+from helpers import micro_lotes, validacion
+from helpers.dedup import ConjuntoHashes
+
+METADATA = {
+    "users": {"primary_keys": ["user_id"], "if_exists": "replace"},
+    "ratings": {
+        "primary_keys": ["rating_id"],
+        "foreign_keys": {"user_id": {"table": "users", "column": "user_id"}},
+        "if_exists": "append",
+    },
+}
+
+
+class CargaSimulada:
+    """
+    Reemplaza a cargar_silver_y_db: registra cada llamada y falla las primeras 'fallas'.
+    """
+
+    def __init__(self, fallas=0):
+        self.fallas = fallas
+        self.llamadas = []
+
+    def __call__(self, dataframes, metadata_dict, engine, modo="overwrite", token=None):
+        self.llamadas.append({tabla: df.copy() for tabla, df in dataframes.items()} | {"_token": token})
+        if len(self.llamadas) <= self.fallas:
+            return False
+        return True
+
+
+@pytest.fixture
+def conjuntos(tmp_path):
+    return {"ratings": ConjuntoHashes("ratings", directorio=tmp_path / "dedup", particiones=4)}
+
+
+@pytest.fixture(autouse=True)
+def cuarentena(tmp_path, monkeypatch):
+    monkeypatch.setattr(validacion, "ETL_CUARENTENA_DIR", str(tmp_path / "cuarentena"))
+
+
+def _archivo(id, df):
+    return {"tabla": "ratings", "id": id, "df": df, "creado": time.time()}
+
+
+def _procesar(lote, conjuntos, claves_db):
+    return micro_lotes._procesar_lote(lote, METADATA, None, conjuntos, claves_db, "test.000001")
+
+
+def _confirmar(conjuntos):
+    for conjunto in conjuntos.values():
+        conjunto.confirmar()
+
+
+def _descartar(conjuntos):
+    for conjunto in conjuntos.values():
+        conjunto.descartar()
+
+
+def test_reintento_tras_falla_a_mitad_del_lote(conjuntos, monkeypatch):
+    carga = CargaSimulada(fallas=1)
+    monkeypatch.setattr(micro_lotes, "cargar_silver_y_db", carga)
+    claves_db = {("users", "user_id"): pd.Series([1, 2])}
+    lote = [
+        _archivo("a.csv", pd.DataFrame({"rating_id": [1, 2], "user_id": [1, 2]})),
+        _archivo("b.csv", pd.DataFrame({"rating_id": [3], "user_id": [1]})),
+    ]
+
+    # Primer intento: el dedup aceptó las filas pero la escritura falla
+    with pytest.raises(RuntimeError):
+        _procesar(lote, conjuntos, claves_db)
+    _descartar(conjuntos)
+
+    # El reintento vuelve a cargar todas las filas con el mismo nombre en silver
+    assert _procesar(lote, conjuntos, claves_db) == {"ratings": 3}
+    _confirmar(conjuntos)
+    assert carga.llamadas[0]["_token"] == carga.llamadas[1]["_token"]
+    assert sorted(carga.llamadas[1]["ratings"]["rating_id"]) == [1, 2, 3]
+
+    # Una vez confirmado, el mismo lote ya no aporta filas
+    assert _procesar(lote, conjuntos, claves_db) == {}
+    assert len(carga.llamadas) == 2
+
+
+def test_filas_en_cuarentena_no_se_confirman_como_vistas(conjuntos, monkeypatch):
+    carga = CargaSimulada()
+    monkeypatch.setattr(micro_lotes, "cargar_silver_y_db", carga)
+    claves_db = {("users", "user_id"): pd.Series([1, 2])}
+    lote = [_archivo("a.csv", pd.DataFrame({"rating_id": [1, 2, 3], "user_id": [1, 2, 3]}))]
+
+    assert _procesar(lote, conjuntos, claves_db) == {"ratings": 2}
+    _confirmar(conjuntos)
+
+    # Llega el usuario 3: la fila huérfana reenviada se carga
+    claves_db[("users", "user_id")] = pd.Series([1, 2, 3])
+    assert _procesar(lote, conjuntos, claves_db) == {"ratings": 1}
+    assert carga.llamadas[-1]["ratings"]["rating_id"].tolist() == [3]
+
+
+def test_archivos_ilegibles_se_omiten_del_lote(conjuntos, monkeypatch):
+    carga = CargaSimulada()
+    monkeypatch.setattr(micro_lotes, "cargar_silver_y_db", carga)
+    lote = [
+        _archivo("a.csv", pd.DataFrame({"rating_id": [1], "user_id": [1]})),
+        _archivo("roto.csv", None),
+    ]
+
+    assert _procesar(lote, conjuntos, {("users", "user_id"): pd.Series([1])}) == {"ratings": 1}
+
+
+def test_token_lote_no_depende_del_orden():
+    a = _archivo("a.csv", None)
+    b = _archivo("b.csv", None)
+
+    assert micro_lotes._token_lote([a, b]) == micro_lotes._token_lote([b, a])
+    assert micro_lotes._token_lote([a]) != micro_lotes._token_lote([a, b])
@@ -0,0 +1,104 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from helpers import validacion
+from helpers.validacion import validar_integridad
+
+METADATA = {
+    "users": {"primary_keys": ["user_id"], "if_exists": "replace"},
+    "ratings": {
+        "primary_keys": ["rating_id"],
+        "foreign_keys": {"user_id": {"table": "users", "column": "user_id"}},
+        "if_exists": "append",
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def cuarentena(tmp_path, monkeypatch):
+    monkeypatch.setattr(validacion, "ETL_CUARENTENA_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _lote():
+    return {
+        "users": pd.DataFrame({"user_id": [1, 2, 2, None], "name": ["a", "b", "b2", "c"]}),
+        "ratings": pd.DataFrame({"rating_id": [10, 11, 12, 12], "user_id": [1, 3, None, 2]}),
+    }
+
+
+def test_cuarentena_aparta_pk_duplicadas_y_fk_huerfanas(cuarentena):
+    validas, reporte = validar_integridad(_lote(), METADATA, modo="cuarentena", run_id="r1")
+
+    assert validas["users"]["user_id"].tolist() == [1, 2]
+    assert reporte["users"]["pk_duplicadas"] == 1
+    assert reporte["users"]["pk_nulas"] == 1
+
+    # 11 es huérfana (user 3), la segunda 12 repite la PK; la FK nula es válida
+    assert validas["ratings"]["rating_id"].tolist() == [10, 12]
+    assert reporte["ratings"]["fk_huerfanas"] == {"user_id": 1}
+    assert reporte["ratings"]["pk_duplicadas"] == 1
+
+    apartadas = pq.read_table(cuarentena / "r1" / "ratings.parquet").to_pandas()
+    assert sorted(apartadas["_motivo"]) == ["fk_user_id", "pk_duplicada"]
+
+
+def test_filas_apartadas_del_padre_invalidan_a_las_hijas():
+    metadata = {
+        **METADATA,
+        "profiles": {
+            "primary_keys": ["profile_id"],
+            "foreign_keys": {"user_id": {"table": "users", "column": "user_id"}},
+        },
+        "views": {
+            "primary_keys": ["view_id"],
+            "foreign_keys": {"profile_id": {"table": "profiles", "column": "profile_id"}},
+        },
+    }
+    lote = {
+        "views": pd.DataFrame({"view_id": [100, 101], "profile_id": [20, 21]}),
+        "profiles": pd.DataFrame({"profile_id": [20, 21], "user_id": [1, 9]}),
+        "users": pd.DataFrame({"user_id": [1], "name": ["a"]}),
+    }
+
+    validas, reporte = validar_integridad(lote, metadata, modo="cuarentena", run_id="r1")
+
+    # El perfil 21 es huérfano y su vista cae con él, aunque el perfil venía en el lote
+    assert validas["profiles"]["profile_id"].tolist() == [20]
+    assert validas["views"]["view_id"].tolist() == [100]
+    assert reporte["views"]["fk_huerfanas"] == {"profile_id": 1}
+    assert list(validas) == ["views", "profiles", "users"]
+
+
+def test_claves_del_padre_desde_padres():
+    hijas = {"ratings": pa.table({"rating_id": [10, 11], "user_id": [1, 3]})}
+    padres = {"users": pa.table({"user_id": [1, 2]})}
+
+    validas, reporte = validar_integridad(hijas, METADATA, modo="cuarentena", run_id="r1", padres=padres)
+
+    assert list(validas) == ["ratings"]
+    assert validas["ratings"].column("rating_id").to_pylist() == [10]
+
+
+def test_sin_padre_ni_engine_no_valida_la_fk():
+    hijas = {"ratings": pd.DataFrame({"rating_id": [10, 11], "user_id": [1, 3]})}
+
+    validas, reporte = validar_integridad(hijas, METADATA, modo="cuarentena", run_id="r1")
+
+    assert len(validas["ratings"]) == 2
+    assert reporte["ratings"]["fk_huerfanas"] == {}
+
+
+def test_modo_reporte_conserva_las_filas(cuarentena):
+    validas, reporte = validar_integridad(_lote(), METADATA, modo="reporte", run_id="r1")
+
+    assert len(validas["ratings"]) == 4
+    assert reporte["ratings"]["invalidas"] == 2
+    assert not (cuarentena / "r1").exists()
+
+
+def test_modo_error_interrumpe_la_carga():
+    with pytest.raises(ValueError, match="ratings"):
+        validar_integridad(_lote(), METADATA, modo="error", run_id="r1")